@@ -166,6 +166,100 @@ class Config:
     wait_time_without_AT = t.get("wait_time_without_AT")
     return wait_time_with_AT, wait_time_without_AT
 
+  def get_matching_cache_size(self):
+    default = 32
+    t = self.config.get("query")
+    if not t: return default
+    return t.get("matching_cache_size", default)
+
+  # Query result cache settings (missing options fall back to defaults)
+  def get_query_cache(self):
+    default = {'enabled': False, 'size': 10000, 'ttl': 600, 'redis': True, 'redis_db': 1}
+    t = self.config.get("query")
+    if not t: return default
+    return dict(default, **(t.get("cache") or dict()))
+
+  # Exact match fast path settings (missing options fall back to defaults)
+  def get_exact_match(self):
+    default = {'enabled': True, 'casefold': False}
+    t = self.config.get("query")
+    if not t: return default
+    return dict(default, **(t.get("exact_match") or dict()))
+
+  # Pool of long-lived external tokenizer processes (missing options fall back to defaults)
+  def get_coprocess_pool(self):
+    default = {'enabled': True, 'size': 2, 'timeout': 10, 'max_failures': 3, 'probe_timeout': 5}
+    t = self.config.get("tokenizer")
+    if not t: return default
+    return dict(default, **(t.get("coprocess") or dict()))
+
+  # Pipelined TMX import settings (missing options fall back to defaults)
+  def get_import_pipeline(self):
+    default = {'enabled': True, 'workers': 4, 'batch_size': 2000, 'queue_size': 4}
+    i = self.config.get("import")
+    if not i: return default
+    return dict(default, **(i.get("pipeline") or dict()))
+
+  # Checkpoints of import jobs (missing options fall back to defaults)
+  def get_import_checkpoint(self):
+    default = {'interval': 30}
+    i = self.config.get("import")
+    if not i: return default
+    return dict(default, **(i.get("checkpoint") or dict()))
+
+  # Script-free writes of new docs during imports (missing options fall back to defaults)
+  def get_script_free_ingest(self):
+    default = {'enabled': False, 'id_cache_size': 200000}
+    i = self.config.get("import")
+    if not i: return default
+    return dict(default, **(i.get("script_free") or dict()))
+
+  # Coalescing writer of POST /tm/batch (missing options fall back to defaults)
+  def get_tm_batch(self):
+    default = {'linger_ms': 20, 'max_batch': 2000, 'max_items': 10000}
+    i = self.config.get("import")
+    if not i: return default
+    return dict(default, **(i.get("batch") or dict()))
+
+  def get_index_registry_ttl(self):
+    default = 60
+    o = self.config.get("opensearch")
+    if not o: return default
+    ttl = o.get("index_registry_ttl")
+    if ttl is None: return default
+    return ttl
+
+  # Map index layout: 'normalized' (map docs hold ids only) or 'denormalized'
+  # (map docs also hold POS and token counts and are searchable by text)
+  def get_map_layout(self):
+    default = 'normalized'
+    o = self.config.get("opensearch")
+    if not o: return default
+    return o.get("map_layout", default)
+
+  # Store precomputed matching features in monolingual docs (see TMMatchingFeatures)
+  def get_matching_features(self):
+    default = True
+    o = self.config.get("opensearch")
+    if not o: return default
+    return o.get("matching_features", default)
+
+  # Bulk request settings (missing options fall back to defaults)
+  def get_bulk(self):
+    default = {'chunk_size': 500, 'max_chunk_bytes': 10485760, 'thread_count': 2,
+               'max_retries': 5, 'initial_backoff': 2, 'max_backoff': 60, 'retry_on_conflict': 3}
+    o = self.config.get("opensearch")
+    if not o: return default
+    return dict(default, **(o.get("bulk") or dict()))
+
+  # Bulk-load profile of index settings for large jobs (missing options fall back to defaults)
+  def get_bulk_load(self):
+    default = {'enabled': False, 'refresh_interval': -1, 'number_of_replicas': 0, 'translog_durability': 'async',
+               'force_merge': True, 'max_num_segments': None}
+    o = self.config.get("opensearch")
+    if not o: return default
+    return dict(default, **(o.get("bulk_load") or dict()))
+
   def config_logging(self):
     # try:
     #   from logging.handlers import RotatingFileHandler
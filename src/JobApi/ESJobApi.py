@@ -34,9 +34,7 @@ class ESJobApi(JobApi):
 
   def __init__(self, **kwargs):
     self.es = OpenSearchHelper()
-    if not self.es.indices_exists(index=self.INDEX):
-      self.es.indices_create(index=self.INDEX, body=self._index_template())
-    self.es.indices_put_template(name='job_template', body=self._index_template(is_template=True))
+    # Jobs index and template are created once by TMSchema
 
   def init_job(self, job_id=None, username=None, type='default', **kwargs):
     doc = {
@@ -0,0 +1,78 @@
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import datetime
+import logging
+import threading
+from timeit import default_timer as timer
+
+from TMDbApi.TMUtils import TMUtils
+from Config.Config import G_CONFIG
+
+
+# Progress of an import job saved in 'checkpoint' field of the job doc: position
+# (TMX file within zip and tu ordinal) of the last segment of the last batch written
+# to all indices, number of written segments and batches. commit() is called after
+# each written batch, the checkpoint is saved at most once per 'interval' seconds.
+# A resumed job (see JobsResource.put) continues parsing from the saved position,
+# thus re-writes at most the segments of one tu of the last batch (upserts are idempotent)
+class ImportCheckpoint:
+  CONFIG = G_CONFIG.get_import_checkpoint()
+  FIELD = 'checkpoint'
+
+  def __init__(self, job_api, job_id, interval=None):
+    self.job_api = job_api
+    self.job_id = job_id
+    self.interval = interval if interval is not None else self.CONFIG['interval']
+    self._lock = threading.Lock()
+    self._ts = timer()
+    self.checkpoint = self.job_api.get_field(job_id, self.FIELD) or {'file': None, 'tu': None, 'segments': 0, 'batches': 0}
+
+  # Position to resume parsing from: (file, tu) or None to start from the beginning
+  def position(self):
+    if self.checkpoint['file'] is None: return None
+    return (self.checkpoint['file'], self.checkpoint['tu'])
+
+  # Called after the batch (list of segments) was written to all indices, in order of batches
+  def commit(self, segments):
+    with self._lock:
+      self.checkpoint['batches'] += 1
+      self.checkpoint['segments'] += len(segments)
+      position = getattr(segments[-1], 'tmx_position', None) if segments else None
+      if position:
+        self.checkpoint['file'], self.checkpoint['tu'] = position
+      if timer() - self._ts >= self.interval:
+        self._save()
+
+  def save(self):
+    with self._lock:
+      self._save()
+
+  def _save(self):
+    self.checkpoint['update_time'] = TMUtils.date2str(datetime.datetime.now())
+    try:
+      self.job_api.set_field(self.job_id, self.FIELD, dict(self.checkpoint))
+    except Exception as e:
+      # Not critical: resume would start from an earlier checkpoint
+      logging.warning("Failed to save checkpoint of job {}: {}".format(self.job_id, e))
+    self._ts = timer()
@@ -0,0 +1,87 @@
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import sys, os
+sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', '..'))
+
+from JobApi.tasks.Task import Task
+
+
+# Migrate map index to denormalized layout: copy POS and token counts
+# of source & target monolingual docs into map docs
+class DenormalizeTask:
+  MGET_BATCH_SIZE = 100
+
+  def __init__(self, task):
+    self.langs = task.get_langs()
+
+  def __call__(self, index, segments_iter):
+    # Import should be inside the function to avoid serializing all dependencies
+    # for parallel execution
+    sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', '..'))
+    sys.path = [p for p in sys.path if p]
+    from TMDbApi.TMMonoLing import TMMonoLing
+
+    ml_index = TMMonoLing()
+    batch = []
+    for segment in segments_iter:
+      batch.append(segment)
+      if len(batch) >= self.MGET_BATCH_SIZE:
+        yield from self._denormalize(ml_index, batch)
+        batch = []
+    yield from self._denormalize(ml_index, batch)
+
+  def _denormalize(self, ml_index, segments):
+    ids_lang = []
+    for s in segments:
+      ids_lang += [(s.source_language, str(s.source_id)), (s.target_language, str(s.target_id))]
+    docs = ml_index.mget(ids_lang) or []
+    for i, s in enumerate(segments):
+      for ftype, doc in zip(['source', 'target'], docs[2*i:2*i+2]):
+        if not doc: continue
+        setattr(s, ftype + '_pos', doc.get('pos'))
+        token_cnt = doc.get('token_cnt')
+        # Old monolingual docs might miss token count
+        if token_cnt is None:
+          token_cnt = ml_index.token_count(getattr(s, ftype + '_text'), getattr(s, ftype + '_language'))
+        setattr(s, ftype + '_token_cnt', token_cnt)
+      yield s
+
+  # Save denormalized fields in DB (parallelized, thus should be static)
+  @staticmethod
+  def save_segments(seg_iter):
+    from TMDbApi.TMMap.TMMapES import TMMapES
+    TMMapES().update_denormalized(list(seg_iter))
+
+
+if __name__ == "__main__":
+  from Config.Config import G_CONFIG
+  from TMDbApi.TMMap.TMMapES import TMMapES
+  G_CONFIG.config_logging()
+
+  task = Task(sys.argv[1])
+  # Add analyzer & mapping of denormalized fields to the existing map index
+  TMMapES().migrate_layout(task.get_langs())
+  # Launch RDD parallel processing
+  task.get_rdd().mapPartitionsWithIndex(DenormalizeTask(task)).foreachPartition(DenormalizeTask.save_segments)
+  task.finalize()
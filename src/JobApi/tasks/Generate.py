@@ -67,7 +67,8 @@ if __name__ == "__main__":
   task = Task(sys.argv[1])
   #task.get_rdd_generate().mapPartitionsWithIndex(GenerateTask(task)).foreachPartition(Task.save_segments)
   rdd = task.get_rdd_generate().mapPartitionsWithIndex(GenerateTask(task))
-  Task.save_segments(rdd.toLocalIterator()) # save partitions sequentially as we have already bulk parallelization in save_segments()
+  with task.bulk_load():
+    Task.save_segments(rdd.toLocalIterator()) # save partitions sequentially as we have already bulk parallelization in save_segments()
 
   #task.run_sequential()
   task.finalize()
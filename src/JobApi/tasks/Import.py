@@ -27,6 +27,10 @@ sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', '
 from pyspark import SparkContext
 
 from TMX.TMXParser import TMXParser
+from TMDbApi.TMImportPipeline import TMImportPipeline
+from TMDbApi.TMDbApi import TMDbApi
+from TMDbApi.TMScriptFreeIngest import TMScriptFreeIngest
+from JobApi.ImportCheckpoint import ImportCheckpoint
 from JobApi.tasks.Task import Task
 
 class ImportTask(Task):
@@ -38,8 +42,22 @@ class ImportTask(Task):
 
   def run_sequential(self):
     params = self.job['params']
-    parser = TMXParser(params['file'], domain=params['domain'], lang_pairs=params.get('lang_pairs', []), username=self.job['username'])
-    Task.save_segments(parser.parse())
+    checkpoint = ImportCheckpoint(self.job_api, self.job_id)
+    parser = TMXParser(params['file'], domain=params['domain'], lang_pairs=params.get('lang_pairs', []), username=self.job['username'], start=checkpoint.position())
+    try:
+      TMDbApi(script_free=TMScriptFreeIngest.ENABLED).add_segments(parser.parse(), on_commit=checkpoint.commit)
+    finally:
+      checkpoint.save()
+
+  # Tag preprocessing is done by the pipeline workers rather than by the parser
+  def run_pipeline(self):
+    params = self.job['params']
+    checkpoint = ImportCheckpoint(self.job_api, self.job_id)
+    parser = TMXParser(params['file'], domain=params['domain'], lang_pairs=params.get('lang_pairs', []), username=self.job['username'], preprocess=False, start=checkpoint.position())
+    try:
+      TMImportPipeline().run(parser.parse(), on_commit=checkpoint.commit)
+    finally:
+      checkpoint.save()
 
 
 if __name__ == "__main__":
@@ -48,8 +66,12 @@ if __name__ == "__main__":
 
   task = ImportTask(sys.argv[1])
   # TODO: enable parallel import when there is enough servers for OpenSearch
-  # For now, just import sequentially
-  task.run_sequential()
+  # For now, just import by a single (pipelined) process
+  with task.bulk_load():
+    if TMImportPipeline.ENABLED:
+      task.run_pipeline()
+    else:
+      task.run_sequential()
   task.finalize()
   #rdd = task.get_rdd()
   # Store each partition in DB
@@ -60,9 +60,10 @@ if __name__ == "__main__":
 
   task = Task(sys.argv[1])
   # Run (parallel) check and then store each partition in DB
-  task.get_rdd().mapPartitionsWithIndex(MaintainTask(task))\
-    .mapPartitionsWithIndex(CleanTask(task))\
-    .mapPartitionsWithIndex(PosTagTask(task))\
-    .foreachPartition(Task.save_segments)
+  with task.bulk_load():
+    task.get_rdd().mapPartitionsWithIndex(MaintainTask(task))\
+      .mapPartitionsWithIndex(CleanTask(task))\
+      .mapPartitionsWithIndex(PosTagTask(task))\
+      .foreachPartition(Task.save_segments)
   task.finalize()
 
@@ -0,0 +1,54 @@
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import sys, os
+sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', '..'))
+
+from JobApi.tasks.Task import Task
+
+
+# Backfill hash fields of existing map docs: normalized source & target text hashes
+# (exact match lookup) and text & contexts hashes (in-context match lookup)
+class RehashTask:
+  # Save hash fields in DB (parallelized, thus should be static)
+  @staticmethod
+  def save_segments(seg_iter):
+    # Import should be inside the function to avoid serializing all dependencies
+    # for parallel execution
+    sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', '..'))
+    sys.path = [p for p in sys.path if p]
+    from TMDbApi.TMMap.TMMapES import TMMapES
+    TMMapES().update_hashes(list(seg_iter))
+
+
+if __name__ == "__main__":
+  from Config.Config import G_CONFIG
+  from TMDbApi.TMSchema import TMSchema
+  G_CONFIG.config_logging()
+
+  task = Task(sys.argv[1])
+  # Make sure hash fields are mapped as keywords
+  TMSchema.ensure()
+  # Launch RDD parallel processing
+  task.get_rdd().foreachPartition(RehashTask.save_segments)
+  task.finalize()
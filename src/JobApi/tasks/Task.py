@@ -24,10 +24,14 @@
 from pyspark import SparkContext, StorageLevel
 import sys, os
 import logging
+import contextlib
+from opensearchpy.exceptions import NotFoundError
 sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', '..'))
 
 from JobApi.ESJobApi import ESJobApi
 from TMDbApi.TMDbApi import TMDbApi
+from TMDbApi.TMBulkLoadSettings import TMBulkLoadSettings
+from TMDbApi.TMUtils import TMUtils
 from Config.Config import G_CONFIG
 
 
@@ -71,6 +75,39 @@ class Task:
   def get_langs(self):
     return (self.job['params']['slang'], self.job['params']['tlang'])
 
+  # Language pairs written by the job: all pairs of import or the pair of other jobs
+  def get_lang_pairs(self):
+    return self.job['params'].get('lang_pairs') or [self.get_langs()]
+
+  # Context manager switching tm_* and map_* indices of the job into bulk-load profile,
+  # if enabled. Missing indices are created to get the profile too. Previous settings
+  # and the state are recorded in 'bulk_load' field of the job
+  def bulk_load(self):
+    if not TMBulkLoadSettings.ENABLED: return contextlib.nullcontext()
+    db = TMDbApi()
+    indices = []
+    for slang, tlang in self.get_lang_pairs():
+      for lang in [slang, tlang]:
+        index = TMUtils.lang2es_index(lang)
+        if not db.ml_index.index_exists(index):
+          db.ml_index._create_index(index)
+          db.ml_index.refresh()
+        indices.append(index)
+      indices.append(db.seg_map._get_index(slang, tlang, create_missing=True)[0])
+    return TMBulkLoadSettings(list(dict.fromkeys(indices)), record=self._record_bulk_load,
+                              owner=self.job_id, is_stale=self._is_stale_job)
+
+  def _record_bulk_load(self, state):
+    self.job_api.set_field(self.job_id, 'bulk_load', state)
+
+  # Job owning indices in bulk-load profile is stale if it is neither pending nor running
+  # (failed, killed, finished without restoring or doesn't exist)
+  def _is_stale_job(self, job_id):
+    try:
+      return self.job_api.get_status(job_id) not in ['pending', 'running']
+    except NotFoundError:
+      return True
+
   def set_status(self, status):
     self.job_api.set_status(self.job_id, status)
 
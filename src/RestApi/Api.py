@@ -71,12 +71,14 @@ app.config['FILEUPLOAD_IMPORT_EXTENSIONS'] = ['.tmx', '.zip']
 import RestApi.Celery
 
 from RestApi.Auth import identity, decode_handler
-from RestApi.TmResource import TmResource, TmBatchQueryResource, TmImportResource, TmExportResource, \
+from RestApi.TmResource import TmResource, TmBatchQueryResource, TmBatchResource, TmImportResource, TmExportResource, \
                                 TmExportFileResource, TmGenerateResource, TmMaintainResource, TmPosTagResource, \
-                                TmCleanResource, TmStatsResource, TmUsageStatsResource
+                                TmCleanResource, TmDenormalizeResource, TmRehashResource, TmStatsResource, TmUsageStatsResource, \
+                                TmCacheResource
 from RestApi.JobsResource import JobsResource
 from RestApi.TagsResource import TagsResource
 from RestApi.ContentChecksResource import ContentChecksResource
+from TMDbApi.TMSchema import TMSchema
 
 from flask_cors import CORS
 CORS(app)
@@ -88,6 +90,7 @@ api_prefix = "/api/v{}".format(app.config['VERSION'])
 tms_prefix = api_prefix + '/tm'
 api.add_resource(TmResource, tms_prefix)
 api.add_resource(TmBatchQueryResource, tms_prefix + '/query_batch')
+api.add_resource(TmBatchResource, tms_prefix + '/batch')
 api.add_resource(TmImportResource, tms_prefix + '/import')
 api.add_resource(TmExportResource, tms_prefix + '/export')
 api.add_resource(TmExportFileResource, tms_prefix + '/export/file',
@@ -97,8 +100,11 @@ api.add_resource(TmGenerateResource, tms_prefix + '/generate')
 api.add_resource(TmPosTagResource, tms_prefix + '/pos')
 api.add_resource(TmMaintainResource, tms_prefix + '/maintain')
 api.add_resource(TmCleanResource, tms_prefix + '/clean')
+api.add_resource(TmDenormalizeResource, tms_prefix + '/denormalize')
+api.add_resource(TmRehashResource, tms_prefix + '/rehash')
 api.add_resource(TmStatsResource, tms_prefix + '/stats')
 api.add_resource(TmUsageStatsResource, tms_prefix + '/stats/usage')
+api.add_resource(TmCacheResource, tms_prefix + '/cache')
 
 # Jobs management endpoint
 api.add_resource(JobsResource, api_prefix + '/jobs', api_prefix + '/jobs/<string:job_id>')
@@ -145,6 +151,9 @@ with app.app_context():
     # is while within this block. Therefore, you can now run........
     db.create_all()
 
+# Apply OpenSearch templates, mappings and scripts (no-op if recorded schema version is up-to-date)
+TMSchema.ensure()
+
 
 if __name__ == '__main__':
     stream_handler = logging.StreamHandler()
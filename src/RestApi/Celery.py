@@ -64,6 +64,18 @@ def tm_clean_task(self):
     return {'status': 'Task completed!'}
 
 
+@main_celery.task(bind=True)
+def tm_denormalize_task(self):
+    SparkTaskDispatcher().run(self.request.id, 'Denormalize')
+    return {'status': 'Task completed!'}
+
+
+@main_celery.task(bind=True)
+def tm_rehash_task(self):
+    SparkTaskDispatcher().run(self.request.id, 'Rehash')
+    return {'status': 'Task completed!'}
+
+
 @main_celery.task(bind=True)
 def job_kill_task(self, job_id):
     SparkTaskDispatcher().run(job_id, 'KillTask')
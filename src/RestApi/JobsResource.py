@@ -21,11 +21,11 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-from flask_restx import Resource, abort, reqparse
+from flask_restx import Resource, abort, inputs, reqparse
 from lib.flask_jwt import current_identity, jwt_required
 
 from Auth import admin_permission
-from RestApi.Celery import job_kill_task
+from RestApi.Celery import job_kill_task, tm_import_task
 from JobApi.ESJobApi import ESJobApi
 from RestApi.Auth import ADMIN, PermissionChecker
 from helpers.AuditContext import set_current_auditlog_action
@@ -34,6 +34,9 @@ from helpers.AuditContext import set_current_auditlog_action
 class JobsResource(Resource):
   decorators = [jwt_required()]
   job_api = ESJobApi()
+  # Jobs which can be resumed from their last checkpoint (see ImportCheckpoint)
+  RESUMABLE_TYPES = ['import']
+  RESUMABLE_STATUSES = ['failed', 'killed']
 
 
 
@@ -95,3 +98,50 @@ class JobsResource(Resource):
     # Setup a job using Celery & ES
     task = job_kill_task.apply_async([job_id])
     return {"job_id": task.id, "message": "Job submitted successfully"}
+
+  """
+   @api {put} /jobs/:id Resume failed import job from its last checkpoint
+   @apiVersion 1.0.0
+   @apiName ResumeJob
+   @apiGroup Jobs
+   @apiUse Header
+   @apiPermission admin
+
+   @apiParam {Boolean} [force] Resume also a 'running' job, e.g. if its worker crashed without updating the status
+
+   @apiSuccess {String} job_id Job id
+   @apiSuccess {Json} checkpoint Checkpoint the job continues from (empty - from the beginning)
+   @apiError {String} 400 Job can't be resumed
+   @apiError {String} 401 Job doesn't exist
+
+  """
+  @PermissionChecker(admin_permission)
+  def put(self, job_id):
+    set_current_auditlog_action('translation-memory.jobs.resume')
+    args = self._put_reqparse()
+    try:
+      job = self.job_api.get_job(job_id)
+    except Exception:
+      job = None
+    if not job:
+      abort(401, message="Job {} doesn't exist".format(job_id))
+    if current_identity.role != ADMIN and current_identity.id != job["username"]:
+      abort(403, message="No permission to resume job {}".format(job_id))
+    if job.get('type') not in self.RESUMABLE_TYPES:
+      abort(400, message="Job of type {} can't be resumed".format(job.get('type')))
+    statuses = self.RESUMABLE_STATUSES + (['running'] if args.force else [])
+    if job.get('status') not in statuses:
+      abort(400, message="Job with status {} can't be resumed".format(job.get('status')))
+
+    job['status'] = 'pending'
+    job['resumed'] = job.get('resumed', 0) + 1
+    self.job_api.update_job(job_id, job)
+    # Relaunch the task with the same id, thus the same job doc
+    tm_import_task.apply_async(task_id=job_id)
+    return {"job_id": job_id, "checkpoint": job.get('checkpoint'), "message": "Job resumed successfully"}
+
+  def _put_reqparse(self):
+    parser = reqparse.RequestParser(bundle_errors=True)
+    parser.add_argument(name='force', type=inputs.boolean, default=False,
+                        help="Resume also a running job", location='args')
+    return parser.parse_args()
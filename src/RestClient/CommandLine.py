@@ -235,6 +235,31 @@ class CleanCommand(Command):
   def __call__(self):
     return self.client.clean(self.args.slang, self.args.tlang, self._args2filters(self.args))
 
+class DenormalizeCommand(Command):
+  def _subparse_args(self):
+    parser = self.subparsers.add_parser('denormalize', help="Migrate map index to denormalized layout")
+    parser.add_argument('-sl', '--slang', type=str, help="Source language", required=True)
+    parser.add_argument('-tl', '--tlang', type=str, help="Target language", required=True)
+
+    self._add_filter_args(parser)
+    return parser
+
+  def __call__(self):
+    return self.client.denormalize(self.args.slang, self.args.tlang, self._args2filters(self.args))
+
+
+class RehashCommand(Command):
+  def _subparse_args(self):
+    parser = self.subparsers.add_parser('rehash', help="Backfill exact and in-context match hashes")
+    parser.add_argument('-sl', '--slang', type=str, help="Source language", required=True)
+    parser.add_argument('-tl', '--tlang', type=str, help="Target language", required=True)
+
+    self._add_filter_args(parser)
+    return parser
+
+  def __call__(self):
+    return self.client.rehash(self.args.slang, self.args.tlang, self._args2filters(self.args))
+
 
 class StatsCommand(Command):
   def _subparse_args(self):
@@ -244,6 +269,17 @@ class StatsCommand(Command):
   def __call__(self):
     return self.client.stats()
 
+class CacheCommand(Command):
+  def _subparse_args(self):
+    parser = self.subparsers.add_parser('cache', help="Get query cache statistics or flush the cache")
+    parser.add_argument('-f', '--flush', action="store_true", help="Flush query cache")
+    return parser
+
+  def __call__(self):
+    if self.args.flush:
+      return self.client.flush_cache()
+    return self.client.cache_stats()
+
 class GetUserCommand(Command):
   def _subparse_args(self):
     parser = self.subparsers.add_parser('get_user', help="Get user details")
@@ -322,6 +358,17 @@ class KillJobCommand(Command):
   def __call__(self):
     return self.client.kill_job(self.args.job_id)
 
+class ResumeJobCommand(Command):
+  def _subparse_args(self):
+    parser = self.subparsers.add_parser('resume_job', help="Resume failed import job from its last checkpoint")
+    parser.add_argument('-i', '--job_id', type=str, help="Job id", required=True)
+    parser.add_argument('-f', '--force', action='store_true', help="Resume also a job with 'running' status (e.g. its worker crashed)")
+
+    return parser
+
+  def __call__(self):
+    return self.client.resume_job(self.args.job_id, self.args.force)
+
 
 class GetSettingsCommand(Command):
   def _subparse_args(self):
@@ -386,13 +433,17 @@ class CommandLine:
           'pos': PosCommand,
           'maintain' : MaintainCommand,
           'clean': CleanCommand,
+          'denormalize': DenormalizeCommand,
+          'rehash': RehashCommand,
           'stats': StatsCommand,
+          'cache': CacheCommand,
           'get_user': GetUserCommand,
           'set_user': SetUserCommand,
           'set_user_scope': SetUserScopeCommand,
           'delete_user_scope': DeleteUserScopeCommand,
           'get_job' : GetJobCommand,
           'kill_job': KillJobCommand,
+          'resume_job': ResumeJobCommand,
           'get_settings': GetSettingsCommand,
           'set_settings': SetSettingsCommand,
           'get_tag': GetTagCommand,
@@ -86,6 +86,12 @@ class RestClient:
                                                      'tmeta': tmeta})
     return response.json()
 
+  # Add translation units (list of dicts having add_tu parameters), returns status of each of them
+  def add_tu_batch(self, tus):
+    data = '\n'.join(json.dumps(tu, ensure_ascii=False) for tu in tus).encode('utf-8')
+    response = self._call_api('/tm/batch', 'post', data=data, headers={'Content-Type': 'application/x-ndjson'})
+    return response.json()
+
   def import_tm(self, tmx_file, domain, lang_pairs=[]):
     m = MultipartEncoder(fields={'file': (os.path.basename(tmx_file), open(tmx_file, 'rb'), 'text/plain')})
     headers = {'Content-Type': m.content_type}
@@ -134,10 +140,30 @@ class RestClient:
     response = self._call_api('/tm/clean', 'post',params=params)
     return JobMonitor(self, response.json())()
 
+  def denormalize(self, slang, tlang, filters={}):
+    params = {'slang': slang, 'tlang': tlang}
+    params.update(filters)
+    response = self._call_api('/tm/denormalize', 'post',params=params)
+    return JobMonitor(self, response.json())()
+
+  def rehash(self, slang, tlang, filters={}):
+    params = {'slang': slang, 'tlang': tlang}
+    params.update(filters)
+    response = self._call_api('/tm/rehash', 'post',params=params)
+    return JobMonitor(self, response.json())()
+
   def stats(self):
     response = self._call_api('/tm/stats', 'get')
     return response.json()
 
+  def cache_stats(self):
+    response = self._call_api('/tm/cache', 'get')
+    return response.json()
+
+  def flush_cache(self):
+    response = self._call_api('/tm/cache', 'delete')
+    return response.json()
+
   def get_user(self, username):
     api_path = '/users'
     if username:
@@ -190,6 +216,11 @@ class RestClient:
     response = self._call_api('/jobs/{}'.format(job_id), 'delete', params=kwargs)
     return response.json()
 
+  # Resume failed import job from its last checkpoint and monitor it
+  def resume_job(self, job_id, force=False):
+    response = self._call_api('/jobs/{}'.format(job_id), 'put', params={'force': force})
+    return JobMonitor(self, response.json())()
+
   def get_settings(self, **kwargs):
     response = self._call_api('/settings', 'get', params=kwargs)
     return response.json()
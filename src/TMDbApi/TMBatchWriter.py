@@ -0,0 +1,109 @@
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import os, sys
+sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..'))
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from Config.Config import G_CONFIG
+
+
+# Coalesces translation units of concurrent requests into shared bulk batches. Each request
+# submits its segments and waits; a writer thread collects the submitted segments for up to
+# linger_ms (or until max_batch segments) and writes all of them by a single call of write_fn.
+# write_fn returns a result per segment (e.g. error message), each request gets its own ones
+class TMBatchWriter:
+  CONFIG = G_CONFIG.get_tm_batch()
+
+  def __init__(self, write_fn, linger_ms=None, max_batch=None):
+    self.write_fn = write_fn
+    self.linger = (linger_ms if linger_ms is not None else self.CONFIG['linger_ms']) / 1000
+    self.max_batch = max_batch or self.CONFIG['max_batch']
+    self._pending = deque()
+    self._count = 0
+    self._cond = threading.Condition()
+    self._thread = None
+
+  # Write segments together with segments of concurrent requests. Blocks until written,
+  # returns results of the segments or raises the error of the write
+  def write(self, segments):
+    if not segments: return []
+    future = Future()
+    with self._cond:
+      self._pending.append((segments, future))
+      self._count += len(segments)
+      self._start()
+      self._cond.notify()
+    return future.result()
+
+  # Writer thread is started on first write (and again in a forked process)
+  def _start(self):
+    if self._thread and self._thread.is_alive(): return
+    self._thread = threading.Thread(target=self._run, name="TMBatchWriter", daemon=True)
+    self._thread.start()
+
+  def _run(self):
+    while True:
+      self._write(self._collect())
+
+  # Wait for a request, then up to linger time for more of them. Returns requests having
+  # up to max_batch segments in total (or a single larger request)
+  def _collect(self):
+    with self._cond:
+      while not self._pending:
+        self._cond.wait()
+      deadline = time.monotonic() + self.linger
+      while self._count < self.max_batch:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0: break
+        self._cond.wait(timeout)
+      requests = []
+      count = 0
+      while self._pending and (not requests or count + len(self._pending[0][0]) <= self.max_batch):
+        segments, future = self._pending.popleft()
+        requests.append((segments, future))
+        count += len(segments)
+      self._count -= count
+      return requests
+
+  def _write(self, requests):
+    try:
+      results = self.write_fn([s for segments, future in requests for s in segments])
+    except Exception as e:
+      if len(requests) == 1:
+        requests[0][1].set_exception(e)
+        return
+      # Do not fail all requests of the batch: write each of them separately
+      logging.warning("Failed to write batch of {} requests, writing them one by one: {}".format(len(requests), e))
+      for request in requests:
+        self._write([request])
+      return
+    offset = 0
+    for segments, future in requests:
+      future.set_result(results[offset:offset + len(segments)])
+      offset += len(segments)
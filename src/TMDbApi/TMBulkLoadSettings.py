@@ -0,0 +1,173 @@
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import os, sys
+sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..'))
+
+import logging
+import socket
+import datetime
+
+from TMDbApi.TMUtils import TMUtils
+from helpers.OpenSearchHelper import OpenSearchHelper
+from Config.Config import G_CONFIG
+
+
+"""
+  @api {INFO} /TMBulkLoadSettings TMBulkLoadSettings -- Bulk-load profile of index settings for large jobs
+  @apiName TMBulkLoadSettings
+  @apiVersion 0.1.0
+  @apiGroup TMDbApi
+
+  @apiExample {curl} Example & Notes
+
+  # For the duration of the with-block indices get the bulk-load profile: no periodic refresh,
+  # no replicas and asynchronous translog (see opensearch.bulk_load in the configuration).
+  # Afterwards, also if the block fails, previous settings are restored and indices are force
+  # merged. State ('applied', 'restored' or 'restore_failed', previous settings and errors) is
+  # passed to 'record', e.g. to be saved in the job doc.
+  #
+  # Ownership of an index in the profile is a lock doc in LOCK_INDEX (id is the index name)
+  # naming the owner (job id) and the settings to restore. It is removed after a successful
+  # restore only, thus it survives the owner dying hard (OOM, killed driver). An index locked by
+  # another owner which is not stale is skipped and restored by that owner. An index locked by
+  # the same owner (resumed job) or by a stale one (is_stale(owner), e.g. a failed job) is taken
+  # over together with the recorded settings, which are restored afterwards.
+
+  with TMBulkLoadSettings(['tm_en', 'tm_es', 'map_en_es'], owner=job_id, is_stale=is_stale, record=print):
+    ... # bulk writes
+"""
+class TMBulkLoadSettings:
+  CONFIG = G_CONFIG.get_bulk_load()
+  ENABLED = CONFIG['enabled']
+  SETTINGS = ['refresh_interval', 'number_of_replicas', 'translog.durability']
+  LOCK_INDEX = 'bulk_load_locks'
+
+  def __init__(self, indices, es=None, record=None, owner=None, is_stale=None):
+    self.indices = indices
+    self.es = es if es else OpenSearchHelper()
+    self.record = record
+    self.owner = owner if owner else "{}:{}".format(socket.gethostname(), os.getpid())
+    self.is_stale = is_stale if is_stale else lambda owner: False
+    self.state = {'status': None,
+                  'owner': self.owner,
+                  'profile': self.profile(),
+                  'indices': dict(), # index -> previous settings
+                  'skipped': dict(), # index -> owner
+                  'errors': []}
+
+  def profile(self):
+    return {'refresh_interval': str(self.CONFIG['refresh_interval']),
+            'number_of_replicas': str(self.CONFIG['number_of_replicas']),
+            'translog.durability': self.CONFIG['translog_durability']}
+
+  def __enter__(self):
+    self.apply()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.restore()
+    return False
+
+  def apply(self):
+    profile = self.profile()
+    for index in self.indices:
+      previous = self._lock(index)
+      if previous is not None:
+        self.state['indices'][index] = previous
+    # Record previous settings before changing them to be able to restore them manually
+    self.state['status'] = 'applied'
+    self._record()
+    for index in self.state['indices']:
+      self._put_settings(index, profile)
+      logging.info("Index {} switched to bulk-load profile {}".format(index, profile))
+
+  def restore(self):
+    for index, previous in self.state['indices'].items():
+      try:
+        self._put_settings(index, previous)
+      except Exception as e:
+        logging.error("Failed to restore settings of {}: {}".format(index, e))
+        self.state['errors'].append("{}: {}".format(index, e))
+        # Lock is kept: settings are restored by a resumed job or by a job taking over the lock
+        continue
+      self._unlock(index)
+      if self.CONFIG['force_merge']:
+        try:
+          self.es.indices_forcemerge(index, max_num_segments=self.CONFIG['max_num_segments'])
+        except Exception as e:
+          # Not critical: merges go on in the background anyway
+          logging.warning("Failed to force merge {}: {}".format(index, e))
+      logging.info("Index {} settings restored: {}".format(index, previous))
+    self.state['status'] = 'restore_failed' if self.state['errors'] else 'restored'
+    self._record()
+
+  # Locks the index, returns settings to restore or None if the index is locked by another owner
+  def _lock(self, index):
+    previous = self._get_settings(index)
+    if previous['refresh_interval'] == str(self.CONFIG['refresh_interval']):
+      # In the profile without a lock (lock was removed manually): restore defaults
+      logging.warning("Index {} is in bulk-load profile without owner, defaults will be restored".format(index))
+      previous = dict.fromkeys(self.SETTINGS)
+    lock = {'owner': self.owner, 'settings': previous, 'time': TMUtils.date2str(datetime.datetime.now())}
+    if self.es.create(self.LOCK_INDEX, index, lock):
+      return previous
+    current = self.es.get_source(self.LOCK_INDEX, index)
+    if current is None:
+      # Unlocked meanwhile
+      return self._lock(index)
+    if current['owner'] != self.owner and not self.is_stale(current['owner']):
+      logging.warning("Index {} is in bulk-load profile of {}, skipping".format(index, current['owner']))
+      self.state['skipped'][index] = current['owner']
+      return None
+    # Current settings may be the profile of the previous owner, restore the recorded ones
+    logging.warning("Taking over bulk-load profile of index {} from {}".format(index, current['owner']))
+    self.es.index(self.LOCK_INDEX, index, dict(lock, settings=current['settings']))
+    return current['settings']
+
+  def _unlock(self, index):
+    current = self.es.get_source(self.LOCK_INDEX, index)
+    if current and current['owner'] == self.owner:
+      self.es.delete(self.LOCK_INDEX, index)
+
+  # Current values of SETTINGS, None if not set explicitly (default value)
+  def _get_settings(self, index):
+    settings = self.es.indices_get_settings(index)[index]['settings']['index']
+    values = dict()
+    for name in self.SETTINGS:
+      value = settings
+      for key in name.split('.'):
+        value = value.get(key) if isinstance(value, dict) else None
+      values[name] = value
+    return values
+
+  # None value resets the setting to its default
+  def _put_settings(self, index, values):
+    self.es.indices_put_settings(index, {'index.' + name: value for name, value in values.items()})
+
+  def _record(self):
+    if not self.record: return
+    try:
+      self.record(self.state)
+    except Exception as e:
+      logging.warning("Failed to record bulk-load state: {}".format(e))
@@ -37,6 +37,7 @@ import datetime
 # Do not remove - weird packaging issue requires this libraries
 # to be included here and not inside TMRegExpPreprocessor
 import babel.numbers, babel.dates
+from opensearchpy.helpers import BulkIndexError
 
 from TMDbApi.TMTranslationUnit import TMTranslationUnit
 from TMDbApi import TMMap
@@ -46,7 +47,8 @@ from TMPreprocessor.Xml.XmlUtils import XmlUtils
 from TMMatching.TMMatching import TMMatching
 from TMMatching.TMUtilsMatching import TMUtilsMatching
 from TMAutomaticTranslation.TMAutomaticTranslation import TMAutomaticTranslation
-from TMDbApi.TMUtils import TMTimer
+from TMDbApi.TMUtils import TMUtils, TMTimer
+from TMDbApi.TMQueryCache import TMQueryCache
 from Config.Config import G_CONFIG
 from timeit import default_timer as timer
 
@@ -64,10 +66,12 @@ class TMDbApi:
   MATCH_TIME = G_CONFIG.get_wait_query_time()
   QUERY_PENALIZE = G_CONFIG.get_query_penalize()
   DIRTY_THRESHOLD = G_CONFIG.get_dirty_threshold()
+  EXACT_MATCH = G_CONFIG.get_exact_match()
 
-  def __init__(self, map_engine = 'opensearch', **kwargs):
-    self.ml_index = TMMonoLing()
-    self.seg_map = TMMap.create(map_engine)
+  # script_free: bulk writes of new docs without scripted upserts, see TMScriptFreeIngest (import jobs only)
+  def __init__(self, map_engine = 'opensearch', script_free=False, **kwargs):
+    self.ml_index = TMMonoLing(script_free=script_free)
+    self.seg_map = TMMap.create(map_engine, script_free=script_free)
     self.timer = TMTimer("TMDbApi")
     self.scan_size = 0
     # self._migrate_tags()
@@ -84,25 +88,57 @@ class TMDbApi:
     self.ml_index.add_segment(segment, 'target')
 
     self.seg_map.add_segment(segment)
+    TMQueryCache.invalidate((segment.source_language, segment.target_language))
 
-  # Bulk segment addition
-  def add_segments(self, segments_iter):
+  # Bulk segment addition. If given, on_commit is called with each written batch
+  def add_segments(self, segments_iter, on_commit=None):
     # Send bulk update requests for both ES monolingual index and map
-    batch = batch_status = []
+    batch = []
+    batch_status = []
     logging.info("Started add_segments")
     for segment in segments_iter:
       # Add to batch, when the batch exceeds given size, perform actual bulk insertion
       batch.append(segment)
       if len(batch) >= self.BATCH_SIZE:
         batch_status.append(self._add_segments(batch))
+        if on_commit: on_commit(batch)
         batch.clear()
     batch_status.append(self._add_segments(batch))
+    if on_commit and batch: on_commit(batch)
     self.seg_map.refresh()
     logging.info("Finished add_segments")
     self.timer.print()
     self.seg_map.timer.print()
     return batch_status
 
+  # Bulk addition of segments reporting errors per segment instead of raising them. Returns list
+  # of error messages, None for written segments. Segments failed in one index are not written
+  # to the next ones
+  def add_segments_status(self, segments):
+    errors = [None] * len(segments)
+    writers = [('source', lambda s: self.ml_index.add_segments(s, 'source'), lambda s: s.source_id),
+               ('target', lambda s: self.ml_index.add_segments(s, 'target'), lambda s: s.target_id),
+               ('map', self.seg_map.add_segments, self.seg_map.doc_id)]
+    for name, write, doc_id in writers:
+      pending = [i for i, error in enumerate(errors) if error is None]
+      if not pending: break
+      self.timer.start("add_segments:" + name)
+      try:
+        write([segments[i] for i in pending])
+      except BulkIndexError as e:
+        # Failed items of all chunks, other docs are written
+        failed = dict((str(item.get('_id')), item) for op in e.errors for item in op.values())
+        for i in pending:
+          item = failed.get(str(doc_id(segments[i])))
+          if item: errors[i] = "Failed to write {} doc: {}".format(name, item.get('error', item.get('status')))
+      finally:
+        self.timer.stop("add_segments:" + name)
+    for langs in set((s.source_language, s.target_language) for s in segments):
+      TMQueryCache.invalidate(langs)
+    self.seg_map.refresh()
+    logging.info("Added {} segments, {} failed".format(len(segments), len([e for e in errors if e])))
+    return errors
+
   def _filter_by_query(self, query, src_lang, tgt_lang, total_token, exact_length):
     dic_filter = []
 
@@ -148,18 +184,81 @@ class TMDbApi:
     return list_segments
 
   def query(self, qparams):
-      # Drop tags from query
-      q_out_tags = [(q, XmlUtils.strip_tags(q)) for q in qparams.qlist]
+      return self._cached_query(qparams, False, self._query_uncached)
+
+  def _query_uncached(self, qparams):
+      out_segments = [(q, result) for q, result, result101 in self._mquery(qparams)]
+      return self._output(qparams, out_segments)
+
+  # Combined query: retrieve and match candidates once, then return both in-context (101%)
+  # matches, i.e. 100% matches having the same contexts as qparams.source_metadata and
+  # qparams.target_metadata, and normal matches (above qparams.min_match).
+  # Returns tuple (results101, results), each of them in the same format as query() output
+  def query_in_context(self, qparams):
+      # Cache holds tuple (result101, result) per query
+      results = self._cached_query(qparams, True, lambda qp: list(zip(*self._query_in_context_uncached(qp))))
+      if not results: return [], []
+      results101, out = zip(*results)
+      return list(results101), list(out)
+
+  def _query_in_context_uncached(self, qparams):
+      out_segments = []
+      results101 = []
+      for q, result, result101 in self._mquery(qparams, in_context=True):
+        out_segments.append((q, result))
+        results101.append((result101, False))
+      return results101, self._output(qparams, out_segments)
+
+  # Serve queries from the cache and run f_query only for the missing ones.
+  # f_query returns list of results, one per query of given qparams
+  def _cached_query(self, qparams, in_context, f_query):
+      if not TMQueryCache.ENABLED or not qparams.qlist: return f_query(qparams)
+      keys = TMQueryCache.keys(qparams, in_context)
+      if keys is None: return f_query(qparams)
+      results = TMQueryCache.get_many(keys)
+      missing = [i for i, result in enumerate(results) if result is None]
+      if not missing: return results
+      m_qparams = qparams.copy()
+      m_qparams.qlist = [qparams.qlist[i] for i in missing]
+      if qparams.qinfo: m_qparams.qinfo = [qparams.qinfo[i] for i in missing]
+      m_results = f_query(m_qparams)
+      for i, result in zip(missing, m_results):
+        results[i] = result
+      TMQueryCache.put_many([keys[i] for i in missing], m_results)
+      return results
+
+  # Returns list of tuples (query, (segments, match), segments101), one per query
+  def _mquery(self, qparams, in_context=False):
       if not qparams.qinfo:
         qparams.qinfo = [dict() for q in qparams.qlist]
+      if not self._use_exact_match(qparams): return self._fuzzy_mquery(qparams, in_context)
+      # Exact matches fast path, the rest of queries go through full-text retrieval and matching
+      out_segments = self._exact_mquery(qparams, in_context)
+      missing = [i for i, out in enumerate(out_segments) if out is None]
+      if missing:
+        f_qparams = qparams.copy()
+        f_qparams.qlist = [qparams.qlist[i] for i in missing]
+        f_qparams.qinfo = [qparams.qinfo[i] for i in missing]
+        for i, out in zip(missing, self._fuzzy_mquery(f_qparams, in_context)):
+          out_segments[i] = out
+      return out_segments
+
+  def _fuzzy_mquery(self, qparams, in_context=False):
+      # Drop tags from query
+      q_out_tags = [(q, XmlUtils.strip_tags(q)) for q in qparams.qlist]
+      # Tokenize & POS tag all queries at once (used by matching)
+      self.timer.start("preprocess_queries")
+      TMMatching.preprocess_queries(qparams.qlist, qparams.qinfo, qparams.source_lang)
+      self.timer.stop("preprocess_queries")
 
-      out_segments = [] # list of lists of tuples :(segment, ter)
+      out_segments = [] # list of tuples :(query, (segments, match), segments101)
       if qparams.concordance:
         dic_filter = [{'target_language': qparams.target_lang}]
       else:
         # Extract query length
         dic_filter = self._filter_by_query(q_out_tags, qparams.source_lang, qparams.target_lang, '-', qparams.exact_length) # Doesn't pass the total token, the function calculate the value for each query  -->  target_lang
-      if qparams.aut_trans: list_to_translate = []
+      if self.seg_map.DENORMALIZED:
+        return self._mquery_map(qparams, q_out_tags, dic_filter, in_context)
       # Query source ES for the text
       self.timer.start("monoling_query")
 
@@ -169,8 +268,81 @@ class TMDbApi:
 
       for q, qinfo ,response in loopArray:
         self.timer.stop("monoling_query")
-        out_segments.append((q, self._query(q, qinfo, response, qparams)))  # create new list for current query
-
+        result, result101 = self._query(q, qinfo, response, qparams, in_context)
+        out_segments.append((q, result, result101))  # create new list for current query
+      return out_segments
+
+  # Exact matches don't need matching pipeline (see TMMatching.execute), unless output
+  # has to be tokenized (moses) or all candidates are requested (concordance)
+  def _use_exact_match(self, qparams):
+      return self.EXACT_MATCH['enabled'] and not qparams.concordance and qparams.out != 'moses'
+
+  # Resolve queries by exact match lookup. Returns output tuple (see _mquery) for each query
+  # having exact matches, None for the rest. Queries with tags are skipped as matching
+  # pipeline uniforms and transfers tags
+  def _exact_mquery(self, qparams, in_context=False):
+      self.timer.start("exact_query")
+      indexes = [i for i, q in enumerate(qparams.qlist) if not TMUtils.TAG_RE.search(q)]
+      # In-context matches are selected from all exact matches, thus don't filter map by contexts
+      source_metadata = qparams.source_metadata if not in_context else None
+      target_metadata = qparams.target_metadata if not in_context else None
+      map_response = self.seg_map.mget_exact(qparams.source_lang, qparams.target_lang, [qparams.qlist[i] for i in indexes],
+                                             source_metadata=source_metadata, target_metadata=target_metadata, domains=qparams.domains)
+      self.timer.stop("exact_query")
+      out_segments = [None] * len(qparams.qlist)
+      for i, map_docs in zip(indexes, map_response or []):
+        q = qparams.qlist[i]
+        docs = [(map_doc, self._doc2segment(map_doc)) for map_doc in map_docs]
+        docs = [(map_doc, segment) for map_doc, segment in docs if self._is_exact(q, segment.source_text)]
+        if not docs: continue
+        self.timer.count("exact matches")
+        segments = [(segment, 100) for map_doc, segment in docs]
+        segments101 = None
+        if in_context:
+          segments101, _ = self._select_segments([(segment, 100) for map_doc, segment in docs if self._match_context_hashes(map_doc, segment, qparams)], qparams, 100, False)
+        out_segments[i] = (q, self._select_segments(segments, qparams, qparams.min_match, qparams.aut_trans), segments101)
+      return out_segments
+
+  # In-context check of an exact match by context hashes stored in its map doc: same
+  # as match_contexts, but compares hashes. Map docs stored before context hashes
+  # were introduced (and not backfilled yet) are checked by match_contexts
+  def _match_context_hashes(self, map_doc, segment, qparams):
+      if 'source_context_hash' not in map_doc:
+        return self.match_contexts(segment, qparams.source_metadata, qparams.target_metadata)
+      checks = []
+      for ftype, metadata in [('source', qparams.source_metadata), ('target', qparams.target_metadata)]:
+        context_hash = self.seg_map.context_hash(getattr(segment, ftype + '_text'), metadata)
+        # Like match_contexts, skip sides without contexts either in query or in segment
+        if not context_hash or not map_doc.get(ftype + '_context_hash'): continue
+        checks.append(map_doc[ftype + '_context_hash'] == context_hash)
+      return bool(checks) and all(checks)
+
+  def _is_exact(self, q, source_text):
+      if self.EXACT_MATCH['casefold']: return q.casefold() == source_text.casefold()
+      return q == source_text
+
+  # Denormalized layout: search map index directly, map docs already contain everything
+  # needed for matching (source & target texts, POS etc.)
+  def _mquery_map(self, qparams, q_out_tags, dic_filter, in_context):
+      # In-context matches are selected from the whole candidate set, thus don't filter map by contexts
+      source_metadata = qparams.source_metadata if not in_context else None
+      target_metadata = qparams.target_metadata if not in_context else None
+      self.timer.start("map_query")
+      map_response = self.seg_map.mquery(qparams.source_lang, qparams.target_lang, 2 * qparams.limit,
+                                         [q_o_tags for q, q_o_tags in q_out_tags], dic_filter,
+                                         source_metadata=source_metadata, target_metadata=target_metadata, domains=qparams.domains)
+      self.timer.stop("map_query")
+      out_segments = []
+      for q, qinfo, map_docs in zip(qparams.qlist, qparams.qinfo, map_response):
+        self.timer.start("match_time_query")
+        self.timer.start("doc2segment")
+        candidates = [self._doc2segment(map_doc) for map_doc in map_docs] if map_docs else None
+        self.timer.stop("doc2segment")
+        result, result101 = self._query_candidates(q, qinfo, candidates, qparams, in_context)
+        out_segments.append((q, result, result101))
+      return out_segments
+
+  def _output(self, qparams, out_segments):
       if qparams.aut_trans:
         logging.info("Machine Translation")
         last_output = []
@@ -278,10 +450,13 @@ class TMDbApi:
     self._delete(langs, docs, filter, force_delete=duplicates_only)
     all += len(docs)
     logging.info("Final: deleted {} translation units".format(all))
+    TMQueryCache.invalidate(langs)
 
   # Check if language pair exists
   def has_langs(self, langs):
-    return shortest_path_length(self.seg_map.get_lang_graph(), langs[0], langs[1]) == 1
+    lang_graph = self.seg_map.get_lang_graph()
+    if langs[0] not in lang_graph or langs[1] not in lang_graph: return False
+    return lang_graph.has_edge(langs[0], langs[1])
 
   def get_all_langs(self):
     lang_graph = self.seg_map.get_lang_graph()
@@ -330,6 +505,7 @@ class TMDbApi:
         lang_pairs[lang_pair_str][field] = self.seg_map.get_aggr_values(field, lang_pair, None)
     stats['lang_pairs'] = lang_pairs
     stats['query_timer'] = sorted(self.timer.stages.items(), key=operator.itemgetter(1), reverse=True)
+    stats['query_counts'] = self.timer.counts
     return stats
 
   def mstats(self):
@@ -350,23 +526,29 @@ class TMDbApi:
       stats['lang_pairs'][lp]['count'] = count
 
     stats['query_timer'] = sorted(self.timer.stages.items(), key=operator.itemgetter(1), reverse=True)
+    stats['query_counts'] = self.timer.counts
     return stats
 
   ############### Helper methods ###################
-  def _query(self, q, qinfo, ml_response, qparams):
+  # Returns tuple ((segments, match), segments101). segments101 is a list of in-context
+  # (101%) matches if in_context is set, None otherwise
+  def _query(self, q, qinfo, ml_response, qparams, in_context=False):
     self.timer.start("match_time_query")
-    l_best_segments = []
     src_hits = [src_hit for src_hit in ml_response] # turn iterator into list to be reentrant
     src_hits_map = {src_hit.meta.id: src_hit for src_hit in src_hits}
+    # In-context matches are selected from the whole candidate set, thus don't filter map by contexts
+    source_metadata = qparams.source_metadata if not in_context else None
+    target_metadata = qparams.target_metadata if not in_context else None
     # Build segment by querying map and target index
     self.timer.start("src2tgt")
     map_docs = None
     try:
-      map_docs = self._msrc_id2tgt_id(src_hits, qparams.source_lang, qparams.target_lang, return_multiple=True, source_metadata=qparams.source_metadata, target_metadata=qparams.target_metadata, domains=qparams.domains)
+      map_docs = self._msrc_id2tgt_id(src_hits, qparams.source_lang, qparams.target_lang, return_multiple=True, source_metadata=source_metadata, target_metadata=target_metadata, domains=qparams.domains)
     except ValueError:
       logging.info("Unsupported index for target: {}".format(qparams.target_lang))
       #if not map_docs: raise (ValueError("Unsupported index for target: {}".format(target_lang)))
 
+    candidates = None
     if map_docs:
       target_ids = []
       for d in map_docs:
@@ -374,21 +556,24 @@ class TMDbApi:
         target_ids.append((qparams.target_lang, target_id))
       self.timer.stop("src2tgt")
       self.timer.start("doc2segment")
-      count = 0
-
+      candidates = []
       for map_doc, tgt_doc in zip(map_docs, self.ml_index.mget(target_ids)):
         if not map_doc: continue
         src_hit = src_hits_map[map_doc["source_id"]]
-        segment = self._doc2segment(map_doc, sd=src_hit.to_dict(), td=tgt_doc)
-        count = count + 1
-
-        if segment and count <= (2 * qparams.limit):
-            l_best_segments.append((segment, 0))
-        else:
-            break
+        candidates.append(self._doc2segment(map_doc, sd=src_hit.to_dict(), td=tgt_doc))
       self.timer.stop("doc2segment")
+    return self._query_candidates(q, qinfo, candidates, qparams, in_context)
+
+  # Match candidate segments (None if no map docs were found) against the query
+  def _query_candidates(self, q, qinfo, candidates, qparams, in_context=False):
+    l_best_segments = []
+    if candidates is not None:
+      if in_context:
+        # Move in-context candidates first, so that they are not cut off by the limit
+        candidates.sort(key=lambda segment: not self.match_contexts(segment, qparams.source_metadata, qparams.target_metadata))
+      l_best_segments = [(segment, 0) for segment in candidates[:2 * qparams.limit]]
       # If concordance mode is requested, return here without matching postprocessing -- return opensearch segments
-      if qparams.concordance: return self._match(q, qinfo, l_best_segments, qparams)
+      if qparams.concordance: return self._match(q, qinfo, l_best_segments, qparams, in_context)
     logging.info("Best segments(1): {}".format(l_best_segments))
     # Call automatic translation if opensearch doesn't find any segment
     if not l_best_segments:
@@ -398,10 +583,10 @@ class TMDbApi:
          'tm_change_date': '', 'username': ''}),0))
 
     # Improve OpenSearch match
-    out_segments, check_match = self._match(q, qinfo, l_best_segments, qparams)
+    (out_segments, check_match), segments101 = self._match(q, qinfo, l_best_segments, qparams, in_context)
     logging.info("Best segments(2): {}".format(out_segments))
 
-    return out_segments, check_match
+    return (out_segments, check_match), segments101
 
   def _generate_batch(self, batch_mget, domains):
     pivots = self.seg_map.mget(batch_mget)
@@ -417,21 +602,35 @@ class TMDbApi:
         yield self._doc2segment(map_doc)
 
   # Select the best segment (Matching method) Return if there are good segments or need automatic translation
-  def _match(self, qstring, qinfo, l_best_segments, qparams):
+  # Returns tuple ((segments, match), segments101), see _query()
+  def _match(self, qstring, qinfo, l_best_segments, qparams, in_context=False):
 
-    match = False # Variable to check if there are segments with good ter or need automatic translation
-
-    if not l_best_segments: return [],0
+    if not l_best_segments: return ([],0), ([] if in_context else None)
     tm_match = TMMatching(qstring, qinfo, qparams.source_lang, qparams.target_lang, qparams.out, qparams.min_match, qparams.domains, qparams.aut_trans, qparams.pipe)
     self.timer.start("match:execute")
     segments = tm_match.execute(l_best_segments, ['word_ter', 'posTag', 'position', 'glossary'], qparams.concordance)  # ['regex', 'posTag']:
     self.timer.stop("match:execute")
+    segments101 = None
+    if in_context:
+      segments101 = [(segment, ter) for segment, ter in segments if self.match_contexts(segment, qparams.source_metadata, qparams.target_metadata)]
     # For concordance search, just return found segments
     if qparams.concordance:
-      return segments, match
+      return (segments, False), segments101
     # Else, try improving matching
-    new_segments = []
     logging.info("Match segments: {}".format(segments))
+    new_segments, match = self._select_segments(segments, qparams, qparams.min_match, qparams.aut_trans)
+    if in_context:
+      segments101, _ = self._select_segments(segments101, qparams, 100, False)
+    logging.info("New match segments: {}".format(new_segments))
+
+    tm_match.timer.print()
+    self.timer.add_counts(tm_match.timer)
+    return (new_segments, match), segments101
+
+  # Keep segments above min_match (adjusted according to filters) sorted by match & change date
+  def _select_segments(self, segments, qparams, min_match, aut_trans):
+    match = False # Variable to check if there are segments with good ter or need automatic translation
+    new_segments = []
     for segment, ter in segments: # This one is for each segment
       # if not new_segments: new_segments = segments
 
@@ -446,21 +645,33 @@ class TMDbApi:
       ####
 
       # Adjust match % according to filters
-      if ter >= qparams.min_match:
+      if ter >= min_match:
         self.timer.start("adjust_match")
         ter = self._adjust_match(segment, qparams.domains, ter)
         self.timer.stop("adjust_match")
         new_segments.append((segment, ter))
         match = True
-      elif qparams.aut_trans and len(segments) == 1: # Mark segment as one needed to machine-translate
+      elif aut_trans and len(segments) == 1: # Mark segment as one needed to machine-translate
         match = False
         new_segments.append((segment, ter))
     new_segments.sort(key = lambda x: (x[1], x[0].tm_change_date) if (x[0].tm_change_date is not None) else (x[1], str(datetime.datetime(1970, 1, 1))), reverse = True)
-    logging.info("New match segments: {}".format(new_segments))
-
-    tm_match.timer.print()
     return new_segments, match
 
+  # Check if segment contexts (before & after) are equal to the given source and target metadata ones
+  @staticmethod
+  def match_contexts(segment, source_metadata, target_metadata):
+    if not source_metadata and not target_metadata:
+      return False
+    checks = []
+    for metadata, segment_metadata in [(source_metadata, segment.source_metadata), (target_metadata, segment.target_metadata)]:
+      if not metadata or not segment_metadata: continue
+      segment_metadata = segment._metadata_to_dict(segment_metadata)
+      for context in ['context_before', 'context_after']:
+        checks.append(metadata.get(context, None) == segment_metadata.get(context, None))
+    if not checks:
+      return False
+    return all(checks)
+
   def _add_segments(self, segments):
     batch_status = []
     self.timer.start("add_segments:source")
@@ -472,6 +683,8 @@ class TMDbApi:
     self.timer.start("add_segments:map")
     batch_status.append(self.seg_map.add_segments(segments))
     self.timer.stop("add_segments:map")
+    for langs in set((s.source_language, s.target_language) for s in segments):
+      TMQueryCache.invalidate(langs)
     logging.info('Added {} segments, status: {}'.format(len(segments), batch_status))
     return batch_status
 
@@ -520,6 +733,9 @@ class TMDbApi:
     if sd: doc['source_pos'] = sd.get('pos')
     if td: doc['target_pos'] = td.get('pos')
     segment = TMTranslationUnit(doc)
+    # Precomputed matching features (not a part of the segment attributes)
+    if sd: segment.source_features = sd.get('features')
+    if td: segment.target_features = td.get('features')
     return segment
 
   def _adjust_match(self, segment, domains, match):
@@ -0,0 +1,196 @@
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import os, sys
+sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..'))
+
+import logging
+import threading
+import queue
+import multiprocessing
+from collections import deque
+
+from TMDbApi import TMMap
+from TMDbApi.TMMonoLing import TMMonoLing
+from TMDbApi.TMQueryCache import TMQueryCache
+from TMDbApi.TMScriptFreeIngest import TMScriptFreeIngest
+from TMPreprocessor.Xml.TMXmlTagPreprocessor import TMXmlTagPreprocessor
+from Config.Config import G_CONFIG
+
+
+# Preprocessing stage of the pipeline, one instance per pool process
+class TMImportWorker:
+  _worker = None
+
+  def __init__(self):
+    self.tags_pp = TMXmlTagPreprocessor()
+    self.ml_index = TMMonoLing()
+    self.seg_map = TMMap.create('opensearch')
+
+  @staticmethod
+  def init():
+    TMImportWorker._worker = TMImportWorker()
+
+  @staticmethod
+  def process_batch(segments):
+    return TMImportWorker._worker.process(segments)
+
+  # Tag preprocessing (as done by TMXParser), token counts and docs of source, target and map
+  # indexes. Returns tuple of lists: segments, source docs, target docs, map docs
+  def process(self, segments):
+    out = ([], [], [], [])
+    for segment in segments:
+      for ftype in ['source', 'target']:
+        setattr(segment, ftype + '_text', self.tags_pp.process(getattr(segment, ftype + '_text')))
+        setattr(segment, ftype + '_id', None)
+        segment._allocate_id(ftype)
+      if not segment.source_id or not segment.target_id:
+        logging.warning("Skipping empty ( after processing ) segment: {}".format(segment.to_dict()))
+        continue
+      out[0].append(segment)
+      out[1].append(self.ml_index._segment2doc_upsert(segment, 'source'))
+      out[2].append(self.ml_index._segment2doc_upsert(segment, 'target'))
+      # Map doc includes token counts set by monolingual docs
+      out[3].append(self.seg_map._segment2doc(segment))
+    return out
+
+
+"""
+  @api {INFO} /TMImportPipeline TMImportPipeline -- Pipelined bulk import of segments
+  @apiName TMImportPipeline
+  @apiVersion 0.1.0
+  @apiGroup TMDbApi
+
+  @apiExample {curl} Example & Notes
+
+  # Stages, connected by bounded queues so that a slow stage blocks the preceding ones:
+  #  - parser (calling thread): reads segments not yet tag preprocessed
+  #    (TMXParser(..., preprocess=False)) and groups them into batches of 'batch_size'
+  #  - pool of 'workers' processes: tag preprocessing, token counts and docs (TMImportWorker),
+  #    up to 'workers' + 'queue_size' batches are in process
+  #  - writers: one thread per source, target and map indexes sending bulk requests, each
+  #    of them having up to 'queue_size' batches waiting
+  # See import.pipeline in the configuration. Writers use script-free ingest if 'script_free'
+  # is set, by default if import.script_free is enabled (see TMScriptFreeIngest).
+
+  pipeline = TMImportPipeline()
+  pipeline.run(TMXParser('file.tmx', preprocess=False).parse()) # --> number of imported segments
+"""
+class TMImportPipeline:
+  CONFIG = G_CONFIG.get_import_pipeline()
+  ENABLED = CONFIG['enabled']
+  WRITERS = ['source', 'target', 'map']
+
+  def __init__(self, workers=None, batch_size=None, queue_size=None, script_free=None):
+    self.workers = workers if workers else self.CONFIG['workers']
+    self.batch_size = batch_size if batch_size else self.CONFIG['batch_size']
+    self.queue_size = queue_size if queue_size else self.CONFIG['queue_size']
+    self.script_free = script_free if script_free is not None else TMScriptFreeIngest.ENABLED
+    self.errors = []
+    self.langs = set()
+    self._lock = threading.Lock()
+    self._seq = 0
+    self._pending = deque() # (sequence number, segments) of batches not yet written by all writers
+    self._written = dict([(w, -1) for w in self.WRITERS]) # writer -> sequence number of the last written batch
+
+  # If given, on_commit is called with segments of each batch written to all indices, in order of batches
+  def run(self, segments_iter, on_commit=None):
+    self.on_commit = on_commit
+    # Start processes before any thread to fork a single-threaded process
+    pool = multiprocessing.Pool(self.workers, initializer=TMImportWorker.init)
+    queues = dict([(w, queue.Queue(maxsize=self.queue_size)) for w in self.WRITERS])
+    threads = [threading.Thread(target=self._write, args=(w, queues[w]), daemon=True) for w in self.WRITERS]
+    for t in threads: t.start()
+    count = 0
+    try:
+      pending = deque()
+      for batch in self._batches(segments_iter):
+        pending.append(pool.apply_async(TMImportWorker.process_batch, (batch,)))
+        if len(pending) >= self.workers + self.queue_size:
+          count += self._dispatch(pending.popleft().get(), queues)
+      while pending:
+        count += self._dispatch(pending.popleft().get(), queues)
+    finally:
+      pool.terminate()
+      for w in self.WRITERS: queues[w].put(None)
+      for t in threads: t.join()
+    self._check_errors()
+    TMMap.create('opensearch').refresh()
+    for langs in self.langs:
+      TMQueryCache.invalidate(langs)
+    logging.info("Imported {} segments".format(count))
+    return count
+
+  def _batches(self, segments_iter):
+    batch = []
+    for segment in segments_iter:
+      batch.append(segment)
+      if len(batch) >= self.batch_size:
+        yield batch
+        batch = []
+    if batch: yield batch
+
+  # Pass processed batch to the writers, blocks while their queues are full
+  def _dispatch(self, processed, queues):
+    self._check_errors()
+    segments, source_docs, target_docs, map_docs = processed
+    if not segments: return 0
+    self.langs.update((s.source_language, s.target_language) for s in segments)
+    seq = self._seq
+    self._seq += 1
+    with self._lock:
+      self._pending.append((seq, segments))
+    queues['source'].put((seq, segments, source_docs))
+    queues['target'].put((seq, segments, target_docs))
+    queues['map'].put((seq, segments, map_docs))
+    return len(segments)
+
+  def _write(self, writer, q):
+    index = TMMap.create('opensearch', script_free=self.script_free) if writer == 'map' else TMMonoLing(script_free=self.script_free)
+    while True:
+      item = q.get()
+      if item is None: return
+      # After a failure keep consuming to not block the dispatcher, which stops on the error
+      if self.errors: continue
+      seq, segments, docs = item
+      try:
+        if writer == 'map':
+          index.add_segments(segments, docs)
+        else:
+          index.add_segments(segments, writer, docs)
+        self._commit(writer, seq)
+      except Exception as e:
+        logging.error("Failed to write {} segments: {}".format(writer, e))
+        self.errors.append(e)
+
+  # Batches are committed once written by all writers (each of them writes batches in order)
+  def _commit(self, writer, seq):
+    with self._lock:
+      self._written[writer] = seq
+      committed = min(self._written.values())
+      while self._pending and self._pending[0][0] <= committed:
+        seq, segments = self._pending.popleft()
+        if self.on_commit: self.on_commit(segments)
+
+  def _check_errors(self):
+    if self.errors: raise self.errors[0]
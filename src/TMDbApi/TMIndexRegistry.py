@@ -0,0 +1,102 @@
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import re
+import logging
+import threading
+import networkx
+from timeit import default_timer as timer
+
+from TMDbApi.TMUtils import TMUtils
+from Config.Config import G_CONFIG
+
+
+# Process-wide registry of existing tm_* and map_* indices. Answers index existence,
+# map direction (swap) and language graph questions from memory instead of issuing
+# HEAD/GET requests to OpenSearch on every query. The list of indices is reloaded
+# once it is older than TTL seconds or after invalidate() is called.
+class TMIndexRegistry:
+  TTL = G_CONFIG.get_index_registry_ttl()
+
+  _lock = threading.Lock()
+  _indexes = None
+  _lang_graph = None
+  _ts = None
+
+  @classmethod
+  def indexes(cls, es):
+    cls._load(es)
+    return cls._indexes
+
+  @classmethod
+  def index_exists(cls, es, index):
+    return index in cls.indexes(es)
+
+  # Returns tuple (index_name, is_swapped) or (None, None) if neither direct nor reverse map index exists
+  @classmethod
+  def map_index(cls, es, source_lang, target_lang):
+    m_index = TMUtils.es_index2mapdb(TMUtils.lang2es_index(source_lang),
+                                     TMUtils.lang2es_index(target_lang))
+    indexes = cls.indexes(es)
+    if m_index in indexes: return m_index,False
+    r_index = TMUtils.es_index2mapdb(TMUtils.lang2es_index(target_lang),
+                                     TMUtils.lang2es_index(source_lang))
+    if r_index in indexes: return r_index,True
+    return None,None
+
+  @classmethod
+  def lang_graph(cls, es):
+    cls._load(es)
+    return cls._lang_graph
+
+  @classmethod
+  def mono_langs(cls, es):
+    return [TMUtils.es_index2lang(l) for l in cls.indexes(es) if re.search('^tm_\w{2}$', l)]
+
+  # Should be called after creating or deleting an index
+  @classmethod
+  def invalidate(cls):
+    with cls._lock:
+      cls._ts = None
+
+  @classmethod
+  def _is_stale(cls):
+    return cls._ts is None or timer() - cls._ts >= cls.TTL
+
+  @classmethod
+  def _load(cls, es):
+    if not cls._is_stale(): return
+    with cls._lock:
+      # Another thread might have reloaded it while we were waiting for the lock
+      if not cls._is_stale(): return
+      indexes = frozenset(es.indices_get_all())
+      lang_graph = networkx.Graph()
+      # Build language connection graph
+      for index in indexes:
+        m = re.search('map_([a-z]{2})_([a-z]{2})', index)
+        if m:
+          lang_graph.add_edge(m.group(1), m.group(2))
+      cls._indexes = indexes
+      cls._lang_graph = lang_graph
+      cls._ts = timer()
+      logging.debug("Index registry reloaded: {} indices".format(len(indexes)))
@@ -24,12 +24,21 @@
 import datetime
 import re
 from TMDbApi.TMUtils import TMUtils
+from Config.Config import G_CONFIG
 # Bidirectional map abstract class
 class TMMap:
+  # Denormalized map docs also store POS & token counts of source and target
+  DENORMALIZED = G_CONFIG.get_map_layout() == 'denormalized'
+  DENORMALIZED_FIELDS = ['source_pos', 'target_pos', 'source_token_cnt', 'target_token_cnt']
+  # Normalized text hashes for exact match lookup (see TMUtils.text_hash) and
+  # text & contexts hashes for in-context match lookup (see TMUtils.context_hash)
+  HASH_FIELDS = ['source_hash', 'target_hash', 'source_context_hash', 'target_context_hash']
+  EXACT_MATCH = G_CONFIG.get_exact_match()
+
   def add_segment(self, segment):
     pass
   # Bulk addition
-  def add_segments(self, segments):
+  def add_segments(self, segments, docs=None):
     pass
 
   # Get target id by looking for a mapping
@@ -39,6 +48,28 @@ class TMMap:
   def delete(self, source_lang, target_lang, source_ids):
     pass
 
+  # Id of the map doc of the segment
+  def doc_id(self, segment):
+    pass
+
+  # Get map docs having exactly the given (normalized) source texts
+  def mget_exact(self, source_lang, target_lang, texts, source_metadata=None, target_metadata=None, domains=None):
+    pass
+
+
+  @staticmethod
+  def text_hash(text):
+    return TMUtils.text_hash(text, TMMap.EXACT_MATCH['casefold'])
+
+  @staticmethod
+  def context_hash(text, metadata):
+    return TMUtils.context_hash(text, metadata, TMMap.EXACT_MATCH['casefold'])
+
+  def _hash_fields(self, segment):
+    return {'source_hash': self.text_hash(segment.source_text),
+            'target_hash': self.text_hash(segment.target_text),
+            'source_context_hash': self.context_hash(segment.source_text, segment.source_metadata),
+            'target_context_hash': self.context_hash(segment.target_text, segment.target_metadata)}
 
   # Convert segment to mapping doc
   def _segment2doc(self, segment):
@@ -48,7 +79,7 @@ class TMMap:
     if not segment.check_date: segment.check_date = TMUtils.date2str(datetime.datetime(1970, 1, 1))
     segment.update_date = now_str
 
-    return {'source_id': segment.source_id,
+    doc = {'source_id': segment.source_id,
             'target_id': segment.target_id,
             'source_text': segment.source_text,
             'target_text': segment.target_text,
@@ -71,5 +102,9 @@ class TMMap:
             'check_version': segment.check_version,
             'dirty_score': segment.dirty_score,
             'username': segment.username
-
             }
+    doc.update(self._hash_fields(segment))
+    if self.DENORMALIZED:
+      for f in self.DENORMALIZED_FIELDS:
+        doc[f] = getattr(segment, f)
+    return doc
@@ -30,23 +30,28 @@ import networkx
 from TMDbApi.TMMap.TMMap import TMMap
 from TMDbApi.TMUtils import TMUtils, TMTimer
 from TMDbApi.TMDbQuery import TMDbQuery
+from TMDbApi.TMIndexRegistry import TMIndexRegistry
 
 from opensearchpy import Q
 from helpers.OpenSearchHelper import OpenSearchHelper
+from TMDbApi.TMScriptFreeIngest import TMScriptFreeIngest
 
 
 class TMMapES(TMMap):
   UPSERT_SCRIPT='upsert_segment'
-
-  def __init__(self):
+  # Resolve source ids sharing the same index & filters by a single terms query (mget).
+  # If False, each source id is resolved by its own sub-search
+  MGET_TERMS = True
+  MGET_TERMS_SIZE = 1000 # max number of source ids in a single terms query
+  MGET_MULTIPLE_SIZE = 10 # max number of map docs per source id (return_multiple)
+
+  # script_free: write new docs by TMScriptFreeIngest (import jobs only)
+  def __init__(self, script_free=False):
     self.es = OpenSearchHelper()
     self.DOC_TYPE = 'id_map'
     self.scan_size = 9999999
-
-    self.refresh_lang_graph()
-    self.es.indices_put_template(name='map_template', body=self._index_template())
-    self.es.indices_put_mapping(index="{}*".format(TMUtils.MAP_PREFIX), body=self._update_mapping_script())
-    self.es.put_script(index=TMMapES.UPSERT_SCRIPT, body=self._upsert_script())
+    # Index template, mapping and upsert script are applied once by TMSchema
+    self.ingest = TMScriptFreeIngest(self.es, self._merge_docs, self._doc_upsert) if script_free else None
 
     self.timer = TMTimer("TMMapES")
 
@@ -60,35 +65,40 @@ class TMMapES(TMMap):
                               ignore=409) # don't throw exception if a document already exists
     return s_result
 
-  def add_segments(self, segments):
+  # Docs (one per segment) might be precomputed by _segment2doc
+  def add_segments(self, segments, docs=None):
     if not segments:
       return
+    # Bulk operation, actions are generated while being sent
+    self.timer.start("add_segment:es_index")
+    if self.ingest:
+      s_result = self.ingest.bulk(self._segment2docs(segments, docs))
+    else:
+      s_result = self.es.bulk(self._segment2actions(segments, docs))
+    self.timer.stop("add_segment:es_index")
+    logging.info("Bulk upsert (map): {} docs".format(s_result[0]))
+    return s_result
 
-    actions = []
-    for segment in segments:
+  def _segment2actions(self, segments, docs):
+    for m_index, id, doc in self._segment2docs(segments, docs):
+      yield {'_id': id,
+             '_index' : m_index,
+             '_op_type': 'update',
+             '_source' : self._doc_upsert(doc),
+             'retry_on_conflict': OpenSearchHelper.RETRY_ON_CONFLICT,
+             }
+
+  # Yields (index, id, doc) of each segment
+  def _segment2docs(self, segments, docs):
+    for i, segment in enumerate(segments):
       self.timer.start("add_segment:get_index")
       m_index, swap = self._get_index(segment.source_language, segment.target_language, create_missing=True)
       self.timer.stop("add_segment:get_index")
       self.timer.start("add_segment:segment2doc")
-      doc = self._segment2doc(segment)
+      doc = docs[i] if docs is not None else self._segment2doc(segment)
       if swap: self._swap(doc)
-      upsert_doc = self._doc_upsert(doc)
       self.timer.stop("add_segment:segment2doc")
-      self.timer.start("add_segment:swap_doc")
-      self.timer.stop("add_segment:swap_doc")
-      action = {'_id': self._allocate_id(segment, swap),
-                '_index' : m_index,
-                '_op_type': 'update',
-                '_source' : upsert_doc,
-                }
-      actions.append(action)
-    # Bulk operation
-    logging.info("Bulk upsert (map): {}".format(actions))
-    
-    self.timer.start("add_segment:es_index")
-    s_result = self.es.bulk(actions)
-    self.timer.stop("add_segment:es_index")
-    return s_result
+      yield m_index, self._allocate_id(segment, swap), doc
 
   def count_scan(self, langs, filter = None):
     query,swap = self._create_query(langs, filter)
@@ -120,8 +130,62 @@ class TMMapES(TMMap):
     if swap: ret_doc = self._swap(ret_doc)
     return uuid.UUID(ret_doc['target_id']),ret_doc
 
-  # multi-get (bidirectional)
+  # multi-get (bidirectional). Returns list of map docs in the same order as id_langs,
+  # None for each source id not found. If return_multiple is set, all map docs for each
+  # source id are returned (flattened). Source ids of missing indexes are skipped
   def mget(self, id_langs, return_multiple=False):
+    if not self.MGET_TERMS: return self._mget_per_id(id_langs, return_multiple)
+    if not id_langs: return []
+    # Group source ids by index and filters preserving the order of requests
+    groups = dict()
+    requests = []
+    for source_id,source_lang,target_lang,source_metadata,target_metadata,domains in id_langs:
+      m_index,swap = self._get_index(source_lang, target_lang)
+      if not m_index: continue
+      key = (m_index, swap, self._metadata_key(source_metadata), self._metadata_key(target_metadata),
+             tuple(domains) if domains else None)
+      group = groups.setdefault(key, (source_metadata, target_metadata, domains, []))
+      source_id = str(source_id)
+      if source_id not in group[3]: group[3].append(source_id)
+      requests.append((key, source_id))
+
+    msearch = self.es.multi_search()
+    search_keys = []
+    for key,(source_metadata, target_metadata, domains, source_ids) in groups.items():
+      m_index,swap = key[:2]
+      for i in range(0, len(source_ids), self.MGET_TERMS_SIZE):
+        msearch = msearch.add(self._create_terms_search(m_index, swap, source_ids[i:i+self.MGET_TERMS_SIZE],
+                                                        source_metadata, target_metadata, domains, return_multiple))
+        search_keys.append(key)
+
+    # Regroup map docs by source id
+    id2docs = dict()
+    for res,key in zip(msearch.execute() if search_keys else [], search_keys):
+      swap = key[1]
+      try:
+        for hit in res:
+          docs = hit.meta.inner_hits.docs if return_multiple else [hit]
+          for ret_doc in docs:
+            # Exchange source and target (if needed)
+            if swap: ret_doc = self._swap(ret_doc)
+            id2docs.setdefault((key, ret_doc['source_id']), []).append(ret_doc)
+      except:
+        # Exception is thrown if Response is in some invalid state (no hits, hits are empty)
+        logging.warning("Invalid Response object: {}".format(res.to_dict()))
+
+    results = []
+    for key,source_id in requests:
+      docs = id2docs.get((key, source_id))
+      if not docs:
+        results.append(None)
+      elif return_multiple:
+        results += docs
+      else:
+        results.append(docs[0])
+    return results
+
+  # multi-get (bidirectional) by a sub-search per source id
+  def _mget_per_id(self, id_langs, return_multiple=False):
     if not id_langs: return []
     msearch = self.es.multi_search()
     search_swap = []
@@ -153,6 +217,117 @@ class TMMapES(TMMap):
         continue
     return results
 
+  # Exact match lookup by normalized text hash: a single terms search for all texts,
+  # collapsed by hash. Returns list of map docs (up to MGET_MULTIPLE_SIZE) for each text
+  def mget_exact(self, source_lang, target_lang, texts, source_metadata=None, target_metadata=None, domains=None):
+    m_index,swap = self._get_index(source_lang, target_lang)
+    if not m_index or not texts: return [[] for text in texts]
+
+    prefix = "source" if not swap else "target"
+    hash_field = "{}_hash".format(prefix)
+    hashes = [self.text_hash(text) for text in texts]
+    unique_hashes = list(dict.fromkeys(hashes))
+    search = self.es.search(index=m_index)
+    search = search.filter('terms', **{hash_field: unique_hashes})
+    search = self._add_filters(search, swap, source_metadata, target_metadata, domains, source_texts=texts)
+    search = search.extra(collapse={'field': hash_field,
+                                    'inner_hits': {'name': 'docs', 'size': self.MGET_MULTIPLE_SIZE}})
+
+    hash2docs = dict()
+    for res in self.es.multi_search().add(search[:len(unique_hashes)]).execute():
+      # Error is returned e.g. if hash field is not mapped yet
+      if hasattr(res, 'error'):
+        logging.warning("Exact match lookup failed: {}".format(res.error))
+        continue
+      for hit in res:
+        for ret_doc in hit.meta.inner_hits.docs:
+          ret_doc = ret_doc.to_dict()
+          # Exchange source and target (if needed)
+          if swap: ret_doc = self._swap(ret_doc)
+          hash2docs.setdefault(ret_doc['source_hash'], []).append(ret_doc)
+    return [hash2docs.get(h, []) for h in hashes]
+
+  # Full-text search of map docs (denormalized layout), one search per query. Filters are
+  # monolingual ones, i.e. token count range of the source text. Returns list of map docs
+  # for each query
+  def mquery(self, source_lang, target_lang, limit, q_list, filters, source_metadata=None, target_metadata=None, domains=None):
+    m_index,swap = self._get_index(source_lang, target_lang)
+    if not m_index: return [[] for q in q_list]
+
+    prefix = "source" if not swap else "target"
+    msearch = self.es.multi_search()
+    for q,f in zip(q_list, filters):
+      search = self.es.search(index=m_index).query('match', **{'{}_text.search'.format(prefix): q})
+      if f.get('token_cnt'):
+        search = search.filter('range', **{'{}_token_cnt'.format(prefix): f['token_cnt']})
+      search = self._add_filters(search, swap, source_metadata, target_metadata, domains)
+      msearch = msearch.add(search[:limit])
+
+    results = []
+    for res in msearch.execute():
+      docs = []
+      if not hasattr(res, 'error'):
+        for hit in res:
+          doc = hit.to_dict()
+          if swap: doc = self._swap(doc)
+          docs.append(doc)
+      results.append(docs)
+    return results
+
+  def doc_id(self, segment):
+    m_index, swap = self._get_index(segment.source_language, segment.target_language)
+    return self._allocate_id(segment, swap)
+
+  # Update denormalized fields (POS & token counts) of existing map docs
+  def update_denormalized(self, segments):
+    actions = []
+    for segment in segments:
+      m_index,swap = self._get_index(segment.source_language, segment.target_language)
+      if not m_index: continue
+      doc = {f: getattr(segment, f) for f in self.DENORMALIZED_FIELDS}
+      if swap: self._swap(doc)
+      actions.append({'_id': self._allocate_id(segment, swap),
+                      '_index': m_index,
+                      '_op_type': 'update',
+                      'doc': doc,
+                      'retry_on_conflict': OpenSearchHelper.RETRY_ON_CONFLICT
+                      })
+    if not actions: return
+    return self.es.bulk(actions)
+
+  # Update (backfill) hash fields of existing map docs
+  def update_hashes(self, segments):
+    actions = []
+    for segment in segments:
+      m_index,swap = self._get_index(segment.source_language, segment.target_language)
+      if not m_index: continue
+      doc = self._hash_fields(segment)
+      if swap: self._swap(doc)
+      actions.append({'_id': self._allocate_id(segment, swap),
+                      '_index': m_index,
+                      '_op_type': 'update',
+                      'doc': doc,
+                      'retry_on_conflict': OpenSearchHelper.RETRY_ON_CONFLICT
+                      })
+    if not actions: return
+    return self.es.bulk(actions)
+
+  # Migrate existing map index to denormalized layout: add text analyzer and mapping
+  # of denormalized fields. Analysis settings can be updated only on a closed index
+  def migrate_layout(self, langs):
+    m_index,swap = self._get_index(langs[0], langs[1])
+    if not m_index: return
+    settings, props = self._denormalized_mapping()
+    index_settings = self.es.indices_get_settings(m_index)[m_index]['settings']['index']
+    if 'folding' not in index_settings.get('analysis', {}).get('analyzer', {}):
+      self.es.indices_close(m_index)
+      try:
+        self.es.indices_put_settings(m_index, settings)
+      finally:
+        self.es.indices_open(m_index)
+    # Don't use helper's indices_put_mapping() as it ignores errors (e.g. mapping conflicts)
+    self.es.es.indices.put_mapping(index=m_index, body={"properties": props})
+
 
   def delete(self, langs, docs, filter, force_delete=False):
     source_lang, target_lang = langs
@@ -283,23 +458,24 @@ class TMMapES(TMMap):
     doc['check_date'] = TMUtils.date2str(datetime.datetime(1970, 1, 1))
     return doc
 
-  # Build & return language graph
+  # Return language graph (cached in index registry)
   def get_lang_graph(self):
-    self.refresh()
-    lang_graph = networkx.Graph()
-    # Build language connection graph
-    for index in self.indexes:
-      m = re.search('map_([a-z]{2})_([a-z]{2})', index)
-      if m:
-        lang_graph.add_edge(m.group(1), m.group(2))
-    return lang_graph
+    return TMIndexRegistry.lang_graph(self.es)
+
+  @property
+  def lang_graph(self):
+    return self.get_lang_graph()
+
+  @property
+  def indexes(self):
+    return TMIndexRegistry.indexes(self.es)
 
   # Should be called after modifying the index
   def refresh(self):
-    self.indexes = self.es.indices_get_all()
+    TMIndexRegistry.invalidate()
 
   def refresh_lang_graph(self):
-    self.lang_graph = self.get_lang_graph()
+    self.refresh()
 
   # Get list of all values (aggregated) for the given field
   def get_aggr_values(self, field, langs, filter):
@@ -320,17 +496,30 @@ class TMMapES(TMMap):
     if not m_index: return None,None
 
     prefix = "source" if not swap else "target"
-    reverse_prefix = "target" if not swap else "source"
 
     search = self.es.search(index=m_index)
+    search = search.filter('match_phrase', **{"{}_id.keyword".format(prefix): source_id})
+    return self._add_filters(search, swap, source_metadata, target_metadata, domains),swap
+
+  # Add context (metadata) and domain filters to the search. If source texts of the searched
+  # docs are known (exact match), source contexts are filtered by a single terms filter
+  # on context hashes
+  def _add_filters(self, search, swap, source_metadata=None, target_metadata=None, domains=None, source_texts=None):
+    prefix = "source" if not swap else "target"
+    reverse_prefix = "target" if not swap else "source"
 
     def add_filter(key, value):
       if value is None: return search
       return search.filter('match_phrase', **{key: value})
 
-    search = add_filter("{}_id.keyword".format(prefix), source_id)
-
-    if source_metadata:
+    # Source texts are known (exact match lookup): filter by a single term of text & contexts hash
+    # instead of phrase matching of contexts. Only if both contexts are given, as the hash covers both
+    context_hashes = None
+    if source_texts and source_metadata and all(source_metadata.get(c) is not None for c in ['context_before', 'context_after']):
+      context_hashes = [self.context_hash(text, source_metadata) for text in source_texts]
+    if context_hashes:
+      search = search.filter('terms', **{'{}_context_hash'.format(prefix): list(dict.fromkeys(context_hashes))})
+    elif source_metadata:
       search = add_filter('{}_metadata.context_before'.format(prefix), source_metadata.get('context_before'))
       search = add_filter('{}_metadata.context_after'.format(prefix), source_metadata.get('context_after'))
     if target_metadata:
@@ -342,7 +531,26 @@ class TMMapES(TMMap):
         'domain.keyword': domains
       })
 
-    return search,swap
+    return search
+
+  # Search for map docs of multiple source ids, collapsed by source id: top hit of each source id
+  # is returned and, if return_multiple is set, all its docs (up to MGET_MULTIPLE_SIZE) as inner hits
+  def _create_terms_search(self, m_index, swap, source_ids, source_metadata=None, target_metadata=None, domains=None, return_multiple=False):
+    prefix = "source" if not swap else "target"
+    id_field = "{}_id.keyword".format(prefix)
+    search = self.es.search(index=m_index)
+    search = search.filter('terms', **{id_field: source_ids})
+    search = self._add_filters(search, swap, source_metadata, target_metadata, domains)
+    collapse = {'field': id_field}
+    if return_multiple:
+      collapse['inner_hits'] = {'name': 'docs', 'size': self.MGET_MULTIPLE_SIZE}
+    return search.extra(collapse=collapse)[:len(source_ids)]
+
+  # Hashable representation of metadata filter (only contexts are used for filtering)
+  @staticmethod
+  def _metadata_key(metadata):
+    if not metadata: return None
+    return (metadata.get('context_before'), metadata.get('context_after'))
 
   def _create_search_mindexes(self, source_id, source_lang, target_langs):
     m_indexes = [self._get_index(source_lang, tgt_lang)[0] for tgt_lang in target_langs] # take only m_index, swap is not interested
@@ -357,19 +565,24 @@ class TMMapES(TMMap):
 
   # Returns tuple (index_name, is_swapped)
   def _get_index(self, source_lang, target_lang, create_missing=False):
+    # Direct or reverse index (if found)
+    m_index,swap = TMIndexRegistry.map_index(self.es, source_lang, target_lang)
+    if m_index or not create_missing: return m_index,swap
+    # Make sure the index wasn't created by another process since the last registry reload
+    TMIndexRegistry.invalidate()
+    m_index,swap = TMIndexRegistry.map_index(self.es, source_lang, target_lang)
+    if m_index: return m_index,swap
+    # Neither direct, nor reverse index exist - create a direct one
     m_index = TMUtils.es_index2mapdb(TMUtils.lang2es_index(source_lang),
                                      TMUtils.lang2es_index(target_lang))
-
-    if self.es.indices_exists(index=m_index): return m_index,False
-    # Try reverse index
-    r_index = TMUtils.es_index2mapdb(TMUtils.lang2es_index(target_lang),
-                                     TMUtils.lang2es_index(source_lang))
-    # Found reverse index - use it
-    if self.es.indices_exists(r_index): return r_index,True
-    if not create_missing: return None,None
-    # Neither direct, nor reverse index exist - create a direct one
+    # New index gets the same mapping TMSchema puts on existing map indices
+    body = {"mappings": self._update_mapping_script()}
+    if self.DENORMALIZED:
+      settings, props = self._denormalized_mapping()
+      body["settings"] = settings
+      body["mappings"]["properties"].update(props)
     try:
-      self.es.indices_create(index=m_index, body={})
+      self.es.indices_create(index=m_index, body=body)
     except:
       pass
     self.refresh_lang_graph()
@@ -390,9 +603,11 @@ class TMMapES(TMMap):
     return uuid.uuid5(uuid.NAMESPACE_URL, istr)
 
   def _swap(self, doc):
-    for field in ['id', 'language', 'text']:
+    for field in ['id', 'language', 'text', 'pos', 'token_cnt', 'hash', 'context_hash']:
       src = 'source_' + field
       tgt = 'target_' + field
+      # Denormalized and hash fields might be missing
+      if src not in doc and tgt not in doc: continue
       # Exchange source and target
       tmp = doc[src]
       doc[src] = doc[tgt]
@@ -415,6 +630,24 @@ class TMMapES(TMMap):
     #print("UPSERT BODY: {}".format(upsert_body))
     return upsert_body
 
+  # Client-side equivalent of the upsert script (see _upsert_script): merge new doc of the same segment into doc
+  def _merge_docs(self, doc, new_doc):
+    doc = dict(doc)
+    for attr in TMDbQuery.list_attrs:
+      values = new_doc.get(attr)
+      if values is None: continue
+      if doc.get(attr) is None:
+        doc[attr] = values
+        continue
+      doc[attr] = list(doc[attr])
+      for value in values:
+        if value not in doc[attr]: doc[attr].append(value)
+    doc['dirty_score'] = new_doc.get('dirty_score')
+    doc['update_date'] = new_doc.get('update_date')
+    for attr in TMMap.DENORMALIZED_FIELDS + TMMap.HASH_FIELDS:
+      if new_doc.get(attr) is not None: doc[attr] = new_doc[attr]
+    return doc
+
 
   def _index_template(self):
     props = dict()
@@ -433,7 +666,7 @@ class TMMapES(TMMap):
               "format": "basic_date_time_no_millis"
             }
 
-    for f in TMDbQuery.str_attrs + ["check_version"]:
+    for f in TMDbQuery.str_attrs + ["check_version"] + TMMap.HASH_FIELDS:
       props[f] = {
         "type": "keyword",
         "index": "true"
@@ -453,8 +686,51 @@ class TMMapES(TMMap):
           }
         }
     }
+    if self.DENORMALIZED:
+      settings, denormalized_props = self._denormalized_mapping()
+      props.update(denormalized_props)
+      template["template"]["settings"] = settings
     return template
 
+  # Settings and mapping of denormalized layout: source & target texts get additional
+  # analyzed subfield for full-text search. Text fields are mapped the same way as
+  # OpenSearch maps them dynamically (text + keyword) to allow updating existing indices
+  def _denormalized_mapping(self):
+    settings = {
+      "analysis": {
+        "analyzer": {
+          "folding": {
+            "tokenizer": "standard",
+            "filter": ["lowercase", "asciifolding"]
+          }
+        }
+      }
+    }
+    props = dict()
+    for t in ['source', 'target']:
+      props[t + '_text'] = {
+        "type": "text",
+        "fields": {
+          "keyword": {
+            "type": "keyword",
+            "ignore_above": 256
+          },
+          "search": {
+            "type": "text",
+            "analyzer": "folding"
+          }
+        }
+      }
+      props[t + '_pos'] = {
+        "type": "keyword",
+        "index": "true"
+      }
+      props[t + '_token_cnt'] = {
+        "type": "integer",
+        "index": "true"
+      }
+    return settings, props
+
 
   def _upsert_script(self):
     script = ''
@@ -474,8 +750,11 @@ class TMMapES(TMMap):
       ctx._source.{} = [params.source.{}]; }} """.format(*([attr]*9))
       #script += 'ctx._source.{} = (ctx._source.{}) ? new HashSet(ctx._source.{} + [params.source.{}]): [params.source.{}]; '.format(*([attr]*5))
     #script += script + 'ctx._source.dirty_score = dirty_score ? dirty_score : ctx._source.dirty_score;'
-    script += script + 'ctx._source.dirty_score = params.source.dirty_score;' # Alex decided: If no rule was applied, then dirty_score = 0
-    script += script + 'ctx._source.update_date = params.source.update_date;'
+    script += 'ctx._source.dirty_score = params.source.dirty_score;' # Alex decided: If no rule was applied, then dirty_score = 0
+    script += 'ctx._source.update_date = params.source.update_date;'
+    # Denormalized and hash fields (if given) are overwritten by the latest values
+    for attr in TMMap.DENORMALIZED_FIELDS + TMMap.HASH_FIELDS:
+      script += 'if (params.source.{} != null) {{ ctx._source.{} = params.source.{}; }} '.format(*([attr]*3))
     # print(script)
     #return {'script': { 'inline': script, 'lang': 'painless' } }
     return {'script': { 'source': script, 'lang': 'painless' } }
@@ -483,6 +762,18 @@ class TMMapES(TMMap):
   def _update_mapping_script(self):
     return {
       "properties": {
+        "source_hash": {
+          "type": "keyword"
+        },
+        "target_hash": {
+          "type": "keyword"
+        },
+        "source_context_hash": {
+          "type": "keyword"
+        },
+        "target_context_hash": {
+          "type": "keyword"
+        },
         "domain": {
           "type": "text",
           "fielddata": True,
@@ -22,7 +22,7 @@
 # under the License.
 #
 import os, sys
-sys.path.insert(0, sys.path.append(os.path.dirname(__file__)))
+sys.path.append(os.path.dirname(__file__))
 
 '''
 Dealing with no UUID serialization support in json
@@ -46,7 +46,7 @@ JSONEncoder.default = JSONEncoder_newdefault
 import TMMapES
 
 # Factory method
-def create(engine):
+def create(engine, **kwargs):
   # FIXME: figure
   engine_map = {
     'opensearch': TMMapES.TMMapES,
@@ -54,4 +54,4 @@ def create(engine):
   if not engine in engine_map:
     raise (Exception('Unsupported MapDB engine: {}, supported ones are {}'.format(engine, engine_map.keys())))
 
-  return engine_map[engine]()
+  return engine_map[engine](**kwargs)
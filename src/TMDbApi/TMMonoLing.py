@@ -37,37 +37,47 @@ from TMDbApi.TMDbQuery import TMDbQuery
 from TMPosTagger.TMTokenizer import TMTokenizer
 from TMPreprocessor.TMRegExpPreprocessor import TMRegExpPreprocessor
 from TMMatching.TMRegxMatch import TMRegexMatch
+from TMMatching.TMMatchingFeatures import TMMatchingFeatures
+from TMDbApi.TMIndexRegistry import TMIndexRegistry
 from helpers.OpenSearchHelper import OpenSearchHelper
+from TMDbApi.TMScriptFreeIngest import TMScriptFreeIngest
+from Config.Config import G_CONFIG
 
 
 # API class for translation memories DB
 class TMMonoLing:
   DOC_TYPE = 'tm'
+  MATCHING_FEATURES = G_CONFIG.get_matching_features()
 
-  def __init__(self, **kwargs):
+  # script_free: write new docs by TMScriptFreeIngest (import jobs only)
+  def __init__(self, script_free=False, **kwargs):
     self.es = OpenSearchHelper()
-    # Put default index template
-    self.es.indices_put_template(name='tm_template', body = self._index_template())
-    self.refresh()
+    # Index template is applied once by TMSchema
 
     #self.preprocessors = dict()
     self.tokenizers = dict()
     self.regex = dict()
+    self.ingest = TMScriptFreeIngest(self.es, self._merge_docs, self._doc_upsert) if script_free else None
 
   # Add new segment
   def add_segment(self, segment, ftype):
     # Add segment source and target texts to the correspondent index of OpenSearch
     id = getattr(segment, ftype + '_id')
     index = TMUtils.lang2es_index(getattr(segment, ftype + '_language'))
+    if not self.index_exists(index):
+      self._create_index(index)
+      self.refresh()
     s_result = self.es.index(index=index,
                              id=id,
                              body=self._segment2doc(segment, ftype))
     return id
 
-  # Bulk segment addition
-  def add_segments(self, segments, ftype):
+  # Bulk segment addition. Docs (one per segment) might be precomputed by _segment2doc_upsert
+  def add_segments(self, segments, ftype, docs=None):
+    if self.ingest:
+      return self._segment2es_ingest(segments, ftype, docs)
     # Bulk insert
-    return self._segment2es_bulk(segments, ftype, 'update', self._segment2doc_upsert)
+    return self._segment2es_bulk(segments, ftype, 'update', self._segment2doc_upsert, docs)
 
   # Search for top matching segments
   def query(self, lang, qstring, filter = None):
@@ -158,37 +168,67 @@ class TMMonoLing:
 
   # Should be called after modifying the index
   def refresh(self):
-    #self.indexes = self.es.indices.get_aliases() #not supported anymore
-    self.indexes = self.es.indices_get_all()
+    TMIndexRegistry.invalidate()
+
+  @property
+  def indexes(self):
+    return TMIndexRegistry.indexes(self.es)
 
   def index_exists(self, index):
-    return self.es.indices_exists(index)
+    return TMIndexRegistry.index_exists(self.es, index)
 
   def get_langs(self):
-    return [TMUtils.es_index2lang(l) for l in self.indexes if re.search('^tm_\w{2}$', l)]
+    return TMIndexRegistry.mono_langs(self.es)
 
   ############### Helper methods ###################
-  def _segment2es_bulk(self, segments, ftype, op_type, f_action):
+  def _segment2es_bulk(self, segments, ftype, op_type, f_action, docs=None):
     # Add segment source and target texts to the correspondent index of OpenSearch in a batch
-    actions = []
+    new_indexes = set()
+    # Bulk insert, actions are generated while being sent
+    s_result = self.es.bulk(self._segment2es_actions(segments, ftype, op_type, f_action, docs, new_indexes))
+    logging.info("Bulk upsert ({}): {} docs".format(ftype, s_result[0]))
+    if new_indexes: self.refresh() # refresh list of indexes (was created during insert)
+    return s_result
+
+  def _segment2es_actions(self, segments, ftype, op_type, f_action, docs, new_indexes):
     added_ids = set()
-    for segment in segments:
+    for i, segment in enumerate(segments):
       id = getattr(segment, ftype + '_id')
       if id in added_ids: continue # avoid duplicates in the same batch
       added_ids.add(id)
-      index = TMUtils.lang2es_index(getattr(segment, ftype + '_language'))
       action = {'_id': id,
-                '_index' : index,
+                '_index' : self._segment2es_index(segment, ftype, new_indexes),
                 '_op_type': op_type,
-                '_source' : f_action(segment, ftype) #self._segment2doc(segment, ftype)
+                '_source' : docs[i] if docs is not None else f_action(segment, ftype) #self._segment2doc(segment, ftype)
                 }
-      actions.append(action)
-    # Bulk insert
-    logging.info("Bulk upsert: {}".format(actions))
-    s_result = self.es.bulk(actions)
-    self.refresh() # refresh list of indexes (could have been created during insert)
+      if op_type == 'update': action['retry_on_conflict'] = OpenSearchHelper.RETRY_ON_CONFLICT
+      yield action
+
+  # Script-free bulk insert (see TMScriptFreeIngest). Precomputed docs are upsert bodies
+  def _segment2es_ingest(self, segments, ftype, docs=None):
+    new_indexes = set()
+    s_result = self.ingest.bulk((self._segment2es_index(segment, ftype, new_indexes),
+                                 getattr(segment, ftype + '_id'),
+                                 docs[i]['upsert'] if docs is not None else self._segment2doc(segment, ftype))
+                                for i, segment in enumerate(segments))
+    logging.info("Bulk insert ({}): {} docs, {}".format(ftype, s_result[0], self.ingest.stats))
+    if new_indexes: self.refresh() # refresh list of indexes (was created during insert)
     return s_result
 
+  def _segment2es_index(self, segment, ftype, new_indexes):
+    index = TMUtils.lang2es_index(getattr(segment, ftype + '_language'))
+    if index not in new_indexes and not self.index_exists(index):
+      self._create_index(index)
+      new_indexes.add(index)
+    return index
+
+  # New index gets the same mapping TMSchema puts on existing indexes, other fields are mapped dynamically
+  def _create_index(self, index):
+    try:
+      self.es.indices_create(index=index, body={"mappings": self._update_mapping()})
+    except:
+      pass # created by another process in the meantime
+
   def _segment2doc(self, segment, ftype):
     text_pos = getattr(segment, ftype + '_pos')
     doc = {'text': getattr(segment, ftype + '_text')}
@@ -200,25 +240,43 @@ class TMMonoLing:
     # Auxiliary field to facilitate language matrix generation
     doc['target_language'] = [TMUtils.lang2short(TMUtils.str2list(getattr(segment, op_ftype + '_language'))[0])]
     doc['token_cnt'] = self.token_count(getattr(segment, ftype + '_text'), getattr(segment, ftype + '_language'))
+    # Keep token count in the segment to be reused by denormalized map docs
+    setattr(segment, ftype + '_token_cnt', doc['token_cnt'])
+    # Precomputed matching features (see TMMatchingFeatures)
+    if self.MATCHING_FEATURES:
+      doc['features'] = TMMatchingFeatures.compute(doc['text'], getattr(segment, ftype + '_language'))
     return doc
 
   def _segment2doc_upsert(self, segment, ftype):
-    doc = self._segment2doc(segment, ftype)
+    return self._doc_upsert(self._segment2doc(segment, ftype))
+
+  def _doc_upsert(self, doc):
     upsert_body = {'upsert': doc, # insert doc as is if it doesn't exist yet
             # If doc exists, then execute this painless scipt:
             # - add target language to the list  and filter unique values by converting to set
             'script' : {
                 'source': 'ctx._source.target_language.add(params.language); ctx._source.target_language = ctx._source.target_language.stream().distinct().filter(Objects::nonNull).collect(Collectors.toList()); \
-                 if (params.pos != null) { ctx._source.pos = params.pos; }',
+                 if (params.pos != null) { ctx._source.pos = params.pos; } \
+                 if (params.features != null) { ctx._source.features = params.features; }',
     #             ',
                 # parameters to the script
                 'params' : { 'language' :  doc['target_language'],
-                             'pos' : doc['pos']}
+                             'pos' : doc['pos'],
+                             'features': doc.get('features')}
             }
     }
     #return {'doc': doc, 'doc_as_upsert' : True }
     return upsert_body
 
+  # Client-side equivalent of the upsert script: merge new doc of the same text into doc
+  def _merge_docs(self, doc, new_doc):
+    doc = dict(doc)
+    languages = doc['target_language'] + new_doc['target_language']
+    doc['target_language'] = [l for l in dict.fromkeys(languages) if l is not None]
+    for f in ['pos', 'features']:
+      if new_doc.get(f) is not None: doc[f] = new_doc[f]
+    return doc
+
   # Applied regular expression. tokenize and count the total of words
   def token_count(self, text, lang):
 
@@ -246,6 +304,14 @@ class TMMonoLing:
 
     return token_cnt#len((self.tokenizers[lang].tokenizer.process(TMRegexMatch.simplified_name(self.regex[lang].process(text)))).split(' '))
 
+  # Matching features are only stored, not searched
+  @staticmethod
+  def _features_mapping():
+    return {"type": "object", "enabled": False}
+
+  def _update_mapping(self):
+    return {"properties": {"features": self._features_mapping()}}
+
   def _index_template(self):
     template =  {
       "index_patterns": [
@@ -280,7 +346,8 @@ class TMMonoLing:
             "token_cnt": {
               "type": "integer",
               "index": "true"
-            }
+            },
+            "features": self._features_mapping()
           }
         }
       }
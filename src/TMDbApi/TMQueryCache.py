@@ -0,0 +1,189 @@
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import logging
+import threading
+import hashlib
+import pickle
+import json
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+from TMDbApi.TMUtils import TMUtils
+from Config.Config import G_CONFIG
+
+
+# Process-wide cache of query results (one entry per query string) with LRU eviction
+# and TTL expiry. Entries are also stored in Redis to be shared between processes.
+# Invalidation is done per language pair by bumping its generation number, which is
+# part of every key: entries of older generations are never read again and age out.
+# Generations are kept in Redis only, thus writes done by any process (API workers,
+# jobs) invalidate cached results of all of them. Hence the cache requires Redis and
+# queries bypass it while Redis is unavailable.
+class TMQueryCache:
+  CONFIG = G_CONFIG.get_query_cache()
+  # Without Redis, writes of other processes would not invalidate the cache
+  ENABLED = CONFIG['enabled'] and CONFIG['redis']
+  MAX_SIZE = CONFIG['size']
+  TTL = CONFIG['ttl']
+  REDIS_PREFIX = 'tmcache:'
+
+  _lock = threading.Lock()
+  _entries = OrderedDict() # key -> (timestamp, pickled value)
+  _redis = None
+  _stats = {'hits': 0, 'misses': 0, 'redis_hits': 0, 'invalidations': 0}
+
+  # Keys of all queries in qparams. Includes everything affecting query results.
+  # Returns None if the generation can't be read (Redis is unavailable)
+  @classmethod
+  def keys(cls, qparams, in_context=False):
+    generation = cls.generation((qparams.source_lang, qparams.target_lang))
+    if generation is None: return None
+    params = [generation, in_context,
+              qparams.source_lang.lower(), qparams.target_lang.lower(),
+              sorted(qparams.domains) if qparams.domains else None,
+              qparams.min_match, qparams.pipe, qparams.limit,
+              qparams.source_metadata, qparams.target_metadata,
+              qparams.concordance, qparams.aut_trans, qparams.exact_length]
+    prefix = json.dumps(params, sort_keys=True, default=str)
+    return [hashlib.sha1((prefix + q).encode('utf-8')).hexdigest() for q in qparams.qlist]
+
+  # Returns list of cached values (None if missing) for the given keys
+  @classmethod
+  def get_many(cls, keys):
+    values = []
+    missing = []
+    now = timer()
+    with cls._lock:
+      for i,key in enumerate(keys):
+        entry = cls._entries.get(key)
+        if entry and now - entry[0] < cls.TTL:
+          cls._entries.move_to_end(key)
+          values.append(entry[1])
+        else:
+          if entry: del cls._entries[key]
+          values.append(None)
+          missing.append(i)
+    # Look up the rest in the shared tier
+    if missing:
+      blobs = cls._redis_call(lambda r: r.mget([cls.REDIS_PREFIX + keys[i] for i in missing]))
+      for i,blob in zip(missing, blobs or []):
+        if blob is None: continue
+        values[i] = blob
+        cls._put_local(keys[i], blob, now)
+        with cls._lock:
+          cls._stats['redis_hits'] += 1
+    hits = sum(1 for v in values if v is not None)
+    with cls._lock:
+      cls._stats['hits'] += hits
+      cls._stats['misses'] += len(values) - hits
+    # Values are stored pickled to make sure callers don't modify cached objects
+    return [pickle.loads(v) if v is not None else None for v in values]
+
+  @classmethod
+  def put_many(cls, keys, values):
+    blobs = [pickle.dumps(value) for value in values]
+    now = timer()
+    for key,blob in zip(keys, blobs):
+      cls._put_local(key, blob, now)
+    def set_all(r):
+      pipe = r.pipeline()
+      for key,blob in zip(keys, blobs):
+        pipe.setex(cls.REDIS_PREFIX + key, cls.TTL, blob)
+      pipe.execute()
+    cls._redis_call(set_all)
+
+  # Invalidate all cached results of the language pair (in both directions)
+  @classmethod
+  def invalidate(cls, langs):
+    if not cls.ENABLED: return
+    pair = cls._pair(langs)
+    with cls._lock:
+      cls._stats['invalidations'] += 1
+    if cls._redis_call(lambda r: r.incr(cls.REDIS_PREFIX + 'gen:' + pair)) is None:
+      # Entries of the current generation can't be invalidated, drop at least the local ones
+      logging.error("Failed to invalidate query cache for {}".format(pair))
+      with cls._lock:
+        cls._entries.clear()
+      return
+    logging.debug("Query cache invalidated for {}".format(pair))
+
+  # Drop all cached results
+  @classmethod
+  def flush(cls):
+    with cls._lock:
+      cls._entries.clear()
+    # Generations are kept, keys of deleted entries must not be reused
+    def delete_all(r):
+      keys = [k for k in r.scan_iter(match=cls.REDIS_PREFIX + '*') if not k.startswith((cls.REDIS_PREFIX + 'gen:').encode())]
+      if keys: r.delete(*keys)
+    cls._redis_call(delete_all)
+
+  @classmethod
+  def stats(cls):
+    with cls._lock:
+      stats = dict(cls._stats, size=len(cls._entries), max_size=cls.MAX_SIZE, ttl=cls.TTL, enabled=cls.ENABLED)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0
+    return stats
+
+  # Current generation of the language pair or None if Redis is unavailable
+  @classmethod
+  def generation(cls, langs):
+    pair = cls._pair(langs)
+    return cls._redis_call(lambda r: int(r.get(cls.REDIS_PREFIX + 'gen:' + pair) or 0))
+
+  ############### Helper methods ###################
+  # Language pair regardless of direction as reverse pairs share the same map index
+  @staticmethod
+  def _pair(langs):
+    return '_'.join(sorted([TMUtils.lang2short(l) for l in langs]))
+
+  @classmethod
+  def _put_local(cls, key, blob, ts):
+    with cls._lock:
+      cls._entries[key] = (ts, blob)
+      cls._entries.move_to_end(key)
+      while len(cls._entries) > cls.MAX_SIZE:
+        cls._entries.popitem(last=False)
+
+  # Redis is an optional tier - log and ignore its errors
+  @classmethod
+  def _redis_call(cls, f):
+    try:
+      return f(cls._get_redis())
+    except Exception as e:
+      logging.warning("Query cache Redis error: {}".format(e))
+      return None
+
+  @classmethod
+  def _get_redis(cls):
+    if cls._redis is None:
+      from redis import Redis
+      config = G_CONFIG.config['redis']
+      options = {'host': config['host'], 'port': config['port'], 'db': cls.CONFIG['redis_db']}
+      # Unset environment variables are left as placeholders (see RestApi/Celery.py)
+      if config.get('user') and config['user'] != 'REDIS_USER': options['username'] = config['user']
+      if config.get('password') and config['password'] != 'REDIS_PASSWORD': options['password'] = config['password']
+      cls._redis = Redis(**options)
+    return cls._redis
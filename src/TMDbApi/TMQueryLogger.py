@@ -41,8 +41,8 @@ class TMQueryLogger:
     self.log = logging.getLogger(self.LOGGER_NAME)
     self.log.setLevel(logging.INFO)
     self.log.addHandler(self.handler)
-    self.es.indices_put_template(name='qlogger_template', body=self._index_template())
- 
+    # Index template is applied once by TMSchema
+
 
   def log_query(self, username, ip, qparams, results):
     for query, result in zip(qparams.qlist, results):
@@ -102,10 +102,11 @@ class TMQueryLogger:
    # return res.to_dict()
     return stats
 
-  def _index_template(self):
+  @classmethod
+  def _index_template(cls):
      template =  {
          "index_patterns": [
-             self.ES_INDEX_NAME + "*"
+             cls.ES_INDEX_NAME + "*"
          ],
        "template": {
            "mappings" : {
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import os, sys
+sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..'))
+sys.path = [p for p in sys.path if p]
+
+import logging
+import datetime
+import hashlib
+import json
+import threading
+
+from opensearchpy import exceptions
+
+from TMDbApi.TMUtils import TMUtils
+from TMDbApi.TMMonoLing import TMMonoLing
+from TMDbApi.TMMap.TMMapES import TMMapES
+from TMDbApi.TMQueryLogger import TMQueryLogger
+from TMDbApi.TMIndexRegistry import TMIndexRegistry
+from JobApi.ESJobApi import ESJobApi
+from helpers.OpenSearchHelper import OpenSearchHelper
+
+
+# Versioned bootstrap of OpenSearch index templates, mappings, stored scripts and
+# the jobs index. Schema is applied once (at API startup or from the command line)
+# and the applied version is recorded in META_INDEX, so that API/DB constructors
+# don't have to re-put it. Bump VERSION on changes which require re-applying;
+# any change of the schema bodies is also detected by the checksum.
+class TMSchema:
+  VERSION = 1
+  META_INDEX = 'schema_meta'
+  META_ID = 'schema'
+
+  _lock = threading.Lock()
+  _ensured = False
+
+  def __init__(self, es=None):
+    self.es = es if es else OpenSearchHelper()
+
+  # Apply schema unless it is up-to-date. Checked only once per process
+  @classmethod
+  def ensure(cls, es=None):
+    if cls._ensured: return False
+    with cls._lock:
+      if cls._ensured: return False
+      applied = cls(es).apply()
+      cls._ensured = True
+    return applied
+
+  # Returns True if schema was (re)applied, False if it was already up-to-date
+  def apply(self, force=False):
+    bodies = self.bodies()
+    checksum = self.checksum(bodies)
+    if not force and self.is_current(checksum):
+      logging.info("Schema version {} is up-to-date".format(self.VERSION))
+      return False
+
+    for index, body in bodies['indices'].items():
+      if self.es.indices_exists(index=index): continue
+      try:
+        self.es.indices_create(index=index, body=body)
+      except exceptions.RequestError as e:
+        # Created by another process in the meantime
+        logging.warning("Failed to create index {}: {}".format(index, e))
+    for name, body in bodies['templates'].items():
+      self.es.indices_put_template(name=name, body=body)
+    for index, body in bodies['mappings'].items():
+      self.es.indices_put_mapping(index=index, body=body)
+    for id, body in bodies['scripts'].items():
+      self.es.put_script(index=id, body=body)
+    TMIndexRegistry.invalidate()
+
+    # Record applied version only after all the steps succeeded
+    self.es.index(index=self.META_INDEX, id=self.META_ID,
+                  body={'version': self.VERSION,
+                        'checksum': checksum,
+                        'update_time': TMUtils.date2str(datetime.datetime.now())})
+    logging.info("Applied schema version {} ({})".format(self.VERSION, checksum))
+    return True
+
+  # Recorded schema status or None if schema was never applied
+  def status(self):
+    try:
+      hit = self.es.get(index=self.META_INDEX, id=self.META_ID)
+    except exceptions.NotFoundError:
+      return None
+    if not hit: return None
+    return hit.get('_source')
+
+  def is_current(self, checksum=None):
+    status = self.status()
+    if not status: return False
+    if not checksum: checksum = self.checksum(self.bodies())
+    return status.get('version') == self.VERSION and status.get('checksum') == checksum
+
+  def bodies(self):
+    ml_index = TMMonoLing()
+    seg_map = TMMapES()
+    job_api = ESJobApi()
+    return {
+      'indices': {
+        ESJobApi.INDEX: job_api._index_template()
+      },
+      'templates': {
+        'tm_template': ml_index._index_template(),
+        'map_template': seg_map._index_template(),
+        'job_template': job_api._index_template(is_template=True),
+        'qlogger_template': TMQueryLogger._index_template()
+      },
+      'mappings': {
+        "{}*".format(TMUtils.TM_PREFIX): ml_index._update_mapping(),
+        "{}*".format(TMUtils.MAP_PREFIX): seg_map._update_mapping_script()
+      },
+      'scripts': {
+        TMMapES.UPSERT_SCRIPT: seg_map._upsert_script()
+      }
+    }
+
+  @staticmethod
+  def checksum(bodies):
+    return hashlib.sha1(json.dumps(bodies, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+if __name__ == "__main__":
+  import argparse
+  logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+
+  parser = argparse.ArgumentParser(description="Apply OpenSearch templates, mappings and scripts")
+  parser.add_argument('-f', '--force', action="store_true", help="Re-apply even if the recorded version is up-to-date")
+  parser.add_argument('-s', '--status', action="store_true", help="Print recorded schema status and exit")
+  args = parser.parse_args()
+
+  schema = TMSchema()
+  if args.status:
+    status = schema.status()
+    print(json.dumps({'status': status, 'current': schema.is_current(), 'version': TMSchema.VERSION}))
+  else:
+    schema.apply(force=args.force)
@@ -0,0 +1,115 @@
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import os, sys
+sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..'))
+
+import logging
+from collections import OrderedDict
+
+from opensearchpy.helpers import BulkIndexError
+from Config.Config import G_CONFIG
+from helpers.OpenSearchHelper import OpenSearchHelper
+
+
+"""
+  @api {INFO} /TMScriptFreeIngest TMScriptFreeIngest -- Bulk writes of new docs without scripted upserts
+  @apiName TMScriptFreeIngest
+  @apiVersion 0.1.0
+  @apiGroup TMDbApi
+
+  @apiExample {curl} Example & Notes
+
+  # Monolingual and map docs are normally written as scripted upserts, i.e. a painless script
+  # merges the new doc into the existing one. Script updates are much slower than plain index
+  # operations, while during first-time and append-only imports almost all docs are new.
+  # Script-free mode is used by import jobs only (import.script_free in the configuration), other
+  # writers (REST API, maintenance and generate jobs) always send scripted upserts:
+  #  - duplicates within a batch are merged client-side by 'merge' (equivalent of the script)
+  #  - docs not yet written by this instance are sent as 'create' operations; those which
+  #    exist already fail with 409 and only they are retried as scripted upserts ('upsert')
+  #  - docs written by previous batches (bounded LRU cache of ids) are sent as scripted upserts
+
+  ingest = TMScriptFreeIngest(OpenSearchHelper(), merge, upsert)
+  ingest.bulk([('tm_en', id, doc), ...]) # --> (number of successful docs, [])
+"""
+class TMScriptFreeIngest:
+  CONFIG = G_CONFIG.get_script_free_ingest()
+  ENABLED = CONFIG['enabled']
+
+  def __init__(self, es, merge, upsert, cache_size=None):
+    self.es = es
+    self.merge = merge
+    self.upsert = upsert
+    self.cache_size = cache_size if cache_size else self.CONFIG['id_cache_size']
+    self._written = OrderedDict() # (index, id) -> None, least recently written first
+    self.stats = {'create': 0, 'upsert': 0, 'conflict': 0}
+
+  # Write (index, id, doc) tuples. Returns the same as OpenSearchHelper.bulk and
+  # raises BulkIndexError on failures other than conflicts of created docs
+  def bulk(self, docs):
+    merged = OrderedDict()
+    for index, id, doc in docs:
+      key = (index, str(id))
+      merged[key] = self.merge(merged[key], doc) if key in merged else doc
+    if not merged: return 0, []
+
+    success, errors = self.es.bulk(self._actions(merged), raise_on_error=False)
+    conflicts = []
+    failed = []
+    for error in errors:
+      op_type, item = list(error.items())[0]
+      if op_type == 'create' and item.get('status') == 409:
+        conflicts.append((item['_index'], item['_id']))
+      else:
+        failed.append(error)
+    if conflicts:
+      self.stats['conflict'] += len(conflicts)
+      s, e = self.es.bulk((self._upsert_action(key, merged[key]) for key in conflicts), raise_on_error=False)
+      success += s
+      failed += e
+    failed_keys = set((item['_index'], item['_id']) for item in (list(e.values())[0] for e in failed))
+    for key in merged:
+      if key not in failed_keys: self._remember(key)
+    if failed:
+      raise BulkIndexError("{} document(s) failed to index.".format(len(failed)), failed)
+    return success, failed
+
+  def _actions(self, merged):
+    for key, doc in merged.items():
+      if key in self._written:
+        self.stats['upsert'] += 1
+        yield self._upsert_action(key, doc)
+      else:
+        self.stats['create'] += 1
+        yield {'_op_type': 'create', '_index': key[0], '_id': key[1], '_source': doc}
+
+  def _upsert_action(self, key, doc):
+    return {'_op_type': 'update', '_index': key[0], '_id': key[1], '_source': self.upsert(doc),
+            'retry_on_conflict': OpenSearchHelper.RETRY_ON_CONFLICT}
+
+  def _remember(self, key):
+    self._written[key] = None
+    self._written.move_to_end(key)
+    if len(self._written) > self.cache_size:
+      self._written.popitem(last=False)
@@ -30,6 +30,7 @@ class TMTranslationUnit:
                 'source_language', 'target_language',
                 'source_metadata', 'target_metadata', 'metadata',
                 'source_pos', 'target_pos',
+                'source_token_cnt', 'target_token_cnt',
                 'tuid', 'dirty_score', 'username',
                 'industry', 'type', 'file_name', 'domain', 'organization',
                 'tm_creation_date', 'tm_change_date',
@@ -23,6 +23,8 @@
 #
 import logging
 import re
+import hashlib
+import json
 from langid.langid import LanguageIdentifier, model
 
 from helpers.OpenSearchHelper import OpenSearchHelper
@@ -33,6 +35,8 @@ class TMUtils:
   lang_id = LanguageIdentifier.from_modelstring(model, norm_probs=True)
   TM_PREFIX='tm_'
   MAP_PREFIX='map_'
+  TAG_RE = re.compile('</?[^<>]+/?>')
+  SPACE_RE = re.compile('\s+')
 
   @staticmethod
   def lang2locale(lang):
@@ -59,6 +63,30 @@ class TMUtils:
         return True
     raise Exception("Unknown language: {}".format(lang))
 
+  # Hash of text normalized for exact matching: tags removed, whitespace collapsed,
+  # optionally case-folded
+  @staticmethod
+  def text_hash(text, casefold=False):
+    if text is None: return None
+    return hashlib.sha1(TMUtils._normalize_text(text, casefold).encode('utf-8')).hexdigest()
+
+  # Hash of normalized text and its contexts (metadata context_before & context_after)
+  # for in-context (101%) matching. None if there are no contexts
+  @staticmethod
+  def context_hash(text, metadata, casefold=False):
+    if text is None or not metadata: return None
+    if not isinstance(metadata, dict): metadata = metadata.to_dict()
+    contexts = [metadata.get('context_before'), metadata.get('context_after')]
+    if all(c is None for c in contexts): return None
+    key = json.dumps([TMUtils._normalize_text(text, casefold)] + contexts, ensure_ascii=False)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+  @staticmethod
+  def _normalize_text(text, casefold=False):
+    text = TMUtils.SPACE_RE.sub(' ', TMUtils.TAG_RE.sub(' ', text)).strip()
+    if casefold: text = text.casefold()
+    return text
+
   @staticmethod
   def es_index2mapdb(src_index, tgt_index):
     # en + es = en_es
@@ -104,6 +132,7 @@ from timeit import default_timer as timer
 class TMTimer:
   def __init__(self, name = "", log_level=logging.DEBUG):
     self.stages = dict()
+    self.counts = dict()
     self.ts = dict()
     self.name = name
     self.log_level = log_level
@@ -119,9 +148,19 @@ class TMTimer:
     self.stages[stage] += timer() - self.ts[stage]
     del self.ts[stage]
 
+  # Count events (e.g. processed or skipped items) of the stage
+  def count(self, stage, n=1):
+    self.counts[stage] = self.counts.get(stage, 0) + n
+
+  def add_counts(self, other):
+    for stage,n in other.counts.items():
+      self.count(stage, n)
+
   def print(self):
     for stage,ts in self.stages.items():
       logging.log(self.log_level, "==== Execution time of stage {}::{}:{}".format(self.name,stage, ts))
+    for stage,n in self.counts.items():
+      logging.log(self.log_level, "==== Count of stage {}::{}:{}".format(self.name,stage, n))
 
 
 if __name__ == "__main__":
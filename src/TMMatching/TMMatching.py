@@ -29,14 +29,14 @@ sys.path = [p for p in sys.path if p]
 mt_engine_path = os.path.join(os.path.abspath(os.path.join(__file__, "../../..")), 'conf/sh_engines/')
 
 from TMMatching.TMRegxMatch import TMRegexMatch, TMTags
-from TMMatching.TMPosMatch import TMPosMatch
+from TMMatching.TMMatchingComponents import TMMatchingComponents
+from TMMatching.TMMatchingFeatures import TMMatchingFeatures
 from TMDbApi.TMUtils import TMTimer
 from TMMatching.TMUtilsMatching import TMUtilsMatching
 from kombu.utils.encoding import safe_str
 from TMPreprocessor.Xml.XmlUtils import XmlUtils
 from TMMatching.TMSplitMatch import TMSplitMatch
 from Config.Config import G_CONFIG
-from TMPreprocessor.TMSplit import TMSplit
 from TMAutomaticTranslation.TMAutomaticTranslation import TMAutomaticTranslation
 
 import logging
@@ -47,8 +47,9 @@ import math
 
 # Matching algorithm principal class
 class TMMatching:
-
-  split = dict()
+  # Words and numbers (including Chinese & Japanese characters) and punctuation marks
+  WORD_RE = re.compile(r'[a-zA-Z0-9\u4e00-\u9fff\u3040-\u309Fー\u30A0-\u30FF]+')
+  SYMBOL_RE = re.compile(r'[^\w\s]')
 
   def __init__(self, query, query_dic ,src_lang, tgt_lang, out, min_match, domain, aut_trans, pipe= None):
     self.query = query # Here query is the query string
@@ -61,6 +62,8 @@ class TMMatching:
     self.min_match = min_match
     self.timer = TMTimer("TMMatching", logging.INFO)
     self.machine_translation= aut_trans
+    # Shared (cached) matching components of the language pair
+    self.components = TMMatchingComponents.get(self.src_lang, self.tgt_lang)
 
     # Validate pipe
     self.match, self.pipe = self._validate_pipe(pipe)
@@ -72,15 +75,12 @@ class TMMatching:
 
   def _validate_pipe(self, pipe):
     match_process = {
-      'regex': None,
+      'regex': self.components.regex,
       'posTag': None,
-      'tags': TMTags()
+      'tags': self.components.tags
     }
 
-    try:
-      match_process['regex'] = TMRegexMatch(self.src_lang, self.tgt_lang)
-      logging.info("Loading regex for matching")
-    except ValueError:
+    if match_process['regex'] is None:
       if 'regex' in pipe:
         pipe.pop(pipe.index('regex'))
         logging.info("Unsupported regex for matching")
@@ -95,7 +95,7 @@ class TMMatching:
       try:
         if 'pos' not in self.query_dic:
           self.query_dic['pos'] = TMUtilsMatching.pre_process(self.query_dic['tokenizer'], self.src_lang, 'pos_tagger', {})
-        match_process['posTag'] = TMPosMatch(self.src_lang, self.tgt_lang)
+        match_process['posTag'] = self.components.pos_match
         logging.info("Loading regex for matching")
       except Exception as e:
         if 'posTag' in pipe:
@@ -108,6 +108,31 @@ class TMMatching:
 
     return match_process, pipe
 
+  # Tokenize and POS tag all queries of a batch at once and store the results in their
+  # query info (query_dic), so that _validate_pipe doesn't process queries one by one.
+  # Queries which fail here are processed again (and their failure handled) by _validate_pipe
+  @staticmethod
+  def preprocess_queries(qlist, qinfo, src_lang):
+    src_lang = src_lang.lower()
+    todo = [(XmlUtils.replace_tags(q), info) for q, info in zip(qlist, qinfo) if 'pos' not in info]
+    if not todo: return
+    try:
+      tokenized = []
+      for text, info in todo:
+        if 'tokenizer' not in info:
+          info['tokenizer'] = TMUtilsMatching.pre_process(text, src_lang, 'tokenizer', {})
+        tokenized.append(info)
+    except Exception as e:
+      logging.info("Unsupported Tokenizer for {}".format(src_lang))
+      return
+    try:
+      pos = TMUtilsMatching.pre_process_batch([info['tokenizer'] for info in tokenized], src_lang, 'pos_tagger', {})
+    except Exception as e:
+      logging.info("Unsupported posTag for {}".format(src_lang))
+      return
+    for info, p in zip(tokenized, pos):
+      info['pos'] = p
+
   def execute(self, l_best_segments, align_features, concordance):
 
     # show the status of the process
@@ -118,7 +143,7 @@ class TMMatching:
     self.timer.stop("preprocess")
 
     # 1. sort segment list
-    rank_segments = self._match_rank(l_best_segments)
+    rank_segments = self._match_rank(l_best_segments, concordance)
     logging.info("SEGMENTS FROM OPENSEARCH")
     for seg in rank_segments:
       logging.info(u"{}".format(safe_str(seg[0][0].source_text)))
@@ -156,6 +181,10 @@ class TMMatching:
           rank_segments = rank_segments[1:]
         # Check if the retrieve segments are 100% match or apply transformations
         for seg_info in rank_segments:
+          # Pruned segments are ranked last and can't reach min_match -> the same as break after execute_segment
+          if self._is_pruned(seg_info):
+            self.timer.count("pruned: stop")
+            break
           segment = seg_info[0][0]
           ini_editD = seg_info[1]
           src_re = seg_info[0][2]  # src after applied regex
@@ -217,8 +246,8 @@ class TMMatching:
             logging.info("Apply posTag matching")
             self.timer.start("fuzzy_preprocess")
             if status_tokenizer == False:  # Tokenize source and target
-              tgt_text = TMUtilsMatching.pre_process(tgt_text, self.tgt_lang, 'tokenizer', {})  # Pre-process tgt
-              src_text = TMUtilsMatching.pre_process(src_text, self.src_lang, 'tokenizer', {})  # Tokenize tm_src
+              tgt_text = self._tokenize(segment, 'target', tgt_text, self.tgt_lang)  # Pre-process tgt
+              src_text = self._tokenize(segment, 'source', src_text, self.src_lang)  # Tokenize tm_src
               self.query_dic['query_re_reduce_tok'] = TMUtilsMatching.pre_process(self.query_dic['query_re_reduce'], self.src_lang, 'tokenizer', {})  # Tokenize the simplified query
               status_tokenizer = True
 
@@ -322,7 +351,7 @@ class TMMatching:
   # Send and input sentence into subsegments usng rules based on posTag annotation
   def _splitByPhrase(self, lang_class, list_sentences):
 
-    splitTask = TMMatching.split_source(lang_class, self.src_lang)  # class with the rule for specific language and language
+    splitTask = self.components.split(lang_class)  # class with the rule for specific language and language
 
     list_word_pos = []
     if 'pos' in self.query_dic:
@@ -526,7 +555,7 @@ class TMMatching:
     only_word = []
     only_st = []
     l_src_st = TMUtilsMatching.check_stopwords(lang)
-    for match in re.finditer(r'[a-zA-Z0-9\u4e00-\u9fff\u3040-\u309Fー\u30A0-\u30FF]+', text):  # Get all the words and numbers
+    for match in TMMatching.WORD_RE.finditer(text):  # Get all the words and numbers
 
       if l_src_st: # For some language we don't have stopwords list
         if match.group() in l_src_st:
@@ -540,36 +569,217 @@ class TMMatching:
   @staticmethod
   def _symbol_sequence(text): # Receive simplified sequence, without elements match with regular expression
     only_symbol = []
-    for match in re.finditer(r'[a-zA-Z0-9\u4e00-\u9fff\u3040-\u309Fー\u30A0-\u30FF]+', text):  text = text.replace(match.group(), 'P', 1) # Replace all words by
-    for match in re.finditer(r'[^\w\s]', text): only_symbol.append(match.group()) # Obtain list os symbols #  r'[^a-zA-Z0-9\s]+'
+    for match in TMMatching.WORD_RE.finditer(text):  text = text.replace(match.group(), 'P', 1) # Replace all words by
+    for match in TMMatching.SYMBOL_RE.finditer(text): only_symbol.append(match.group()) # Obtain list os symbols #  r'[^a-zA-Z0-9\s]+'
     return text, only_symbol
 
+  # Same as _only_word_sequence, but receives set of stop words (None if the language doesn't have them)
+  @staticmethod
+  def _word_sequence(text, st_words):
+    if not st_words: return [], []
+    only_word = []
+    only_st = []
+    for word in TMMatching.WORD_RE.findall(text):
+      if word in st_words:
+        only_st.append(word)
+      else:
+        only_st.append('P')
+        only_word.append(word)
+    return only_word, only_st
+
+  # Batch version of _tm_edit_distance: returns the same scores for each pair of s_texts & s_simplified_list.
+  # Query sequences are computed only once and edit distances to all the candidates are calculated
+  # by one compiled call per feature
+  def _tm_edit_distance_batch(self, q_text, s_texts, q_simplified, s_simplified_list, s_words_list=None):
+    scores = [None] * len(s_texts)
+    candidates = []
+    for i, s_text in enumerate(s_texts):
+      # Corner case - matching artificial empty segment -> giving minimal score
+      if q_text and not s_text.strip(): scores[i] = 1
+      else: candidates.append(i)
+    if not candidates: return scores
+
+    st_words = TMUtilsMatching.check_stopwords_set(self.src_lang)
+    q_onlyW, q_st_word = TMMatching._word_sequence(q_text, st_words)
+    if not q_onlyW and not q_st_word:
+      for i, n_diff in zip(candidates, TMUtilsMatching._edit_distances(q_text, [s_texts[i] for i in candidates])):
+        scores[i] = TMMatching._round_score(100 - n_diff)
+      return scores
+
+    q_words = ' '.join(q_onlyW)
+    q_replaceW, q_onlyS = TMMatching._symbol_sequence(q_simplified)
+    len_symbols = len(q_replaceW.split(' ')) + len(q_replaceW.split(' '))
+    if len_symbols == 0: len_symbols = 1
+    q_words_set = set(q_onlyW)
+    onlyW_len = len(q_onlyW)
+    if onlyW_len == 0: onlyW_len = 1
+
+    # Word sequences can be precomputed (see TMMatchingFeatures)
+    s_words = [s_words_list[i] if s_words_list and s_words_list[i] is not None else TMMatching._word_sequence(s_texts[i], st_words) for i in candidates]
+    s_symbols = [TMMatching._symbol_sequence(s_simplified_list[i]) for i in candidates]
+    nchar_diffs = TMUtilsMatching._edit_distances(q_words, [' '.join(s_onlyW) for s_onlyW, s_st_word in s_words])
+    nsymbol_diffs = TMUtilsMatching._edit_distances(q_replaceW, [s_replaceW for s_replaceW, s_onlyS in s_symbols])
+    nst_diffs = TMUtilsMatching._edit_distances(' '.join(q_st_word), [' '.join(s_st_word) for s_onlyW, s_st_word in s_words])
+
+    for i, (s_onlyW, s_st_word), (s_replaceW, s_onlyS), nchar_diff, n_symbol_diff, n_st_diff in \
+        zip(candidates, s_words, s_symbols, nchar_diffs, nsymbol_diffs, nst_diffs):
+      nchar_len = len(q_words) + len(' '.join(s_onlyW))
+      if nchar_len == 0: nchar_len = 1
+      char_diff = (2*nchar_diff)/(nchar_len)
+
+      if (len(s_onlyS) == 0 and len(q_onlyS) == 0): n_symbol_diff = 0
+      symbol_diff = (2*n_symbol_diff)/len_symbols
+
+      word_diff = (len(q_words_set.difference(s_onlyW)))/onlyW_len
+
+      if (len(q_st_word) == 0 and len(s_st_word) == 0):
+        editD = (1 - ((0.70 * (char_diff)) + (0.15 * (word_diff)) + (0.15 * (symbol_diff)))) * 100
+      else:
+        len_stop_word = len(' '.join(q_st_word)) + len(' '.join(s_st_word))
+        stop_word_diff = (2 * n_st_diff)/len_stop_word
+        editD = (1 - ((0.70 * (char_diff)) + (0.10 * (word_diff)) + (0.10 * (symbol_diff)) + (0.10 * (stop_word_diff)))) * 100
+      scores[i] = TMMatching._round_score(editD)
+    return scores
+
+  @staticmethod
+  def _round_score(editD):
+    if editD < 0:
+      editD = 10
+    return int(math.floor(editD))
+
   # Input : list of segments; query
-  # Output: Sort the list of all the segmets [(segment, editD); ...(segment, editD)] considering edit distance
-  def _match_rank(self, best_segments):
+  # Output: Sort the list of all the segmets [(segment, editD); ...(segment, editD)] considering edit distance.
+  # Segments which can't reach min_match (see _score_upper_bound) are pruned: they are not preprocessed
+  # and scored, their src_re & src_re_reduce are None and their editD is the upper bound. Pruned segments
+  # are ranked after all scored ones: later stages (e.g. tags) may lift a scored segment above min_match
+  def _match_rank(self, best_segments, concordance=False):
     self.timer.start("rank segments")
-    editD_score = []
     if 'query_tags' in self.query_dic: # Simplified tags
       query = TMUtilsMatching.reduce_tags(self.query_dic['query_tags']) # Yo tengo un <T1>gato</T1>. Yo tengo un T gato T.
     else:
       query = self.query_dic['query']
 
-    for i in range(0, len(best_segments)):
+    # Tags of TM sources are stripped and simplified by one scan of each of them
+    scans = [XmlUtils.scan_tags(segment[0].source_text) for segment in best_segments]
+    src_texts = [self._reduce_src_tags(segment[0].source_text, scan) for segment, scan in zip(best_segments, scans)]
+    bounds = [None] * len(best_segments)
+    if not concordance and self._can_prune():
+      self.timer.start("rank segments: upper bound")
+      bounds = self._score_upper_bounds(query, src_texts, [stripped for stripped, reduced, tags in scans])
+      self.timer.stop("rank segments: upper bound")
+    scored = [i for i, bound in enumerate(bounds) if bound is None or bound >= self.min_match]
+    editD_score = self._score_segments(best_segments, query, src_texts, scored)
+    pruned = [i for i, bound in enumerate(bounds) if bound is not None and bound < self.min_match]
+    if pruned and (not scored or max(bounds[i] for i in pruned) >= max(editD_score[i] for i in scored)):
+      # The best segment must be scored exactly (e.g. for automatic translation) -> don't prune
+      editD_score = self._score_segments(best_segments, query, src_texts, range(0, len(best_segments)))
+      pruned = []
+    for i in pruned:
       segment = best_segments[i]
-      # Simplified tags in tm source
-      if re.search("</?T[0-9]*/?>", segment[0].source_text):
-        src_text = TMUtilsMatching.reduce_tags(segment[0].source_text) # Simplified tags in tm source and target
-      else: src_text = segment[0].source_text
-      # Applied Regex and simplified
-      if 'regex' in self.pipe: src_re = TMUtilsMatching.pre_process(src_text, self.src_lang, 'reg_exp', self.match['regex'].re_pp)
-      else: src_re = src_text
-
+      best_segments[i] = (segment[0], segment[1], None, None)
+      editD_score[i] = bounds[i]
+    self.timer.count("rank segments: scored", len(best_segments) - len(pruned))
+    self.timer.count("pruned: rank", len(pruned))
+    self.timer.stop("rank segments")
+    return sorted(zip(best_segments, editD_score), key=lambda x: (not TMMatching._is_pruned(x), x[1]), reverse=True)
 
-      src_re_reduce = TMRegexMatch.simplified_name(src_re)
+  # Preprocess (regex) and score segments given by indices. Returns list of scores (None for the others)
+  def _score_segments(self, best_segments, query, src_texts, indices):
+    editD_score = [None] * len(best_segments)
+    s_words = [None] * len(best_segments)
+    for i in indices:
+      segment = best_segments[i]
+      # Use features precomputed at ingestion time if available
+      features = TMMatchingFeatures.get(segment[0], 'source', self.src_lang)
+      if features:
+        self.timer.count("rank segments: features")
+        if 'words' in features: s_words[i] = (features['words'], features['stop_words'])
+      # Applied Regex and simplified
+      if 'regex' in self.pipe and features and 'text_re' in features:
+        src_re, src_re_reduce = features['text_re'], features['text_re_reduce']
+      else:
+        if 'regex' in self.pipe: src_re = TMUtilsMatching.pre_process(src_texts[i], self.src_lang, 'reg_exp', self.match['regex'].re_pp)
+        else: src_re = src_texts[i]
+        src_re_reduce = TMRegexMatch.simplified_name(src_re)
       best_segments[i] = (segment[0], segment[1], src_re, src_re_reduce)
-      editD_score.append(self._tm_edit_distance(query, src_text, self.query_dic['query_re_reduce'], src_re_reduce))  # EditD with tags simplied TMUtilsMatching._edit_distance(query, src_text)
-    self.timer.stop("rank segments")
-    return sorted(zip(best_segments, editD_score), key=operator.itemgetter(1), reverse=True)
+    # EditD with tags simplied, all the segments at once
+    for i, editD in zip(indices, self._tm_edit_distance_batch(query, [src_texts[i] for i in indices], self.query_dic['query_re_reduce'], [best_segments[i][3] for i in indices], [s_words[i] for i in indices])):
+      editD_score[i] = editD
+    return editD_score
+
+  # Tokenize segment text, reuse precomputed tokenization if the text wasn't transformed yet
+  def _tokenize(self, segment, ftype, text, lang):
+    features = TMMatchingFeatures.get(segment, ftype, lang)
+    if features and 'text_tok' in features and text == getattr(segment, ftype + '_text'):
+      return features['text_tok']
+    return TMUtilsMatching.pre_process(text, lang, 'tokenizer', {})
+
+  # Simplified tags in tm source. scan is the result of XmlUtils.scan_tags(src_text)
+  @staticmethod
+  def _reduce_src_tags(src_text, scan):
+    stripped, reduced, tags = scan
+    if any(XmlUtils.TAG_PATTERN.fullmatch(tag) for tag in tags):
+      return reduced # Simplified tags in tm source and target
+    return src_text
+
+  @staticmethod
+  def _is_pruned(seg_info):
+    return seg_info[0][2] is None
+
+  # Pruning by score upper bound is possible only if none of the pipe operations can raise the score
+  # above the bound: regex (if the query has regular expressions, or gets them after stripping tags),
+  # posTag (replaces unmatched words) and split (doesn't depend on the segment)
+  def _can_prune(self):
+    if 'posTag' in self.pipe or 'split' in self.pipe: return False
+    if 'regex' in self.pipe:
+      query = self.query_dic['query']
+      if query != self.query_dic['query_re'] or TMUtilsMatching.strip_tags(query) != self.query_dic['query_re']: return False
+    return True
+
+  # Admissible upper bounds of final segment scores: maximum of the bounds of ranking score
+  # (tags simplified) and tags match score (tags stripped), see execute_segment. stripped_texts
+  # are TM source texts stripped of tags by XmlUtils.strip_tags
+  def _score_upper_bounds(self, query, src_texts, stripped_texts):
+    st_words = TMUtilsMatching.check_stopwords_set(self.src_lang)
+    bounds = TMMatching._score_upper_bound(query, src_texts, st_words)
+    # Same as TMUtilsMatching.strip_tags(source_text).strip()
+    strip_bounds = TMMatching._score_upper_bound(TMUtilsMatching.strip_tags(self.query_dic['query']),
+                                                 [XmlUtils.WHITESPACES_PATTERN.sub(' ', s).strip() for s in stripped_texts], st_words)
+    return [max(b, sb) for b, sb in zip(bounds, strip_bounds)]
+
+  # Upper bound of _tm_edit_distance(q_text, s_text, ...) for each of s_texts: edit distances are bounded
+  # by length differences and symbols difference by zero, word differences are calculated exactly
+  @staticmethod
+  def _score_upper_bound(q_text, s_texts, st_words):
+    q_onlyW, q_st_word = TMMatching._word_sequence(q_text, st_words)
+    q_words = ' '.join(q_onlyW)
+    q_st = ' '.join(q_st_word)
+    q_words_set = set(q_onlyW)
+    onlyW_len = len(q_onlyW)
+    if onlyW_len == 0: onlyW_len = 1
+    bounds = []
+    for s_text in s_texts:
+      if q_text and not s_text.strip():
+        bounds.append(1)
+        continue
+      if not q_onlyW and not q_st_word:
+        editD = 100 - abs(len(q_text) - len(s_text))
+      else:
+        s_onlyW, s_st_word = TMMatching._word_sequence(s_text, st_words)
+        s_words = ' '.join(s_onlyW)
+        nchar_len = len(q_words) + len(s_words)
+        if nchar_len == 0: nchar_len = 1
+        char_diff = (2*abs(len(q_words) - len(s_words)))/nchar_len
+        word_diff = (len(q_words_set.difference(s_onlyW)))/onlyW_len
+        if (len(q_st_word) == 0 and len(s_st_word) == 0):
+          editD = (1 - ((0.70 * (char_diff)) + (0.15 * (word_diff)))) * 100
+        else:
+          s_st = ' '.join(s_st_word)
+          stop_word_diff = (2*abs(len(q_st) - len(s_st)))/(len(q_st) + len(s_st))
+          editD = (1 - ((0.70 * (char_diff)) + (0.10 * (word_diff)) + (0.10 * (stop_word_diff)))) * 100
+      # Negative scores are replaced by 10, see _round_score
+      bounds.append(max(int(math.floor(editD + 1e-9)), 10))
+    return bounds
 
   #Check if delete the tags improve the editD, Yes replace the src and tgt, else keep initial src and tgt
   def _match_tags(self, src_text, src_re_reduce, tgt_text, status, ini_editD):
@@ -682,13 +892,6 @@ class TMMatching:
   def check_upper_equal(qtext, rtext):
     if all(x == rtext.split(' ')[0] for x in rtext.split(' ')) and qtext.isupper(): return True
 
-  @staticmethod
-  def split_source(class_lang, lang):
-    if not lang in TMMatching.split:
-      logging.info("Loading Split rules for {}".format(lang))
-      TMMatching.split[lang] = TMSplit(class_lang, lang)
-    return TMMatching.split[lang]
-
 
   '''
     #*******************Tags******************
@@ -0,0 +1,112 @@
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import sys, os
+
+sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', '..'))
+sys.path = [p for p in sys.path if p]
+
+import logging
+import threading
+from collections import OrderedDict
+
+from TMMatching.TMRegxMatch import TMRegexMatch, TMTags
+from TMMatching.TMPosMatch import TMPosMatch
+from TMPreprocessor.TMSplit import TMSplit
+from Config.Config import G_CONFIG
+
+
+# Process-wide registry of ready-made matching components (regex, POS match, tags, split)
+# per language pair. Components are built lazily on the first use and shared by all
+# TMMatching instances (and threads). Registry keeps at most MAX_SIZE language pairs,
+# the least recently used one is dropped when exceeded.
+class TMMatchingComponents:
+  MAX_SIZE = G_CONFIG.get_matching_cache_size()
+
+  _lock = threading.Lock()
+  _registry = OrderedDict()
+  _db_lock = threading.Lock()
+  _db = None
+
+  def __init__(self, src_lang, tgt_lang):
+    self.src_lang = src_lang
+    self.tgt_lang = tgt_lang
+    self.tags = TMTags()
+    self._lock = threading.Lock()
+    self._components = dict()
+
+  @classmethod
+  def get(cls, src_lang, tgt_lang):
+    key = (src_lang.lower(), tgt_lang.lower())
+    with cls._lock:
+      components = cls._registry.get(key)
+      if components:
+        cls._registry.move_to_end(key)
+        return components
+      components = cls(*key)
+      cls._registry[key] = components
+      if len(cls._registry) > cls.MAX_SIZE:
+        cls._registry.popitem(last=False)
+      return components
+
+  # Shared DB handle, e.g. for glossary lookups of POS & split matching
+  @classmethod
+  def db(cls):
+    if cls._db is None:
+      with cls._db_lock:
+        if cls._db is None:
+          from TMDbApi.TMDbApi import TMDbApi
+          cls._db = TMDbApi()
+    return cls._db
+
+  @classmethod
+  def clear(cls):
+    with cls._lock:
+      cls._registry.clear()
+
+  # TMRegexMatch or None if regex is not supported for the language pair
+  @property
+  def regex(self):
+    def create():
+      try:
+        return TMRegexMatch(self.src_lang, self.tgt_lang)
+      except ValueError:
+        logging.info("Unsupported regex for matching {}-{}".format(self.src_lang, self.tgt_lang))
+        return None
+    return self._get_component('regex', create)
+
+  @property
+  def pos_match(self):
+    return self._get_component('pos_match', lambda: TMPosMatch(self.src_lang, self.tgt_lang))
+
+  # Split rules of source language
+  def split(self, lang_class):
+    return self._get_component(('split', lang_class), lambda: TMSplit(lang_class, self.src_lang))
+
+  def _get_component(self, name, create):
+    if name not in self._components:
+      with self._lock:
+        if name not in self._components:
+          logging.info("Loading {} for {}-{}".format(name, self.src_lang, self.tgt_lang))
+          self._components[name] = create()
+    return self._components[name]
@@ -0,0 +1,116 @@
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import os
+import sys
+import re
+import logging
+import threading
+
+sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', '..'))
+sys.path = [p for p in sys.path if p]
+
+from TMPreprocessor.TMRegExpPreprocessor import TMRegExpPreprocessor
+from TMMatching.TMRegxMatch import TMRegexMatch
+from TMMatching.TMUtilsMatching import TMUtilsMatching
+from TMMatching.TMTextProcessors import TMTextProcessors
+from TMDbApi.TMUtils import TMUtils
+
+
+# Matching features of a monolingual segment computed once at ingestion time and
+# stored in its document (field 'features'), so that TMMatching doesn't have to
+# recompute them for every candidate of every query:
+#  - text_re, text_re_reduce: tags reduced text after regular expressions and its simplified version
+#  - words, stop_words: word and stop word sequences of the tags reduced text
+#  - text_tok: tokenized text
+# Features are computed for the short language of the segment (as queries are
+# done by short language) and depend on it (regexes and tokenizers are language
+# specific), so they are used only for queries of the same language and only if
+# their VERSION is current; otherwise TMMatching falls back to computing them.
+# Bump VERSION whenever the computation (or the regex pipe) changes.
+class TMMatchingFeatures:
+  VERSION = 1
+  TAG_RE = re.compile("</?T[0-9]*/?>")
+
+  _lock = threading.Lock()
+  _regex = dict()       # lang -> TMRegExpPreprocessor or None if unsupported
+  _unsupported = set()  # langs without tokenizer
+
+  @staticmethod
+  def compute(text, lang):
+    lang = TMUtils.lang2short(lang)
+    features = {'version': TMMatchingFeatures.VERSION, 'lang': lang}
+    # Same tags reduction as in TMMatching._reduce_src_tags
+    text_reduce = TMUtilsMatching.reduce_tags(text) if TMMatchingFeatures.TAG_RE.search(text) else text
+    regex = TMMatchingFeatures._get_regex(lang)
+    if regex:
+      features['text_re'] = regex.process(text_reduce)
+      features['text_re_reduce'] = TMRegexMatch.simplified_name(features['text_re'])
+    st_words = TMUtilsMatching.check_stopwords_set(lang)
+    if st_words:
+      features['words'], features['stop_words'] = TMMatchingFeatures._word_sequence(text_reduce, st_words)
+    tokenizer = TMMatchingFeatures._get_tokenizer(lang)
+    if tokenizer:
+      try:
+        features['text_tok'] = tokenizer.tokenizer.process(text)
+      except Exception as e:
+        logging.warning("Failed to tokenize {}: {}".format(text, e))
+    return features
+
+  # Returns features of the segment side ('source' or 'target') if they are usable
+  # for the given language, None otherwise
+  @staticmethod
+  def get(segment, ftype, lang):
+    features = getattr(segment, ftype + '_features', None)
+    if not features or features.get('version') != TMMatchingFeatures.VERSION: return None
+    if features.get('lang') != lang.lower(): return None
+    return features
+
+  ############### Helper methods ###################
+  @staticmethod
+  def _get_regex(lang):
+    if lang not in TMMatchingFeatures._regex:
+      with TMMatchingFeatures._lock:
+        if lang not in TMMatchingFeatures._regex:
+          try:
+            TMMatchingFeatures._regex[lang] = TMRegExpPreprocessor(lang, pipe=TMRegexMatch.PIPE)
+          except Exception as e:
+            logging.info("Unsupported Regex for {}, skip regex features".format(lang))
+            TMMatchingFeatures._regex[lang] = None
+    return TMMatchingFeatures._regex[lang]
+
+  @staticmethod
+  def _get_tokenizer(lang):
+    if lang in TMMatchingFeatures._unsupported: return None
+    try:
+      return TMTextProcessors.tokenizer(lang)
+    except Exception as e:
+      logging.info("Unsupported Tokenizer for {}, skip tokenized feature".format(lang))
+      TMMatchingFeatures._unsupported.add(lang)
+      return None
+
+  # Same as TMMatching._word_sequence (can't be imported here because of circular imports)
+  @staticmethod
+  def _word_sequence(text, st_words):
+    from TMMatching.TMMatching import TMMatching
+    return TMMatching._word_sequence(text, st_words)
@@ -28,7 +28,6 @@ sys.path = [p for p in sys.path if p]
 
 from TMMatching.TMUtilsMatching import TMUtilsMatching
 from Config.Config import G_CONFIG
-import TMDbApi
 
 
 
@@ -37,7 +36,12 @@ class TMPosMatch():
   def __init__(self, src_lang, tgt_lang):
     self.src_lang = src_lang
     self.tgt_lang = tgt_lang
-    self.tmdb_api = TMDbApi.TMDbApi.TMDbApi()
+
+  # Shared DB handle (created once per process)
+  @property
+  def tmdb_api(self):
+    from TMMatching.TMMatchingComponents import TMMatchingComponents
+    return TMMatchingComponents.db()
 
   def process(self, tok_query, universal_query, src_word_pos, tgt_word_pos, align_features): #src_text, src_pos, tgt_pos, tgt_text,
 
@@ -52,6 +52,7 @@ class TMTags():
 class TMRegexMatch():
   PATTERN  = re.compile('(\|[A-Z]+\|){1,3}')
   SIMPLE_PATTERN = re.compile('(\|?[A-Z]+\|)')
+  PIPE = ['formula', 'datetime', 'bullet', 'munit', 'acronym', 'email', 'url', 'number']
 
   def __init__(self, src_lang, tgt_lang):
 
@@ -59,9 +60,9 @@ class TMRegexMatch():
     self.tgt_lang = tgt_lang
     # Initialize regexp preprocessors
     self.re_pp = dict()
-    self.pipe = ['formula', 'datetime', 'bullet',  'munit', 'acronym', 'email', 'url', 'number'] #
+    self.pipe = TMRegexMatch.PIPE
     for lang in [src_lang, tgt_lang]: #'acronym', 'email', 'url', 'datetime', 'formula', 'number'
-      self.re_pp[lang] = TMRegExpPreprocessor(lang, pipe = ['formula', 'datetime', 'bullet', 'munit', 'acronym', 'email', 'url', 'number'])
+      self.re_pp[lang] = TMRegExpPreprocessor(lang, pipe = TMRegexMatch.PIPE)
 
   @staticmethod
   def simplified_name(text_re): #text_re = '|NUMBER| September |DATETIME| (|ACRONYM|/|FORMULA||BULLET|'
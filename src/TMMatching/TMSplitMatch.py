@@ -28,7 +28,6 @@ sys.path = [p for p in sys.path if p]
 
 from TMMatching.TMUtilsMatching import TMUtilsMatching
 from TMAutomaticTranslation.TMAutomaticTranslation import TMAutomaticTranslation
-import TMDbApi
 import logging
 import math
 
@@ -43,7 +42,6 @@ class TMSplitMatch():
     self.aut_trans = aut_trans
     self.domain = domain
 
-    self.tmdb_api = TMDbApi.TMDbApi.TMDbApi()
 
     self.split_type = split_type
 
@@ -71,6 +69,12 @@ class TMSplitMatch():
 
     #self.query_dic = {'query': self.query}
 
+  # Shared DB handle (created once per process)
+  @property
+  def tmdb_api(self):
+    from TMMatching.TMMatchingComponents import TMMatchingComponents
+    return TMMatchingComponents.db()
+
   def tgt_list_marks(self, list_marks):
 
     my_puntation_list = ['!', '"', '#', '$', '%', '&', "'", ')', '*', '+', ',', '-', '.', ':', ';', '<', '=', '>', '?','@','\\', ']', '^', '_', '`', '|', '}', '~', '。', '，', '；', '、']
@@ -25,6 +25,8 @@ import logging
 import re
 
 import editdistance
+from rapidfuzz.process import cdist
+from rapidfuzz.distance import Levenshtein
 
 from TMAutomaticTranslation.TMAutomaticTranslation import TMAutomaticTranslation
 from TMMatching.TMTextProcessors import TMTextProcessors
@@ -36,6 +38,7 @@ class TMUtilsMatching:
 
   tags = dict()
   stop_words = dict()
+  stop_words_sets = dict()
 
   @staticmethod
   def check_stopwords(langs):  # langs --> ('en', 'es')
@@ -44,6 +47,15 @@ class TMUtilsMatching:
       TMUtilsMatching.stop_words[langs] = TMStopWords(langs)
     return TMUtilsMatching.stop_words[langs].stop_words
 
+  # Same as check_stopwords, but returns a set for fast lookups
+  @staticmethod
+  def check_stopwords_set(langs):
+    langs = langs.upper()
+    if not langs in TMUtilsMatching.stop_words_sets:
+      stop_words = TMUtilsMatching.check_stopwords(langs)
+      TMUtilsMatching.stop_words_sets[langs] = frozenset(stop_words) if stop_words else None
+    return TMUtilsMatching.stop_words_sets[langs]
+
   @staticmethod
   def process_tags(langs):  # langs --> ('en', 'es')
     if not langs in TMUtilsMatching.tags:
@@ -110,6 +122,16 @@ class TMUtilsMatching:
       text = TMTextProcessors.tokenizer(lang).tokenizer.tokenize_sent(text)
     return text
 
+  # Same as pre_process, but for a list of texts in one call, which matters for POS
+  # taggers running an external process (TreeTagger, Stanford etc.) per call
+  @staticmethod
+  def pre_process_batch(texts, lang, preprocess, dic_re):
+    if preprocess == 'pos_tagger':
+      if not texts: return []
+      return [" ".join([word_pos[1] for word_pos in posTag_text if len(word_pos) > 1])
+              for posTag_text in TMTextProcessors.pos_tagger(lang).tag_segments(texts)]
+    return [TMUtilsMatching.pre_process(text, lang, preprocess, dic_re) for text in texts]
+
     # Problems: Tags simplification include blank space, that probably is a problem for the subsequences steps.
 
 
@@ -195,6 +217,12 @@ class TMUtilsMatching:
   def _edit_distance(src_x, src_y):
     return editdistance.eval(src_x, src_y)#(100 - ((editdistance.eval(src_x, src_y)/len(src_x)) * 100))
 
+  # Edit distances between src_x and each string of list_y, computed in one call
+  @staticmethod
+  def _edit_distances(src_x, list_y):
+    if not list_y: return []
+    return cdist([src_x], list_y, scorer=Levenshtein.distance)[0].tolist()
+
   # @staticmethod
   # def simplified_tags(src, tgt):
   #   return 1 - (0.25 * abs(int(src) - int(tgt)))
\ No newline at end of file
@@ -0,0 +1,228 @@
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+import os, sys
+sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..'))
+
+import subprocess
+import threading
+import logging
+import select
+import queue
+import time
+
+from Config.Config import G_CONFIG
+
+
+class TMCoProcessError(Exception):
+  pass
+
+
+# Long-lived external process (tokenizer, segmenter) talking a line-delimited protocol:
+# one request line is written to its stdin, the response is either one line or, if
+# terminator is given, all lines until the terminator line
+class TMCoProcess:
+
+  def __init__(self, args, terminator=None):
+    self.args = args
+    self.terminator = terminator
+    self.proc = None
+    self._buffer = b''
+
+  def start(self):
+    self.proc = subprocess.Popen(self.args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    self._buffer = b''
+
+  def stop(self):
+    if not self.proc: return
+    try:
+      self.proc.kill()
+      self.proc.wait(timeout=5)
+    except Exception as e:
+      logging.warning("Failed to stop {}: {}".format(self.args[0], e))
+    finally:
+      for f in [self.proc.stdin, self.proc.stdout]:
+        try:
+          f.close()
+        except Exception:
+          pass
+      self.proc = None
+
+  # Health check: process is running
+  def alive(self):
+    return self.proc is not None and self.proc.poll() is None
+
+  # Returns response lines of the request
+  def request(self, text, timeout):
+    if not self.alive(): self.start()
+    deadline = time.monotonic() + timeout
+    # Protocol is line-delimited, thus request must be a single line
+    self.proc.stdin.write((' '.join(text.splitlines()) + '\n').encode('utf-8'))
+    self.proc.stdin.flush()
+    if self.terminator is None:
+      return [self._readline(deadline)]
+    lines = []
+    while True:
+      line = self._readline(deadline)
+      if line == self.terminator: return lines
+      lines.append(line)
+
+  def _readline(self, deadline):
+    fd = self.proc.stdout.fileno()
+    while b'\n' not in self._buffer:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+        raise TMCoProcessError("Timeout waiting for {}".format(self.args[0]))
+      chunk = os.read(fd, 65536)
+      if not chunk: raise TMCoProcessError("{} exited with code {}".format(self.args[0], self.proc.poll()))
+      self._buffer += chunk
+    line, self._buffer = self._buffer.split(b'\n', 1)
+    return line.decode('utf-8').rstrip('\r')
+
+
+"""
+  @api {INFO} /TMCoProcessPool TMCoProcessPool -- Pool of long-lived external tokenizer processes
+  @apiName TMCoProcessPool
+  @apiVersion 0.1.0
+  @apiGroup TMTokenizer
+
+  @apiExample {curl} Example & Notes
+
+  # External tools (Moses tokenizer, Pragmatic segmenter) are started once and reused instead
+  # of spawning a new process per text. There is one pool per tool and language (see get()),
+  # each of them having up to 'size' processes (see tokenizer.coprocess in the configuration).
+  # Processes are started lazily and restarted if they crash or time out.
+  # The first request is preceded by a startup probe: if the tool doesn't answer it within
+  # 'probe_timeout', it doesn't talk the protocol (or can't start) and the pool is disabled
+  # right away. After 'max_failures' consecutive failures the pool is disabled as well. A
+  # disabled pool raises TMCoProcessError, so that callers fall back to one process per call.
+  # Processes belong to the OS process which started them: a forked child starts its own.
+
+  pool = TMCoProcessPool.get('moses', 'en', ['tokenizer.perl', '-b', '-l', 'en'])
+  pool.process('This is a test.') # --> ['This is a test .']
+"""
+class TMCoProcessPool:
+  CONFIG = G_CONFIG.get_coprocess_pool()
+  ENABLED = CONFIG['enabled']
+
+  PROBE = 'Probe.'
+
+  _lock = threading.Lock()
+  _pools = dict() # (tool, language) -> pool
+
+  def __init__(self, args, terminator=None, size=None, timeout=None, max_failures=None, probe=None, probe_timeout=None):
+    self.args = args
+    self.terminator = terminator
+    self.size = size if size else self.CONFIG['size']
+    self.timeout = timeout if timeout else self.CONFIG['timeout']
+    self.max_failures = max_failures if max_failures else self.CONFIG['max_failures']
+    self.probe = probe if probe else self.PROBE
+    self.probe_timeout = probe_timeout if probe_timeout else self.CONFIG['probe_timeout']
+    self._state_lock = threading.Lock()
+    self._reset()
+
+  # Processes, probe & failures of this OS process. Processes inherited from the parent
+  # are dropped without stopping them (they are still used by the parent)
+  def _reset(self):
+    self._pid = os.getpid()
+    self._probed = False
+    self.failures = 0
+    self._idle = queue.Queue()
+    for i in range(self.size):
+      self._idle.put(TMCoProcess(self.args, self.terminator))
+
+  # Shared pool of the tool & language
+  @classmethod
+  def get(cls, tool, language, args, terminator=None):
+    key = (tool, language.lower())
+    with cls._lock:
+      if key not in cls._pools:
+        cls._pools[key] = cls(args, terminator)
+      return cls._pools[key]
+
+  @classmethod
+  def shutdown(cls):
+    with cls._lock:
+      pools = list(cls._pools.values())
+      cls._pools.clear()
+    for pool in pools:
+      pool.close()
+
+  def disabled(self):
+    return self.failures >= self.max_failures
+
+  # Process text by one of the pool processes, returns response lines. A failed
+  # request is retried once with a restarted process
+  def process(self, text):
+    self._check_pid()
+    self._check_probe()
+    if self.disabled(): raise TMCoProcessError("Disabled after {} failures: {}".format(self.failures, self.args[0]))
+    try:
+      worker = self._idle.get(timeout=self.timeout)
+    except queue.Empty:
+      raise TMCoProcessError("No idle process of {}".format(self.args[0]))
+    try:
+      for attempt in range(2):
+        try:
+          lines = worker.request(text, self.timeout)
+          with self._state_lock:
+            self.failures = 0
+          return lines
+        except (TMCoProcessError, OSError) as e:
+          logging.warning("External process failed, restarting: {}".format(e))
+          worker.stop()
+          with self._state_lock:
+            self.failures += 1
+          if self.disabled(): break
+      raise TMCoProcessError("Failed to process by {}".format(self.args[0]))
+    finally:
+      self._idle.put(worker)
+
+  def _check_pid(self):
+    if self._pid != os.getpid():
+      with self._state_lock:
+        if self._pid != os.getpid():
+          self._reset()
+
+  # Startup probe, done once by the first request (others wait for it)
+  def _check_probe(self):
+    if self._probed: return
+    with self._state_lock:
+      if self._probed: return
+      worker = self._idle.get()
+      try:
+        worker.request(self.probe, self.probe_timeout)
+      except (TMCoProcessError, OSError) as e:
+        logging.error("Startup probe of {} failed, using one process per call: {}".format(self.args[0], e))
+        worker.stop()
+        self.failures = self.max_failures
+      finally:
+        self._idle.put(worker)
+        self._probed = True
+
+  def close(self):
+    for i in range(self.size):
+      try:
+        self._idle.get(timeout=self.timeout).stop()
+      except queue.Empty:
+        logging.warning("Busy process of {} was not stopped".format(self.args[0]))
@@ -22,6 +22,7 @@
 # under the License.
 #
 import os, sys
+import re
 sys.path.append("..")
 
 cwd = os.getcwd()
@@ -82,7 +83,129 @@ Code based on --> @author: Nathan Schneider (nschneid)
   * See TMRDRPOSTagger constructor
 """
 
+# Compiled SCRDR tree of RDRPOSTagger: the linked nodes are flattened into arrays and
+# each node condition into a tuple of (context index, value) pairs, so that firing a
+# node doesn't scan all 13 context attributes of every visited node. Initial tags
+# (lexicon lookup) are memoized per word. Tagging is the same as by tagRawSentence,
+# but returns [word, tag] pairs directly instead of "word/tag" strings
+class TMCompiledRDRTree():
+  CACHE_SIZE = 100000
+  QUOTES = ["\u201c", "\u201d", "\""]
+  NUMBER_RE = re.compile(r"[0-9]+")
+  # Lexicon suffixes (length, min. word length) in lookup order
+  SUFFIXES = [(5, 6), (4, 5), (3, 4), (2, 4)]
+  # Context of a token: prevWord2, prevTag2, prevWord1, prevTag1, word, tag, nextWord1, nextTag1,
+  # nextWord2, nextTag2, suffixL2, suffixL3, suffixL4. Missing values are placeholders (see FWObject)
+  EMPTY_CONTEXT = ["<W>", "<T>"] * 5 + ["<SFX>"] * 3
+
+  def __init__(self, root, lexicon):
+    self.lexicon = lexicon
+    self.conditions = []
+    self.conclusions = []
+    self.depths = []
+    self.except_child = []
+    self.else_child = []
+    self._compile(root)
+    self._initial_tags = dict()
+
+  # Returns list of [word, tag] pairs of the (tokenized) sentence
+  def tag(self, sentence):
+    words = []
+    tags = []
+    for word in sentence.split():
+      if word in self.QUOTES: word = "''"
+      words.append(word)
+      tags.append(self._initial_tag(word))
+    tagged = []
+    n = len(words)
+    for i in range(n):
+      context = list(self.EMPTY_CONTEXT)
+      word = words[i]
+      context[4] = word
+      context[5] = tags[i]
+      if len(word) >= 4:
+        context[10] = word[-2:]
+        context[11] = word[-3:]
+      if len(word) >= 5:
+        context[12] = word[-4:]
+      if i > 0:
+        context[2] = words[i - 1]
+        context[3] = tags[i - 1]
+      if i > 1:
+        context[0] = words[i - 2]
+        context[1] = tags[i - 2]
+      if i < n - 1:
+        context[6] = words[i + 1]
+        context[7] = tags[i + 1]
+      if i < n - 2:
+        context[8] = words[i + 2]
+        context[9] = tags[i + 2]
+      fired = self._fire(context)
+      # Fired at root: initial tag
+      tagged.append([word, self.conclusions[fired] if self.depths[fired] > 0 else tags[i]])
+    return tagged
+
+  def _fire(self, context):
+    conditions = self.conditions
+    node = 0
+    fired = 0
+    while node >= 0:
+      for i, value in conditions[node]:
+        if context[i] != value:
+          node = self.else_child[node]
+          break
+      else:
+        fired = node
+        node = self.except_child[node]
+    return fired
+
+  # Same as InitialTagger.initializeSentence for one word
+  def _initial_tag(self, word):
+    tag = self._initial_tags.get(word)
+    if tag is not None: return tag
+    lexicon = self.lexicon
+    if word in lexicon:
+      tag = lexicon[word]
+    # Note: initializeSentence also looks up the lower-cased word, but as bytes, which never matches
+    elif self.NUMBER_RE.search(word):
+      tag = lexicon["TAG4UNKN-NUM"]
+    else:
+      tag = None
+      for length, min_length in self.SUFFIXES:
+        if len(word) >= min_length:
+          suffix = ".*" + word[-length:]
+          if suffix in lexicon:
+            tag = lexicon[suffix]
+            break
+      if tag is None:
+        tag = lexicon["TAG4UNKN-CAPITAL"] if word[0].isupper() else lexicon["TAG4UNKN-WORD"]
+    if len(self._initial_tags) >= self.CACHE_SIZE: self._initial_tags.clear()
+    self._initial_tags[word] = tag
+    return tag
+
+  def _compile(self, root):
+    # Iterative traversal, trees are deep (long else chains)
+    index = dict()
+    nodes = []
+    stack = [root]
+    while stack:
+      node = stack.pop()
+      index[id(node)] = len(nodes)
+      nodes.append(node)
+      for child in [node.elseChild, node.exceptChild]:
+        if child is not None: stack.append(child)
+    for node in nodes:
+      self.conditions.append(tuple((i, value) for i, value in enumerate(node.condition.context) if value is not None))
+      self.conclusions.append(node.conclusion)
+      self.depths.append(node.depth)
+      self.except_child.append(index[id(node.exceptChild)] if node.exceptChild is not None else -1)
+      self.else_child.append(index[id(node.elseChild)] if node.elseChild is not None else -1)
+
+
 class TMRDRPOSTagger():
+  # Tag by compiled tree (TMCompiledRDRTree) instead of RDRPOSTagger.tagRawSentence
+  COMPILED = True
+
   models = {'EN': 'UniPOS/UD_English/train.UniPOS.RDR', #specific tag set
             'DE': 'UniPOS/UD_German/train.UniPOS.RDR',
             'ZH': 'UniPOS/UD_Chinese/train.UniPOS.RDR', #universal tag set
@@ -157,6 +280,7 @@ class TMRDRPOSTagger():
 
     # Load the lexicon for X language
     self.dict = readDictionary(os.path.join(multilingual_posTagger_home, lexicon))
+    self.compiled = TMCompiledRDRTree(self.tagger.root, self.dict)
 
     # Inicialize Tokenizer for X language
     #self.preprocessor = TMTokenizer(language)
@@ -166,9 +290,10 @@ class TMRDRPOSTagger():
     # ****Output --> [[['There', 'EX'], ['is', 'VBZ'], ['a', 'DT'], ['big', 'JJ'], ['problem', 'NN'], ['.', '.']],
     # [['There', 'EX'], ['are', 'VBP'], ['another', 'DT'], ['important', 'JJ'], ['problem', 'NN'], ['.', '.']]]
       #tok_sents = [self.preprocessor.tokenizer.process(s) for s in texts] #Return a list
-      return [[[element.split('/')[0],element.split('/')[1]] for element in self.tagger.tagRawSentence(self.dict, s).split(' ')] for s in texts]#target_sents
+      return self.only_tag_segments(texts)
 
   # Pos tagger without tokenizer
   def only_tag_segments(self, texts):
+    if self.COMPILED: return [self.compiled.tag(s) for s in texts]
     return [[[element.split('/')[0], element.split('/')[1]] for element in
              self.tagger.tagRawSentence(self.dict, s).split(' ')] for s in texts]
@@ -27,6 +27,7 @@ sys.path.append(os.path.join(os.path.abspath(os.path.dirname(__file__)), '..'))
 import subprocess
 import shlex
 import re
+import logging
 import pexpect
 
 
@@ -35,6 +36,7 @@ from nltk import tokenize
 from TMPosTagger.TMJapanesePosTagger import TMMyKyteaTagger
 from TMPreprocessor.Xml.XmlUtils import XmlUtils
 from TMPosTagger.ExternalDetokenizer.TMDetokenizer import Detokenizer
+from TMPosTagger.TMCoProcessPool import TMCoProcessPool, TMCoProcessError
 
 pragmatic_segmenter_home = os.path.join(os.path.abspath(os.path.join(__file__, "../..")), 'tools/pragmatic_segmenter-master/')
 moses_tokenizer_home = os.path.join(os.path.abspath(os.path.join(__file__, "../..")), 'tools/mosesdecoder-master/scripts/tokenizer/')
@@ -44,6 +46,12 @@ TAG_PREFIX = 'T'  # Paterns to join tags that tokenized split
 TOK_PATTERN = re.compile('< /?{}[0-9]*/? >'.format(TAG_PREFIX))
 JOIN_PATTERN = '(<)( /?T[0-9]+/? )(>)'
 
+# Shared pool of long-lived Pragmatic segmenters of the language (see segmenter_server.rb)
+def pragmatic_pool(language):
+  if not TMCoProcessPool.ENABLED: return None
+  args = ['ruby', pragmatic_segmenter_home + 'segmenter_server.rb', language.lower()]
+  return TMCoProcessPool.get('pragmatic', language, args, terminator='')
+
 class TMStanfordTokenizer():
 
   models = {'ZH': 'ctb.gz',
@@ -157,10 +165,16 @@ class TMPragmatic():
   def __init__(self, language):
 
     self.args = 'ruby ' + pragmatic_segmenter_home + 'segmenter.rb ' + language.lower()
+    self.pool = pragmatic_pool(language)
 
   # Input: Hello world. My name is Mr. Smith. I work for the U.S. Government and I live in the U.S. I live in New York.
   # Output: ['Hello world.', 'My name is Mr. Smith.', 'I work for the U.S. Government and I live in the U.S.', 'I live in New York.']
   def tokenize_sent(self, text):
+      if self.pool and not self.pool.disabled():
+        try:
+          return self.pool.process(text)
+        except TMCoProcessError as e:
+          logging.warning("Pragmatic segmenter process failed, segment by a new one: {}".format(e))
       sentences = pexpect.run(self.args + ' ' '"' + text + '"', withexitstatus=False)
       text = [sent for sent in sentences.decode("utf-8").split('\r\n') if sent]
       return text
@@ -187,17 +201,25 @@ class TMMosesTokenizer():
     #-protected --> specify file with patters to be protected in tokenisation (URLs, etc)
     #-no-escape --> don't perform HTML escaping on apostrophy, quotes
     self.args = shlex.split(moses_tokenizer_home + 'tokenizer.perl -protect -no-escape -l ' + language.lower())
-    #self.tokenizer = Popen(self.args, stdin=PIPE, stdout=PIPE)
+    # -b --> disable Perl buffering, so that each line is tokenized as soon as it is read
+    self.pool = TMCoProcessPool.get('moses', language, self.args + ['-b']) if TMCoProcessPool.ENABLED else None
 
   #Input: String
   #Output: Esto es un problema muy grande y complicado .
   def process(self, text):
     #Probably if good transform the input text in ' ' + text + '\n'
-
-    tokenizer = subprocess.Popen(self.args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-    tok_sents, tok_exc = tokenizer.communicate(input = text.encode('utf8'))
-    tokenizer.wait()
-    text = (tok_sents.decode("utf-8")).strip('\n')
+    tok_text = None
+    if self.pool and not self.pool.disabled():
+      try:
+        tok_text = self.pool.process(text)[0]
+      except TMCoProcessError as e:
+        logging.warning("Moses tokenizer process failed, tokenize by a new one: {}".format(e))
+    if tok_text is None:
+      tokenizer = subprocess.Popen(self.args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+      tok_sents, tok_exc = tokenizer.communicate(input = text.encode('utf8'))
+      tokenizer.wait()
+      tok_text = (tok_sents.decode("utf-8")).strip('\n')
+    text = tok_text
 
     if re.search(TOK_PATTERN, text):  # Check if the text have tags
       text = XmlUtils.join_tags(text, JOIN_PATTERN)
@@ -357,8 +379,8 @@ class TMTokenizer():
 
     def __init__(self, language):
 
-      args = shlex.split('ruby ' + pragmatic_segmenter_home + 'segmenter.rb ' + language.lower())
-      self.segmenter = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+      self.args = shlex.split('ruby ' + pragmatic_segmenter_home + 'segmenter.rb ' + language.lower())
+      self.pool = pragmatic_pool(language)
 
       # Input:
           # text = 'Labas pasauli. Mano vardas yra p Smithas. Dirbu su JAV vyriausybe ir aš gyventi į JAV, gyvenu Niujorke.'
@@ -366,7 +388,14 @@ class TMTokenizer():
       #Output: ['Labas pasauli.', 'Mano vardas yra p Smithas.', 'Dirbu su JAV vyriausybe ir aš gyventi į JAV, gyvenu Niujorke.']
 
     def tokenize_sent(self, text):
-      sentences, tok_exc = self.segmenter.communicate(text.encode('utf8'))
+      if self.pool and not self.pool.disabled():
+        try:
+          return self.pool.process(text)
+        except TMCoProcessError as e:
+          logging.warning("Pragmatic segmenter process failed, segment by a new one: {}".format(e))
+      # Process reads the whole input, thus it can't be reused
+      segmenter = subprocess.Popen(self.args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+      sentences, tok_exc = segmenter.communicate(text.encode('utf8'))
       return [sent for sent in sentences.decode("utf-8").split('\n') if sent]
 
 """
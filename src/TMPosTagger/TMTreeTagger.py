@@ -22,6 +22,7 @@
 # under the License.
 #
 import os
+import logging
 
 import treetaggerwrapper
 
@@ -55,21 +56,55 @@ treetagger_posTagger_home = os.path.join(os.path.abspath(os.path.join(__file__ ,
 """
 
 class TMTreeTagger():
+  # Sentences of a batch are tagged by one tag_text() call. Between sentences the same
+  # sequence is fed as treetaggerwrapper feeds around each text (end mark & flush sentence),
+  # so that each sentence is tagged in the same context as if it was tagged alone.
+  # Start & end sentinels are passed through by TreeTagger as SGML tags, tokens between
+  # them are dropped
+  START_SENTINEL = '<nectm-start/>'
+  END_SENTINEL = '<nectm-end/>'
+  BATCH_SIZE = 1000
 
   def __init__(self, language):
 
     self.tagger = treetaggerwrapper.TreeTagger(TAGLANG = language.lower(), TAGDIR = treetagger_posTagger_home)
     self.preprocessor = TMTokenizer(language.upper())
 
-  def tag_segments(self, texts):
+  def tag_segments(self, texts, batch=True):
     # Store tagged segment as a list of pairs where each pair consists of a word and tag,
     # e.g. "There is a problem => [['There', 'EX'], ['is', 'VBZ'], ['a', 'DT'], ['problem', 'NN']]
     tok_sents = [self.preprocessor.tokenizer.process(s) for s in texts]
-    return [[element.split('\t')[:2] for element in self.tagger.tag_text(text)] for text in tok_sents ]
+    return self.only_tag_segments(tok_sents, batch)
 
     # Pos tagger without tokenizer
-  def only_tag_segments(self, texts):
-    return [[element.split('\t')[:2] for element in self.tagger.tag_text(text)] for text in texts]
+  def only_tag_segments(self, texts, batch=True):
+    if not batch: return [self._tag_text(text) for text in texts]
+    tagged = []
+    for i in range(0, len(texts), self.BATCH_SIZE):
+      tagged += self._tag_batch(texts[i:i + self.BATCH_SIZE])
+    return tagged
+
+  def _tag_text(self, text):
+    return [element.split('\t')[:2] for element in self.tagger.tag_text(text)]
+
+  def _tag_batch(self, texts):
+    if len(texts) < 2: return [self._tag_text(text) for text in texts]
+    separator = ' {} . {} {} '.format(self.END_SENTINEL, ' '.join(self.tagger.dummysequence.split()), self.START_SENTINEL)
+    sents = [[]]
+    in_text = True
+    for element in self.tagger.tag_text(separator.join(texts)):
+      if element == self.END_SENTINEL:
+        in_text = False
+      elif element == self.START_SENTINEL:
+        in_text = True
+        sents.append([])
+      elif in_text:
+        sents[-1].append(element.split('\t')[:2])
+    # Sentinel in the text - tag sentence by sentence
+    if len(sents) != len(texts):
+      logging.warning("Unexpected TreeTagger batch output, tag sentence by sentence")
+      return [self._tag_text(text) for text in texts]
+    return sents
 
 
 if __name__ == "__main__":
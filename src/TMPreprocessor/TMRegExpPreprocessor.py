@@ -32,18 +32,25 @@ from babel.units import *
 from TMPreprocessor import locales
 
 class TMRegExpPreprocessor:
+  # Characters required by the patterns (see RegExp.TRIGGER), found by one scan of the text
+  TRIGGER_RE = re.compile(r'\d|[@./)+\-*=]')
+
+  _regexps = dict() # locale -> regular expressions compiled once per locale
+
   def __init__(self, lc = 'en_US', pipe = ['formula', 'datetime', 'bullet', 'munit', 'acronym', 'email', 'url', 'number']):
-    self.regexp = {
-      'number'  : Number(lc),
-      'email'   : Email(),
-      'url'     : Url(),
-      'datetime': DateTime(lc),
-      'munit'   : MeasurementUnit(lc),
-      'formula' : Formula(lc),
-      'acronym' : Acronym(),
-      'bullet'  : Bullet(lc)
-
-    }
+    if lc not in TMRegExpPreprocessor._regexps:
+      TMRegExpPreprocessor._regexps[lc] = {
+        'number'  : Number(lc),
+        'email'   : Email(),
+        'url'     : Url(),
+        'datetime': DateTime(lc),
+        'munit'   : MeasurementUnit(lc),
+        'formula' : Formula(lc),
+        'acronym' : Acronym(),
+        'bullet'  : Bullet(lc)
+
+      }
+    self.regexp = TMRegExpPreprocessor._regexps[lc]
     self.pipe = pipe
     # Validate pipe
     assert(self.validate_pipe(pipe))
@@ -58,23 +65,34 @@ class TMRegExpPreprocessor:
     return True
 
   def process(self, text):
-    for pattern in self.pipe:
+    for pattern in self._applicable(text):
       text = self.regexp[pattern].process(text, self._key2placeholder(pattern))
     return text
 
   def get_pattern_value(self, text):
 
     pattern_value_list = []
-    for pattern in self.pipe:
+    for pattern in self._applicable(text):
       individual_list, text = self.regexp[pattern].get_pattern_value(text, self._key2placeholder(pattern)) #get_text(text)
       if individual_list:
         pattern_value_list.append(individual_list)
     return [item for sublist in pattern_value_list for item in sublist], text
 
+  # Patterns of the pipe, in order, which may match the text. Placeholders don't contain any
+  # trigger characters, thus patterns skipped for the original text would not match after
+  # the substitutions of the preceding patterns either
+  def _applicable(self, text):
+    triggers = set(['0' if c.isdecimal() else c for c in self.TRIGGER_RE.findall(text)])
+    return [pattern for pattern in self.pipe if self.regexp[pattern].TRIGGER is None or not triggers.isdisjoint(self.regexp[pattern].TRIGGER)]
+
   def _key2placeholder(self, key):
     return '|{}|'.format(key.upper())
 
 class RegExp(object):
+  # Characters any match of the pattern contains at least one of ('0' stands for any digit),
+  # texts without them are skipped. None - no such characters, the pattern is always applied
+  TRIGGER = None
+
   def __init__(self, regexp):
     self.regexp = regexp
     self.compiled_regexp = re.compile(self.regexp, re.I|re.X)
@@ -82,16 +100,24 @@ class RegExp(object):
   def process(self, text, placeholder):
     return re.sub(self.compiled_regexp, placeholder, text)
 
+  # Same substitution as process(), collecting distinct matched values in one pass
   def get_pattern_value(self, text, placeholder):
 
     pattern_value_list = []
 
-    while re.search(self.compiled_regexp, text):
-      pattern_value_list.append((placeholder,re.search(self.compiled_regexp, text).group()))
-      #pattern_value_list.append((placeholder, self.what_replace(text)))
-      text = re.sub(re.search(self.compiled_regexp, text).group(), placeholder, text)
-      #text = self.process_replace(text, placeholder)
-    return pattern_value_list, text
+    def replace(match):
+      if (placeholder, match.group()) not in pattern_value_list:
+        pattern_value_list.append((placeholder, match.group()))
+      return placeholder
+    return pattern_value_list, re.sub(self.compiled_regexp, replace, text)
+
+  # Replace all occurrences of each (stripped) match - used by patterns matching trailing whitespaces
+  def _replace_stripped(self, text, placeholder, pattern_value_list=None):
+    for match in re.finditer(self.compiled_regexp, text):
+      if pattern_value_list is not None and (placeholder, match.group().strip()) not in pattern_value_list:
+        pattern_value_list.append((placeholder, match.group().strip()))
+      text = text.replace(match.group().strip(), placeholder)
+    return text
 
   # Get locale-specific ordinal pattern
   def _get_ordinal_pattern(self, lc):
@@ -106,6 +132,8 @@ class RegExp(object):
     return re.search(self.compiled_regexp, text).group()
 
 class Url(RegExp):
+  TRIGGER = './'
+
   def __init__(self):
     super(Url, self).__init__(
       # reference: http://daringfireball.net/2010/07/improved_regex_for_matching_urls
@@ -113,12 +141,16 @@ class Url(RegExp):
     )
 
 class Email(RegExp):
+  TRIGGER = '@'
+
   def __init__(self):
     super(Email, self).__init__(
       # reference: http://www.regular-expressions.info/email.html
       '[A-Z0-9._%+-]+@[A-Z0-9.-]+\.[A-Z]{2,}'    )
 
 class Number(RegExp):
+  TRIGGER = '0'
+
   def __init__(self, lc):
     # reference: http://www.regular-expressions.info/floatingpoint.html
     super(Number, self).__init__('(?<!\<T)(?<!\<\/T)[0-9GROUP_SYMBOL]*DEC_SYMBOL?[0-9]+([eE][-+]?[0-9]+)?')#|(?<!\<\/T)
@@ -145,6 +177,8 @@ class DateTime(RegExp):
     self.months = "|".join([m for m in self.lc.month_names + self.lc.month_abbreviations if m])
     # 5th, 3º, etc
     self.ordinal_pattern = self._get_ordinal_pattern(self.lc)
+    # Month names are followed by an ordinal day, thus all alternatives contain digits
+    if self.ordinal_pattern: self.TRIGGER = '0'
     self.patterns = [
     # =-=-=-= Matches Y-M-D, M-D-Y ex. "january 5, 2012", "january 5th, '12", "jan 5th 2012" =-=-=-= )
     #  """ + self.ordinal_pattern + """
@@ -191,9 +225,12 @@ class DateTime(RegExp):
 
   def process(self, text, placeholder):
     # Workaround for date pattern matching trailing whitespaces. Strip them before substituting
-    for match in re.finditer(self.compiled_regexp, text):
-      text = text.replace(match.group().strip(), placeholder)
-    return text
+    return self._replace_stripped(text, placeholder)
+
+  def get_pattern_value(self, text, placeholder):
+    pattern_value_list = []
+    text = self._replace_stripped(text, placeholder, pattern_value_list)
+    return pattern_value_list, text
 
 
   def do_replace(self, text, replace_value):
@@ -205,6 +242,8 @@ class DateTime(RegExp):
     return re.search(self.compiled_regexp, text).group().strip()
 
 class MeasurementUnit(RegExp):
+  TRIGGER = '0'
+
   def __init__(self, lc):
     self.number = Number(lc)
     self.lc = lc
@@ -220,9 +259,12 @@ class MeasurementUnit(RegExp):
 
   def process(self, text, placeholder):
     # Workaround for date pattern matching trailing whitespaces. Strip them before substituting
-    for match in re.finditer(self.compiled_regexp, text):
-      text = text.replace(match.group().strip(), placeholder) # match.group(1).strip()
-    return text
+    return self._replace_stripped(text, placeholder)
+
+  def get_pattern_value(self, text, placeholder):
+    pattern_value_list = []
+    text = self._replace_stripped(text, placeholder, pattern_value_list)
+    return pattern_value_list, text
 
   def do_replace(self, text, replace_value):
     if re.search(self.compiled_regexp, text):
@@ -243,6 +285,8 @@ class MeasurementUnit(RegExp):
       return None
 
 class Formula(RegExp):
+  TRIGGER = '+-/*='
+
   def __init__(self, lc):
     self.number = Number(lc)
     super(Formula, self).__init__(
@@ -255,7 +299,13 @@ class Formula(RegExp):
     # Unify consecutive formulas which failed to fully match by regexp
     return re.sub("(\|FORMULA\|){2,}", "|FORMULA|", text)
 
+  def get_pattern_value(self, text, placeholder):
+    pattern_value_list, text = super(Formula, self).get_pattern_value(text, placeholder)
+    return pattern_value_list, re.sub("(\|FORMULA\|){2,}", "|FORMULA|", text)
+
 class Acronym(RegExp):
+  TRIGGER = '.'
+
   def __init__(self):
     super(Acronym, self).__init__(
       # TODO: handle ampersand
@@ -265,6 +315,8 @@ class Acronym(RegExp):
     self.compiled_regexp = re.compile(self.regexp, re.U) # case-sensitive
 
 class Bullet(RegExp):
+  TRIGGER = '.)'
+
   def __init__(self, lc):
     self.number = Number(lc)
     super(Bullet, self).__init__(
@@ -40,7 +40,7 @@ class TMXmlTagPreprocessor:
 
   def process(self, text):
     # Check if there any tags at all
-    if not re.search("<.*>", text): return text
+    if '<' not in text or not XmlUtils.HAS_TAG_PATTERN.search(text): return text
     # Keep original text and its stripped version
     org_text = text
     text,stext = XmlUtils.fix_tags(text)
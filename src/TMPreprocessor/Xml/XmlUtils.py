@@ -28,20 +28,31 @@ from lxml import etree
 class XmlUtils:
   TAG_PREFIX = 'T'
   TAG_PATTERN = re.compile('</?{}[0-9]*/?>'.format(TAG_PREFIX))
+  ANY_TAG_PATTERN = re.compile('</?[^<>]+/?>')
+  SPLIT_TAG_PATTERN = re.compile('(</?[^<>]+/?>)')
+  HAS_TAG_PATTERN = re.compile('<.*>')
+  # Tag (possibly unfinished) or a stray '>', see fix_tags()
+  FIX_TAG_PATTERN = re.compile('<(/?)([^<>]*)(>?)|>')
+  SELF_CLOSING_TAG_PATTERN = re.compile('<[^<>]+/>')
+  OPENING_TAG_PATTERN = re.compile('<[^<>/]+>')
+  SPACES_PATTERN = re.compile(' +')
+  WHITESPACES_PATTERN = re.compile(r'\s\s+')
   TAG_PLACEHOLDER = 'ELASTICTMTAG'
   SPACE_PLACEHOLDER = 'ELASTICTMSPACE'
   parser = etree.XMLParser(recover=True)
 
   @staticmethod
   def strip_tags(text):
-    text = re.sub("</?[^<>]+/?>", ' ', text) # remove doble space
-    return re.sub(' +', ' ', text) #re.sub("</?[^<>]+/?>", '', text)
+    if '<' not in text: return XmlUtils.SPACES_PATTERN.sub(' ', text) if '  ' in text else text
+    text = XmlUtils.ANY_TAG_PATTERN.sub(' ', text) # remove doble space
+    return XmlUtils.SPACES_PATTERN.sub(' ', text) #re.sub("</?[^<>]+/?>", '', text)
 
   # Replace tags with a placeholder text
   # TODO: should it be random number to avoid influencing POS tagger as a side effect? )
   @staticmethod
   def replace_tags(text, placeholder=TAG_PLACEHOLDER, adjacent_space_placeholder=None):
-    text = re.sub(XmlUtils.TAG_PATTERN, ' ' + placeholder + ' ', text)
+    if '<' not in text and (not adjacent_space_placeholder or placeholder not in text): return text
+    text = XmlUtils.TAG_PATTERN.sub(' ' + placeholder + ' ', text)
     # Replace spaces adjacent to tag with placeholder to make sure we are not losing them
     # during tokenization/MT/detokenization
     # <a>20 </a><b>Novemver</b> 2016   --> <a> 20 SPACE </a> <b> November </b> SPACE 2016
@@ -60,12 +71,27 @@ class XmlUtils:
 
   @staticmethod
   def extract_tags(text):
-    return re.findall("</?[^<>]+/?>", text)
+    if '<' not in text: return []
+    return XmlUtils.ANY_TAG_PATTERN.findall(text)
+
+  # Strip, reduce and extract tags by one scan of the text. Returns tuple of
+  # (strip_tags(text), reduce_tags(text), extract_tags(text))
+  @staticmethod
+  def scan_tags(text):
+    if '<' not in text: return XmlUtils.strip_tags(text), XmlUtils.reduce_tags(text), []
+    # Texts between tags and tags themselves, alternately
+    parts = XmlUtils.SPLIT_TAG_PATTERN.split(text)
+    tags = parts[1::2]
+    stripped = ' '.join(parts[0::2])
+    # Each tag matched by TAG_PATTERN is a whole match of ANY_TAG_PATTERN
+    for i in range(1, len(parts), 2):
+      if XmlUtils.TAG_PATTERN.fullmatch(parts[i]): parts[i] = ' T '
+    return XmlUtils.SPACES_PATTERN.sub(' ', stripped), XmlUtils.WHITESPACES_PATTERN.sub(' ', ''.join(parts)), tags
 
   # I have <X[1]>a dog</X[1]> ---> I have <T1>a dog</T1>
   @staticmethod
   def simplify_tags(text):
-    if not re.search("<.*>", text): return text
+    if '<' not in text or not XmlUtils.HAS_TAG_PATTERN.search(text): return text
     return XmlUtils.rename_tags(XmlUtils.fix_tags(text)[0])
 
   # i = 'Hola <b> esto </b> es una <T1> prueba </T1>' --> '(</?[^<>]+/?>)([^<>]+)(</?[^<>]+/?>)' --> join words with tags
@@ -81,35 +107,24 @@ class XmlUtils:
 
   @staticmethod
   def reduce_tags(in_str):  # langs --> ('en', 'es')
-    simplified_text = re.sub(re.compile('</?{}[0-9]*/?>'.format('T')), ' T ', in_str)
-    return re.sub("\s\s+", " ", simplified_text)  # Yo tengo un <b>gato</b>. Yo tengo un T gato T.
+    simplified_text = XmlUtils.TAG_PATTERN.sub(' T ', in_str) if '<' in in_str else in_str
+    return XmlUtils.WHITESPACES_PATTERN.sub(" ", simplified_text)  # Yo tengo un <b>gato</b>. Yo tengo un T gato T.
 
 
   # Quick & dirty - replace all tag names with TAG_PREFIX to avoid invalid tag names error during parsing
   # return tuple - text with renamed tags and text stripped of tags
   @staticmethod
   def fix_tags(text):
-    status = 'O'
-    otext = ''
-    stext = ''
-    for i in range(0, len(text)):
-      c = text[i]
-      nc = text[i + 1] if i < len(text) - 1 else ''
-      pc = text[i - 1] if i > 0 else ''
-      if c == '<':
-        status = 'I'
-        otext += c
-        if nc == '/':
-          otext += nc
-      elif c == '>':
-        otext += XmlUtils.TAG_PREFIX
-        if pc == '/': otext += pc
-        otext += c
-        status = 'O'
-      elif status != 'I':
-        otext += c
-        stext += c
-    return otext, stext
+    if '<' not in text and '>' not in text: return text, text
+
+    def fix(match):
+      # Stray '>' outside of a tag
+      if match.group(1) is None:
+        return XmlUtils.TAG_PREFIX + ('/>' if match.start() > 0 and text[match.start() - 1] == '/' else '>')
+      # Unfinished tag: keep only its opening
+      if not match.group(3): return '<' + match.group(1)
+      return '<' + match.group(1) + XmlUtils.TAG_PREFIX + ('/>' if (match.group(1) + match.group(2)).endswith('/') else '>')
+    return XmlUtils.FIX_TAG_PATTERN.sub(fix, text), XmlUtils.FIX_TAG_PATTERN.sub('', text)
 
   # Rename tags using DFS order index
   @staticmethod
@@ -188,11 +203,11 @@ class XmlUtils:
   @staticmethod
   def is_self_closing_tag(e):
     if isinstance(e, str):
-      return re.search('<[^<>]+/>', e)
+      return XmlUtils.SELF_CLOSING_TAG_PATTERN.search(e)
     if not e.text and (not e.tail or not e.tail.strip()): return True
     return False
 
 
   @staticmethod
   def is_opening_tag(e):
-    return re.search('<[^<>/]+>', e)
+    return XmlUtils.OPENING_TAG_PATTERN.search(e)
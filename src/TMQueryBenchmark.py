@@ -0,0 +1,124 @@
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+#
+# Benchmark of batch query (as performed by TmBatchQueryResource, i.e. /tm/query_batch)
+# with map lookup (TMMapES.mget) by a sub-search per source id vs. a terms query per group.
+# Requires running OpenSearch with imported TM for the given language pair, e.g.:
+#
+#   python3 TMQueryBenchmark.py -f ../data/un_short.tmx -sl en -tl es -q 50
+#
+import sys
+sys.path.append("..")
+
+import argparse
+import time
+
+from opensearchpy import MultiSearch
+
+from TMX.TMXParser import TMXParser
+from TMDbApi.TMDbApi import TMDbApi
+from TMDbApi.TMQueryParams import TMQueryParams
+from TMDbApi.TMMap.TMMapES import TMMapES
+from TMDbApi.TMQueryCache import TMQueryCache
+
+
+class Timer(object):
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.end = time.time()
+        self.secs = self.end - self.start
+        self.msecs = self.secs * 1000  # millisecs
+
+
+# MultiSearch counting all added sub-searches
+class CountingMultiSearch(MultiSearch):
+    count = 0
+
+    def add(self, search):
+        CountingMultiSearch.count += 1
+        return super().add(search)
+
+
+def count_sub_searches(es):
+    def multi_search(index=None):
+        if index is None:
+            return CountingMultiSearch(using=es.es)
+        return CountingMultiSearch(using=es.es, index=index)
+    es.multi_search = multi_search
+
+
+def read_queries(args):
+    if args.file.endswith('.tmx'):
+        queries = [s.source_text for s in TMXParser(args.file, lang_pairs=[(args.slang, args.tlang)]).parse()]
+    else:
+        with open(args.file) as f:
+            queries = [l.strip() for l in f if l.strip()]
+    # Repeat queries if not enough
+    while queries and len(queries) < args.totalQueries:
+        queries += queries
+    return queries[:args.totalQueries]
+
+
+def run(db, queries, args):
+    # Same parameters as TmResource._query
+    qparams = TMQueryParams(queries, [], args.slang, args.tlang, args.operation_match.split(','), 'json', 2*args.limit,
+                            None, min_match=args.min_match)
+    CountingMultiSearch.count = 0
+    with Timer() as t:
+        db.query_in_context(qparams)
+    return CountingMultiSearch.count, t.msecs
+
+
+def parse_args():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-f', '--file', type=str, help="TMX file or text file (query per line)", required=True)
+  parser.add_argument('-sl', '--slang', type=str, help="Source language", required=True)
+  parser.add_argument('-tl', '--tlang', type=str, help="Target language", required=True)
+  parser.add_argument('-q', '--totalQueries', type=int, help="Number of queries in a batch", default=50)
+  parser.add_argument('-l', '--limit', type=int, help="Limit of segments per query", default=10)
+  parser.add_argument('-m', '--min_match', type=int, help="Minimum match", default=75)
+  parser.add_argument('-o', '--operation_match', type=str, default='regex,tags,posTag')
+  parser.add_argument('-r', '--repeat', type=int, help="Number of runs per mode", default=3)
+  return parser.parse_args()
+
+if __name__ == "__main__":
+  args = parse_args()
+  queries = read_queries(args)
+  print("=> total queries: %s " % len(queries))
+
+  # Measure actual queries, not cache hits
+  TMQueryCache.ENABLED = False
+  db = TMDbApi()
+  count_sub_searches(db.seg_map.es)
+  # Warm up (POS taggers, tokenizers, index registry etc.)
+  run(db, queries, args)
+
+  for mode, mget_terms in [('per source id', False), ('terms per group', True)]:
+    TMMapES.MGET_TERMS = mget_terms
+    results = [run(db, queries, args) for i in range(args.repeat)]
+    print("=> mget by %s: %s map sub-searches, latency (ms) min: %.1f avg: %.1f" %
+          (mode, results[0][0], min(r[1] for r in results), sum(r[1] for r in results) / len(results)))
@@ -39,11 +39,16 @@ from TMPreprocessor.Xml.TMXmlTagPreprocessor import TMXmlTagPreprocessor
 class TMXParser():
   NS = 'http://www.w3.org/XML/1998/namespace'
 
-  def __init__(self, fname, domain = None, lang_pairs=[], username=None):
+  # If preprocess is False, segment texts are not tag preprocessed (see TMImportPipeline).
+  # Each segment gets tmx_position: (TMX file name within zip, ordinal of its tu element).
+  # If start position is given, parsing starts from that tu (see ImportCheckpoint)
+  def __init__(self, fname, domain = None, lang_pairs=[], username=None, preprocess=True, start=None):
     self.fname = fname #path + TMX file (may be zipped)
     self.domain = domain #TMX domain
     self.lang_pairs = lang_pairs
     self.username = username
+    self.preprocess = preprocess
+    self.start = start
     self.dtd_file = etree.DTD(open(dtd_path, 'rb'))
 
     self.tags_pp = TMXmlTagPreprocessor()
@@ -69,6 +74,13 @@ class TMXParser():
       zip = None
       tmx_fnames = [self.fname]
 
+    skip = 0
+    if self.start:
+      start_fname, skip = self.start
+      # Files parsed before the start one are skipped
+      tmx_fnames = tmx_fnames[tmx_fnames.index(start_fname):]
+      logging.warning("Resuming {} from file {}, tu {}".format(self.fname, start_fname, skip))
+
     for tmx_fname in tmx_fnames:
       self.tmx_fname = os.path.basename(tmx_fname)
       if self.tmx_fname:
@@ -76,7 +88,7 @@ class TMXParser():
         context = etree.iterparse(tmx_file, events=('end',), tag='tu', resolve_entities=False)  #, dtd_validation=True, load_dtd=False remove_comments = True, remove_blank_text = True, no_network = True
         try:
           i = 0
-          for segment in self._iterate(context): # If found any invalid part in xml, stop the process
+          for segment in self._iterate(context, tmx_fname, skip): # If found any invalid part in xml, stop the process
             if not i % 5000:
               logging.warning("Parsed {} segments".format(i))
               logging.info("Sample segment: {}".format(segment.to_dict()))
@@ -84,12 +96,15 @@ class TMXParser():
             yield segment
         except etree.XMLSyntaxError:  # check if file is well formed
           logging.info('Skipping invalid XML {}'.format(self.tmx_fname))
+      skip = 0
 
-  def _iterate(self,context):
+  def _iterate(self, context, tmx_fname=None, skip=0):
     # Extract from --> http:/text/www.ibm.com/developerworks/xml/library/x-hiperfparse/
-    for event, elem in context:
-        for seg in self._parse_tm(elem):
-          yield seg
+    for ordinal, (event, elem) in enumerate(context):
+        if ordinal >= skip:
+          for seg in self._parse_tm(elem):
+            seg.tmx_position = (tmx_fname, ordinal)
+            yield seg
         elem.clear()
         while elem.getprevious() is not None:
             del elem.getparent()[0]
@@ -176,7 +191,7 @@ class TMXParser():
     text = ""
     for t in seg.itertext():
       text += t
-    text = self.tags_pp.process(text)
+    if self.preprocess: text = self.tags_pp.process(text)
     return text
 
   def _parse_metadata(self, element):
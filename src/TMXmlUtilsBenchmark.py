@@ -0,0 +1,99 @@
+#
+# Copyright (c) 2020 Pangeanic SL.
+#
+# This file is part of NEC TM
+# (see https://github.com/shasha79/nectm).
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+#
+# Microbenchmarks of XmlUtils helpers and of the tag preprocessing done for every
+# TU during import (TMXmlTagPreprocessor.process), over segment texts of a TMX file:
+#
+#   python3 TMXmlUtilsBenchmark.py -f ../data/test_tags.tmx -n 10000
+#
+import sys
+sys.path.append("..")
+
+import argparse
+import time
+
+from lxml import etree
+
+from TMPreprocessor.Xml.XmlUtils import XmlUtils
+from TMPreprocessor.Xml.TMXmlTagPreprocessor import TMXmlTagPreprocessor
+
+
+class Timer(object):
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.end = time.time()
+        self.secs = self.end - self.start
+        self.msecs = self.secs * 1000  # millisecs
+
+
+# Segment texts as seen by TMXParser._get_text, i.e. before tag preprocessing
+def read_texts(fname):
+    texts = []
+    for event, seg in etree.iterparse(fname, tag='seg'):
+        texts.append(''.join(seg.itertext()))
+        seg.clear()
+    return texts
+
+
+def separate_calls(text):
+    return XmlUtils.strip_tags(text), XmlUtils.reduce_tags(text), XmlUtils.extract_tags(text)
+
+
+def run(name, func, texts, args):
+    with Timer() as t:
+        for i in range(args.repeat):
+            for text in texts:
+                func(text)
+    print("=> %-28s %8.2f us/call" % (name, t.secs * 1e6 / (args.repeat * len(texts))))
+
+
+def parse_args():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-f', '--file', type=str, help="TMX file", default="../data/test_tags.tmx")
+  parser.add_argument('-n', '--repeat', type=int, help="Number of runs over all texts", default=10000)
+  return parser.parse_args()
+
+if __name__ == "__main__":
+  args = parse_args()
+  pp = TMXmlTagPreprocessor()
+  raw_texts = read_texts(args.file)
+  texts = {'raw': raw_texts,
+           'preprocessed': [pp.process(text) for text in raw_texts],
+           'stripped': [XmlUtils.strip_tags(text).strip() for text in raw_texts]}
+  print("=> total texts: %s, with tags: %s" % (len(raw_texts), len([t for t in raw_texts if '<' in t])))
+
+  for kind in ['raw', 'preprocessed', 'stripped']:
+    print("=> %s texts" % kind)
+    run('process', pp.process, texts[kind], args)
+    run('fix_tags', XmlUtils.fix_tags, texts[kind], args)
+    run('simplify_tags', XmlUtils.simplify_tags, texts[kind], args)
+    run('strip_tags', XmlUtils.strip_tags, texts[kind], args)
+    run('reduce_tags', XmlUtils.reduce_tags, texts[kind], args)
+    run('extract_tags', XmlUtils.extract_tags, texts[kind], args)
+    run('replace_tags', XmlUtils.replace_tags, texts[kind], args)
+    run('strip+reduce+extract', separate_calls, texts[kind], args)
+    run('scan_tags', XmlUtils.scan_tags, texts[kind], args)
@@ -1,16 +1,45 @@
+import os
+import threading
+import logging
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 from Config.Config import G_CONFIG
 from opensearchpy import OpenSearch, helpers, Search, MultiSearch, Q, exceptions
 
 
 class OpenSearchHelper:
+    # Process-wide client (and its connection pool) shared by all helper instances.
+    # OpenSearch client is thread-safe; it is recreated in forked processes (e.g. gunicorn
+    # workers) as connections can't be shared between processes
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+    # Chunking, threads and retries of bulk requests (see opensearch.bulk in the configuration)
+    BULK = G_CONFIG.get_bulk()
+    RETRY_ON_CONFLICT = BULK['retry_on_conflict']
 
     def __init__(self):
+        self.es = self.get_client()
+
+    @classmethod
+    def get_client(cls):
+        if cls._client is None or cls._client_pid != os.getpid():
+            with cls._client_lock:
+                if cls._client is None or cls._client_pid != os.getpid():
+                    cls._client = cls._create_client()
+                    cls._client_pid = os.getpid()
+        return cls._client
+
+    @staticmethod
+    def _create_client():
         config = G_CONFIG.config['opensearch']
 
         def parse_bool(value, default=False):
             if not value:
                 return default
-            return value.lower() in ['true', '1', 'y', 'yes', 't']
+            return str(value).lower() in ['true', '1', 'y', 'yes', 't']
 
         host = config['host'].replace('OPENSEARCH_HOST', '')
         port = config['port'].replace('OPENSEARCH_PORT', '')
@@ -33,12 +62,16 @@ class OpenSearchHelper:
             "verify_certs": verify_certs,
             "ssl_show_warn": verify_certs,
             "ssl_assert_hostname": verify_certs,
+            # Max number of kept-alive connections per host (should be >= number of threads)
+            "maxsize": int(config.get('pool_maxsize', 25)),
+            "http_compress": parse_bool(config.get('http_compress'), default=False),
+            "headers": {"Connection": "keep-alive"},
         }
 
         if user or password:
             opensearch_options['http_auth'] = (user, password)
 
-        self.es = OpenSearch(**opensearch_options)
+        return OpenSearch(**opensearch_options)
 
     def indices_put_template(self, name, body):
         try:
@@ -66,6 +99,23 @@ class OpenSearchHelper:
     def indices_exists(self, index):
         return self.es.indices.exists(index=index)
 
+    def indices_get_settings(self, index):
+        return self.es.indices.get_settings(index=index)
+
+    def indices_put_settings(self, index, body):
+        return self.es.indices.put_settings(index=index, body=body)
+
+    # Blocks until merged, thus might take much longer than regular requests
+    def indices_forcemerge(self, index, max_num_segments=None, request_timeout=3600):
+        return self.es.indices.forcemerge(index=index, max_num_segments=max_num_segments,
+                                          request_timeout=request_timeout)
+
+    def indices_close(self, index):
+        return self.es.indices.close(index=index)
+
+    def indices_open(self, index):
+        return self.es.indices.open(index=index)
+
     # def index(self, index, doc_type, id, body, ignore=409):
     def index(self, index, id, body, ignore=409):
         return self.es.index(index=index,
@@ -76,11 +126,71 @@ class OpenSearchHelper:
     def get(self, index, id):
         return self.es.get(index=index, id=id)
 
+    # Source of the doc or None if it doesn't exist
+    def get_source(self, index, id):
+        doc = self.es.get(index=index, id=id, ignore=404)
+        return doc['_source'] if doc.get('found') else None
+
+    # Creates the doc unless it exists already. Returns False if it does
+    def create(self, index, id, body):
+        result = self.es.create(index=index, id=id, body=body, ignore=409)
+        return result.get('status') != 409
+
+    def delete(self, index, id):
+        return self.es.delete(index=index, id=id, ignore=404)
+
     def mget(self, body):
         return self.es.mget(body=body)
 
-    def bulk(self, body):
-        return helpers.bulk(self.es, body)
+    # Same result as helpers.bulk: number of successful actions and list of failed items.
+    # Actions may be any iterable (e.g. a generator), it is consumed chunk by chunk. Failed items
+    # are collected from all chunks and raised at the end as BulkIndexError unless raise_on_error=False
+    def bulk(self, actions, raise_on_error=True, thread_count=None):
+        success, errors = 0, []
+        for ok, item in self.streaming_bulk(actions, thread_count):
+            if ok:
+                success += 1
+            else:
+                errors.append(item)
+        if errors:
+            logging.warning("Bulk: {} document(s) failed, first error: {}".format(len(errors), errors[0]))
+            if raise_on_error:
+                raise helpers.BulkIndexError("{} document(s) failed to index.".format(len(errors)), errors)
+        return success, errors
+
+    # Yields (ok, item) per action in order of actions. Chunks are limited by chunk_size and
+    # max_chunk_bytes; items rejected by a full write queue (429) are retried with exponential
+    # backoff. With thread_count > 1 chunks are sent concurrently, at most 2 * thread_count
+    # chunks are read ahead of the results
+    def streaming_bulk(self, actions, thread_count=None):
+        thread_count = thread_count if thread_count else self.BULK['thread_count']
+        if thread_count <= 1:
+            yield from self._streaming_bulk(actions)
+            return
+        executor = ThreadPoolExecutor(thread_count)
+        pending = deque()
+        try:
+            actions = iter(actions)
+            while True:
+                chunk = list(itertools.islice(actions, self.BULK['chunk_size']))
+                if not chunk: break
+                pending.append(executor.submit(lambda c: list(self._streaming_bulk(c)), chunk))
+                if len(pending) >= 2 * thread_count:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _streaming_bulk(self, actions):
+        return helpers.streaming_bulk(self.es, actions,
+                                      chunk_size=self.BULK['chunk_size'],
+                                      max_chunk_bytes=self.BULK['max_chunk_bytes'],
+                                      max_retries=self.BULK['max_retries'],
+                                      initial_backoff=self.BULK['initial_backoff'],
+                                      max_backoff=self.BULK['max_backoff'],
+                                      raise_on_error=False,
+                                      yield_ok=True)
 
     def search(self, index):
         return Search(using=self.es, index=index)
@@ -30,6 +30,7 @@ logging.basicConfig(format='%(asctime)s:%(levelname)s:%(message)s', level=loggin
 from TMX.TMXFileIterator import TMXFileIterator
 from TMX.TMXParser import TMXParser
 from TMDbApi.TMDbApi import TMDbApi
+from TMDbApi.TMSchema import TMSchema
 
 from random import shuffle
 
@@ -76,7 +77,9 @@ if __name__ == "__main__":
 
   db = TMDbApi(args.map_db)
   if args.init:
-      db.init_db()
+      TMSchema().apply(force=True)
+  else:
+      TMSchema.ensure()
   # TODO: get from command line
   qlangs = ('en-GB', 'es-ES')
   #qlangs = ('en-GB', 'fr-FR')
@@ -2,10 +2,13 @@
 """
 Pytest configuration and shared fixtures for test suite.
 """
+import copy
 import os
 import sys
 import pytest
 import requests
+from opensearchpy import Search, exceptions
+from opensearchpy.helpers.response import Response
 
 # Add src to path for imports
 script_path = os.path.dirname(os.path.realpath(__file__))
@@ -14,6 +17,11 @@ sys.path.insert(0, script_path)
 
 from RestClient.RestClient import RestClient
 from client import TestClient
+from Config.Config import G_CONFIG
+
+# RestApi.Models (imported by TMDbApi) builds DB URI on import, port is a placeholder if environment is not set
+if not str(G_CONFIG.config['postgresql']['port']).isdigit():
+    G_CONFIG.config['postgresql'] = dict(G_CONFIG.config['postgresql'], port=5432)
 
 try:
     from test_auth_helper import generate_admin_token, generate_user_token
@@ -189,6 +197,145 @@ def test_client():
     return client
 
 
+class FakeOpenSearchHelper:
+    """
+    In-memory stand-in of helpers.OpenSearchHelper: indices, documents, index settings,
+    canned search hits and bulk requests. Scripted upserts are emulated by merge(doc, params).
+    """
+
+    def __init__(self, indexes=(), hits=None, settings=None, docs=None, merge=None, fail=(), fail_put=()):
+        self.indexes = list(indexes)
+        self.hits = list(hits or [])         # hits of each search sent by multi_search, in order
+        self.settings = settings or dict()   # index -> nested settings (explicitly set values only)
+        self.docs = dict(docs or dict())     # (index, id) -> document
+        self.merge = merge
+        self.fail = fail                     # ids of docs failing in bulk requests
+        self.fail_put = fail_put             # indices failing to restore settings
+        self.calls = []                      # (operation, index or name)
+        self.searches = []
+        self.requests = []                   # bulk requests as lists of (op_type, id)
+        self.bulk_actions = None             # actions of the last bulk request
+        self.merged = []                     # force merged indices
+
+    # Indices
+    def indices_get_all(self):
+        self.calls.append(('get_all', '*'))
+        return list(self.indexes)
+
+    def indices_exists(self, index):
+        return index in self.indexes
+
+    def indices_create(self, index, body):
+        self.calls.append(('create', index))
+        self._add_index(index)
+
+    def indices_put_template(self, name, body):
+        self.calls.append(('template', name))
+
+    def indices_put_mapping(self, index, body):
+        self.calls.append(('mapping', index))
+
+    def put_script(self, index, body):
+        self.calls.append(('script', index))
+
+    def indices_get_settings(self, index):
+        return {index: {'settings': {'index': copy.deepcopy(self.settings[index])}}}
+
+    def indices_put_settings(self, index, body):
+        if index in self.fail_put and body['index.refresh_interval'] != '-1':
+            raise RuntimeError("Failed")
+        for name, value in body.items():
+            keys = name.split('.')[1:]
+            settings = self.settings[index]
+            for key in keys[:-1]:
+                settings = settings.setdefault(key, dict())
+            if value is None:
+                settings.pop(keys[-1], None)
+            else:
+                settings[keys[-1]] = value
+            if len(keys) > 1 and not settings: self.settings[index].pop(keys[0])
+
+    def indices_forcemerge(self, index, max_num_segments=None):
+        self.merged.append(index)
+
+    # Documents
+    def index(self, index, id, body, ignore=None):
+        self._add_index(index)
+        self.docs[(index, id)] = copy.deepcopy(body)
+
+    def create(self, index, id, body):
+        if (index, id) in self.docs: return False
+        self.index(index, id, body)
+        return True
+
+    def get(self, index, id):
+        if (index, id) not in self.docs:
+            raise exceptions.NotFoundError(404, 'document_missing_exception')
+        return {'_id': id, '_source': copy.deepcopy(self.docs[(index, id)])}
+
+    def get_source(self, index, id):
+        return copy.deepcopy(self.docs.get((index, id)))
+
+    def delete(self, index, id):
+        self.docs.pop((index, id), None)
+
+    def bulk(self, actions, raise_on_error=True):
+        self.bulk_actions = list(actions)
+        self.requests.append([(a['_op_type'], a['_id']) for a in self.bulk_actions])
+        success, errors = 0, []
+        for a in self.bulk_actions:
+            key = (a['_index'], a['_id'])
+            op_type = a['_op_type']
+            if a['_id'] in self.fail:
+                errors.append({op_type: {'_index': a['_index'], '_id': a['_id'], 'status': 400}})
+            elif op_type == 'create' and key in self.docs:
+                errors.append({op_type: {'_index': a['_index'], '_id': a['_id'], 'status': 409}})
+            else:
+                # Scripted updates of existing docs (without '_source') are not applied
+                body = a.get('_source')
+                if body is None:
+                    pass
+                elif op_type != 'update':
+                    self.docs[key] = body
+                elif key in self.docs and self.merge:
+                    self.docs[key] = self.merge(self.docs[key], body['script']['params'])
+                else:
+                    self.docs[key] = body.get('upsert', body)
+                success += 1
+        return success, errors
+
+    # Searches
+    def search(self, index):
+        return Search(index=index)
+
+    def multi_search(self, index=None):
+        return FakeMultiSearch(self)
+
+    def _add_index(self, index):
+        if index not in self.indexes: self.indexes.append(index)
+
+
+class FakeMultiSearch:
+    """Collects added searches and returns canned hits of the helper."""
+
+    def __init__(self, helper):
+        self.helper = helper
+
+    def add(self, search):
+        self.helper.searches.append(search)
+        return self
+
+    def execute(self):
+        return [Response(s, {'hits': {'total': {'value': len(hits)}, 'hits': hits}})
+                for s, hits in zip(self.helper.searches, self.helper.hits)]
+
+
+@pytest.fixture
+def fake_es():
+    """Factory of in-memory OpenSearchHelper fakes, see FakeOpenSearchHelper for options."""
+    return FakeOpenSearchHelper
+
+
 @pytest.fixture
 def sample_segment():
     """Create a sample TMTranslationUnit for testing."""
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Batch addition of translation units (POST /tm/batch): JSON and NDJSON bodies, status per unit and limits.
+"""
+import json
+import time
+import pytest
+
+from Config.Config import G_CONFIG
+from utils import get_tag_id, get_institution_id_from_token
+
+
+@pytest.fixture
+def tag_id(api_client, auth_token):
+    tag_data = {
+        "name": f"test_batch_{int(time.time() * 1000)}",
+        "type": "public",
+        "tv_domain": "test-domain",
+        "lang_pair": "en_es"
+    }
+    institution_id = get_institution_id_from_token(auth_token)
+    if institution_id:
+        tag_data["institution_id"] = institution_id
+    response = api_client.post("/api/v1/tags", json=tag_data)
+    assert response.status_code == 200, f"Failed to create tag: {response.status_code} - {response.text[:200]}"
+    tag_id = get_tag_id(response.json())
+    yield tag_id
+    try:
+        api_client.delete(f"/api/v1/tags/{tag_id}")
+    except Exception:
+        pass  # Ignore cleanup errors
+
+
+def tu(tag_id, **kwargs):
+    return dict({"stext": "Hello batch", "ttext": "Hola lote", "slang": "en", "tlang": "es", "tag": tag_id}, **kwargs)
+
+
+@pytest.mark.integration
+def test_add_batch_json(api_client, tag_id):
+    tus = [tu(tag_id),
+           tu(tag_id, stext="Second unit", ttext="Segunda unidad", smeta={"context_before": "Hello batch"}),
+           tu(tag_id, ttext=""),
+           tu(tag_id, slang="xx-unknown"),
+           tu(None),
+           tu("no-such-tag"),
+           "not an object"]
+    response = api_client.post("/api/v1/tm/batch", json=tus)
+    assert response.status_code == 200, f"Expected status 200, got {response.status_code}: {response.text[:200]}"
+    data = response.json()
+    assert [item["status"] for item in data["items"]] == [201, 201, 400, 400, 403, 400, 400]
+    assert data["added"] == 2
+    assert data["failed"] == 5
+
+
+@pytest.mark.integration
+def test_add_batch_ndjson(api_client, tag_id):
+    body = json.dumps(tu(tag_id, stext="NDJSON unit")) + "\n{invalid json\n\n" + json.dumps(tu(tag_id, tlang="")) + "\n"
+    response = api_client.post("/api/v1/tm/batch", data=body.encode("utf-8"),
+                               headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200, f"Expected status 200, got {response.status_code}: {response.text[:200]}"
+    # Empty lines are skipped
+    assert [item["status"] for item in response.json()["items"]] == [201, 400, 400]
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("body", ['{"stext": "Not an array"}', '[{"stext": ', '[]'])
+def test_invalid_body(api_client, body):
+    response = api_client.post("/api/v1/tm/batch", data=body)
+    assert response.status_code == 400, f"Expected status 400, got {response.status_code}: {response.text[:200]}"
+
+
+@pytest.mark.integration
+def test_too_many_units(api_client, tag_id):
+    max_items = G_CONFIG.get_tm_batch()['max_items']
+    response = api_client.post("/api/v1/tm/batch", json=[tu(tag_id)] * (max_items + 1))
+    assert response.status_code == 413, f"Expected status 413, got {response.status_code}: {response.text[:200]}"
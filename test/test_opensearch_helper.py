@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the process-wide OpenSearch client shared by OpenSearchHelper instances.
+"""
+import os
+import sys
+import json
+import threading
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from Config.Config import G_CONFIG
+from helpers.OpenSearchHelper import OpenSearchHelper
+from opensearchpy.helpers import BulkIndexError
+
+
+@pytest.fixture(autouse=True)
+def reset_client(monkeypatch):
+    config = dict(G_CONFIG.config['opensearch'], host='localhost', port='9200')
+    monkeypatch.setitem(G_CONFIG.config, 'opensearch', config)
+    OpenSearchHelper._client = None
+    yield
+    OpenSearchHelper._client = None
+
+
+@pytest.mark.unit
+class TestOpenSearchHelper:
+
+    def test_client_is_shared(self):
+        assert OpenSearchHelper().es is OpenSearchHelper().es
+
+    def test_client_is_shared_between_threads(self):
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(OpenSearchHelper().es)) for i in range(8)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        assert len(set(id(c) for c in clients)) == 1
+
+    def test_client_is_recreated_after_fork(self, monkeypatch):
+        client = OpenSearchHelper().es
+        monkeypatch.setattr(OpenSearchHelper, '_client_pid', -1)
+        assert OpenSearchHelper().es is not client
+
+    def test_connection_pool_options(self):
+        connection = OpenSearchHelper().es.transport.connection_pool.connections[0]
+        assert connection.pool.pool.maxsize == 25
+        assert connection.headers['connection'] == 'keep-alive'
+        assert not connection.http_compress
+
+
+class FakeBulkClient:
+    """Answers bulk requests, rejects (429) each document given in 'rejections' that many times"""
+    def __init__(self, client, rejections=None, fail=()):
+        self.client = client
+        self.rejections = dict(rejections or {})
+        self.fail = fail
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def bulk(self, body, *args, **kwargs):
+        # Index actions: action and source lines
+        ids = [json.loads(l)['index']['_id'] for l in body.strip().split('\n')[::2]]
+        items = []
+        with self.lock:
+            self.requests.append(ids)
+            for id in ids:
+                status = 200
+                if self.rejections.get(id):
+                    self.rejections[id] -= 1
+                    status = 429
+                elif id in self.fail:
+                    status = 400
+                items.append({'index': {'_id': id, 'status': status}})
+        return {'errors': any(i['index']['status'] != 200 for i in items), 'items': items}
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def actions(n, consumed=None):
+    for i in range(n):
+        if consumed is not None: consumed.append(i)
+        yield {'_index': 'test', '_id': str(i), '_source': {'text': 'text {}'.format(i)}}
+
+
+@pytest.fixture
+def bulk_helper(monkeypatch):
+    monkeypatch.setattr(OpenSearchHelper, 'BULK', dict(OpenSearchHelper.BULK, chunk_size=3, initial_backoff=0.01,
+                                                        max_backoff=0.02, max_retries=2))
+    helper = OpenSearchHelper()
+    helper.es = FakeBulkClient(helper.es)
+    return helper
+
+
+@pytest.mark.unit
+class TestOpenSearchHelperBulk:
+
+    @pytest.mark.parametrize("thread_count", [1, 3])
+    def test_chunks_and_order(self, bulk_helper, thread_count):
+        results = list(bulk_helper.streaming_bulk(actions(10), thread_count))
+        assert [item['index']['_id'] for ok, item in results] == [str(i) for i in range(10)]
+        assert all(ok for ok, item in results)
+        assert sorted(len(r) for r in bulk_helper.es.requests) == [1, 3, 3, 3]
+
+    def test_max_chunk_bytes(self, bulk_helper, monkeypatch):
+        monkeypatch.setitem(OpenSearchHelper.BULK, 'max_chunk_bytes', 100)
+        assert bulk_helper.bulk(actions(4), thread_count=1) == (4, [])
+        assert max(len(r) for r in bulk_helper.es.requests) < 3
+
+    @pytest.mark.parametrize("thread_count", [1, 2])
+    def test_retry_rejected(self, bulk_helper, thread_count):
+        bulk_helper.es.rejections = {'1': 2, '7': 1}
+        assert bulk_helper.bulk(actions(9), thread_count=thread_count) == (9, [])
+        # Only rejected documents are retried
+        assert sum(len(r) for r in bulk_helper.es.requests) == 9 + 3
+
+    def test_errors_of_all_chunks(self, bulk_helper):
+        bulk_helper.es.rejections = {'2': 5}
+        bulk_helper.es.fail = ('0', '8')
+        with pytest.raises(BulkIndexError) as e:
+            bulk_helper.bulk(actions(9))
+        assert sorted(item['index']['_id'] for item in e.value.errors) == ['0', '2', '8']
+        bulk_helper.es.rejections = {'2': 5}
+        success, errors = bulk_helper.bulk(actions(9), raise_on_error=False)
+        assert success == 6 and len(errors) == 3
+
+    def test_actions_are_consumed_lazily(self, bulk_helper):
+        consumed = []
+        results = bulk_helper.streaming_bulk(actions(100, consumed), thread_count=2)
+        next(results)
+        # At most 2 * thread_count chunks are read ahead
+        assert len(consumed) <= 2 * 2 * 3 + 3
+        assert len(list(results)) == 99
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Unit tests of the batch writer: coalescing of concurrent requests into shared batches and per-request errors,
+and of per-segment errors of the bulk addition used by POST /tm/batch.
+"""
+import os
+import sys
+import threading
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from opensearchpy.helpers import BulkIndexError
+
+from TMDbApi.TMBatchWriter import TMBatchWriter
+from TMDbApi.TMDbApi import TMDbApi
+from TMDbApi.TMTranslationUnit import TMTranslationUnit
+from TMDbApi.TMUtils import TMTimer
+
+
+class Recorder:
+    def __init__(self, fail=None):
+        self.batches = []
+        self.fail = fail
+
+    def write(self, segments):
+        if self.fail and self.fail in segments: raise RuntimeError("Bulk failed")
+        self.batches.append(list(segments))
+        return [s.upper() for s in segments]
+
+
+class FakeIndex:
+    """Writes docs by ids, raises BulkIndexError for failing ids after writing the others."""
+
+    def __init__(self, fail=()):
+        self.fail = fail
+        self.written = {'source': [], 'target': [], 'map': []}
+
+    def write(self, ftype, ids):
+        failed = [{'update': {'_index': ftype, '_id': str(id), 'status': 400, 'error': 'mapper_parsing_exception'}}
+                  for id in ids if str(id) in self.fail]
+        self.written[ftype] += [str(id) for id in ids if str(id) not in self.fail]
+        if failed: raise BulkIndexError("{} document(s) failed to index.".format(len(failed)), failed)
+
+    # TMMonoLing
+    def add_segments(self, segments, ftype):
+        self.write(ftype, [getattr(s, ftype + '_id') for s in segments])
+
+
+class FakeMap:
+    def __init__(self, index):
+        self.index = index
+
+    def add_segments(self, segments):
+        self.index.write('map', [self.doc_id(s) for s in segments])
+
+    def doc_id(self, segment):
+        return 'map-' + segment.source_text
+
+    def refresh(self):
+        pass
+
+
+def create_db(index):
+    db = TMDbApi.__new__(TMDbApi)
+    db.ml_index = index
+    db.seg_map = FakeMap(index)
+    db.timer = TMTimer("test")
+    return db
+
+
+def create_segments(n):
+    return [TMTranslationUnit({'source_text': 'Text {}'.format(i), 'target_text': 'Texto {}'.format(i),
+                               'source_language': 'en', 'target_language': 'es'}) for i in range(n)]
+
+
+def write_concurrently(writer, requests):
+    results = [None] * len(requests)
+    barrier = threading.Barrier(len(requests))
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i] = writer.write(requests[i])
+        except Exception as e:
+            results[i] = e
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(requests))]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return results
+
+
+@pytest.mark.unit
+class TestTMBatchWriter:
+
+    def test_coalesces_concurrent_requests(self):
+        recorder = Recorder()
+        writer = TMBatchWriter(recorder.write, linger_ms=500, max_batch=1000)
+        requests = [['{}-{}'.format(i, j) for j in range(3)] for i in range(10)]
+        # Each request gets results of its own segments
+        assert write_concurrently(writer, requests) == [[s.upper() for s in r] for r in requests]
+        # All requests arrive within the linger window
+        assert len(recorder.batches) == 1
+        assert sorted(recorder.batches[0]) == sorted(s for r in requests for s in r)
+
+    def test_max_batch(self):
+        recorder = Recorder()
+        writer = TMBatchWriter(recorder.write, linger_ms=500, max_batch=4)
+        requests = [['{}-{}'.format(i, j) for j in range(2)] for i in range(6)] + [['large'] * 5]
+        write_concurrently(writer, requests)
+        assert sorted(s for b in recorder.batches for s in b) == sorted(s for r in requests for s in r)
+        # Requests are not split, a request larger than max_batch is written alone
+        assert all(len(b) <= 4 or b == ['large'] * 5 for b in recorder.batches)
+
+    def test_sequential_requests(self):
+        recorder = Recorder()
+        writer = TMBatchWriter(recorder.write, linger_ms=0)
+        assert writer.write(['a', 'b']) == ['A', 'B']
+        assert writer.write(['c']) == ['C']
+        assert writer.write([]) == []
+        assert recorder.batches == [['a', 'b'], ['c']]
+
+    def test_error_of_one_request(self):
+        recorder = Recorder(fail='bad')
+        writer = TMBatchWriter(recorder.write, linger_ms=500)
+        results = write_concurrently(writer, [['a'], ['b', 'bad'], ['c']])
+        assert results[0] == ['A'] and results[2] == ['C']
+        assert isinstance(results[1], RuntimeError)
+        # Other requests of the failed batch are written separately
+        assert sorted(s for b in recorder.batches for s in b) == ['a', 'c']
+        # Writer thread keeps running
+        assert writer.write(['d']) == ['D']
+
+
+@pytest.mark.unit
+class TestTMDbApiAddSegmentsStatus:
+
+    def test_written(self):
+        index = FakeIndex()
+        segments = create_segments(3)
+        assert create_db(index).add_segments_status(segments) == [None] * 3
+        assert index.written['map'] == ['map-Text 0', 'map-Text 1', 'map-Text 2']
+
+    def test_errors_per_segment(self):
+        segments = create_segments(4)
+        index = FakeIndex(fail=(str(segments[1].source_id), str(segments[2].target_id), 'map-Text 3'))
+        errors = create_db(index).add_segments_status(segments)
+        assert errors[0] is None
+        assert errors[1].startswith('Failed to write source doc: mapper_parsing_exception')
+        assert errors[2].startswith('Failed to write target doc')
+        assert errors[3].startswith('Failed to write map doc')
+        # Segment failed in one index is not written to the next ones
+        assert index.written['target'] == [str(s.target_id) for s in segments if s is not segments[1] and s is not segments[2]]
+        assert index.written['map'] == ['map-Text 0']
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Unit tests of the bulk-load profile of index settings: applied for the duration of a job,
+restored and force merged afterwards, also on failure.
+"""
+import copy
+import os
+import sys
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from TMDbApi.TMBulkLoadSettings import TMBulkLoadSettings
+
+
+def in_profile(settings):
+    return dict(settings, refresh_interval='-1', number_of_replicas='0', translog={'durability': 'async'})
+
+
+def lock(owner, index):
+    settings = index_settings()[index]
+    return {'owner': owner, 'time': '20260101T000000Z',
+            'settings': {'refresh_interval': settings.get('refresh_interval'),
+                         'number_of_replicas': settings.get('number_of_replicas'),
+                         'translog.durability': settings.get('translog', {}).get('durability')}}
+
+
+# Lock docs of the given indices
+def locks(index_locks):
+    return {(TMBulkLoadSettings.LOCK_INDEX, index): index_lock for index, index_lock in index_locks.items()}
+
+
+def index_settings():
+    return {'tm_en': {'number_of_replicas': '1', 'uuid': 'a'},
+            'map_en_es': {'number_of_replicas': '2', 'refresh_interval': '5s', 'translog': {'durability': 'request'}}}
+
+
+@pytest.mark.unit
+class TestTMBulkLoadSettings:
+
+    def test_apply_and_restore(self, fake_es):
+        es = fake_es(settings=index_settings())
+        states = []
+        with TMBulkLoadSettings(['tm_en', 'map_en_es'], es=es, owner='job1',
+                                record=lambda s: states.append(copy.deepcopy(s))):
+            for index in ['tm_en', 'map_en_es']:
+                assert es.settings[index]['refresh_interval'] == '-1'
+                assert es.settings[index]['number_of_replicas'] == '0'
+                assert es.settings[index]['translog'] == {'durability': 'async'}
+                assert es.docs[(TMBulkLoadSettings.LOCK_INDEX, index)]['owner'] == 'job1'
+        assert es.settings == index_settings()
+        assert not es.docs
+        assert es.merged == ['tm_en', 'map_en_es']
+        assert [s['status'] for s in states] == ['applied', 'restored']
+        assert states[0]['indices']['tm_en'] == {'refresh_interval': None, 'number_of_replicas': '1',
+                                                 'translog.durability': None}
+
+    def test_restore_on_failure(self, fake_es):
+        es = fake_es(settings=index_settings())
+        with pytest.raises(ValueError):
+            with TMBulkLoadSettings(['tm_en', 'map_en_es'], es=es):
+                raise ValueError("Job failed")
+        assert es.settings == index_settings()
+
+    def test_skip_index_of_other_owner(self, fake_es):
+        settings = index_settings()
+        settings['tm_en'] = in_profile(settings['tm_en'])
+        es = fake_es(settings=settings, docs=locks({'tm_en': lock('job1', 'tm_en')}))
+        with TMBulkLoadSettings(['tm_en', 'map_en_es'], es=es, owner='job2') as bulk_load:
+            assert bulk_load.state['skipped'] == {'tm_en': 'job1'}
+        # Restored by the job which applied the profile
+        assert es.settings['tm_en']['refresh_interval'] == '-1'
+        assert es.docs[(TMBulkLoadSettings.LOCK_INDEX, 'tm_en')]['owner'] == 'job1'
+        assert es.merged == ['map_en_es']
+
+    @pytest.mark.parametrize("owner,is_stale", [('job1', lambda owner: False), ('job2', lambda owner: owner == 'job1')])
+    def test_take_over_from_dead_owner(self, fake_es, owner, is_stale):
+        # job1 died without restoring: resumed job1 or another job seeing job1 as stale restores recorded settings
+        settings = index_settings()
+        es = fake_es(settings=dict((index, in_profile(s)) for index, s in settings.items()),
+                     docs=locks(dict((index, lock('job1', index)) for index in settings)))
+        with TMBulkLoadSettings(['tm_en', 'map_en_es'], es=es, owner=owner, is_stale=is_stale) as bulk_load:
+            assert not bulk_load.state['skipped']
+            assert es.docs[(TMBulkLoadSettings.LOCK_INDEX, 'tm_en')]['owner'] == owner
+        assert es.settings == settings
+        assert not es.docs
+
+    def test_profile_without_owner(self, fake_es):
+        settings = index_settings()
+        settings['tm_en'] = in_profile(settings['tm_en'])
+        es = fake_es(settings=settings)
+        with TMBulkLoadSettings(['tm_en'], es=es):
+            pass
+        # Unknown previous settings: reset to defaults
+        assert es.settings['tm_en'] == {'uuid': 'a'}
+
+    def test_restore_failed(self, fake_es):
+        es = fake_es(settings=index_settings(), fail_put=('tm_en',))
+        with TMBulkLoadSettings(['tm_en', 'map_en_es'], es=es) as bulk_load:
+            pass
+        assert bulk_load.state['status'] == 'restore_failed'
+        assert len(bulk_load.state['errors']) == 1
+        # Kept for a later restore
+        assert list(es.docs) == [(TMBulkLoadSettings.LOCK_INDEX, 'tm_en')]
+        assert es.settings['map_en_es'] == index_settings()['map_en_es']
+        assert es.merged == ['map_en_es']
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the pool of long-lived external tokenizer processes.
+"""
+import os
+import sys
+import shutil
+import subprocess
+import time
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from TMPosTagger.TMCoProcessPool import TMCoProcessPool, TMCoProcessError
+from TMPosTagger.TMTokenizer import TMMosesTokenizer, moses_tokenizer_home
+
+# Upper-cases each line; 'crash' exits, 'sleep' hangs, 'split' answers several lines and an empty one
+WORKER = """
+import sys, time
+for line in sys.stdin:
+    line = line.rstrip('\\n')
+    if line == 'crash': sys.exit(1)
+    if line == 'sleep': time.sleep(10)
+    if line.startswith('split'):
+        for word in line.split(' ')[1:]: print(word.upper())
+        print('', flush=True)
+        continue
+    print(line.upper(), flush=True)
+"""
+ARGS = [sys.executable, '-c', WORKER]
+
+
+@pytest.fixture
+def pool():
+    p = TMCoProcessPool(ARGS, size=1, timeout=2, max_failures=3)
+    yield p
+    p.close()
+
+
+@pytest.mark.unit
+class TestTMCoProcessPool:
+
+    def test_process_reuses_process(self, pool):
+        assert pool.process('hello') == ['HELLO']
+        worker = pool._idle.queue[0]
+        pid = worker.proc.pid
+        assert pool.process('multi\nline text') == ['MULTI LINE TEXT']
+        assert worker.proc.pid == pid
+
+    def test_terminator(self):
+        p = TMCoProcessPool(ARGS, terminator='', size=1, timeout=2, probe='split probe')
+        try:
+            assert p.process('split a b c') == ['A', 'B', 'C']
+            assert p.process('split') == []
+        finally:
+            p.close()
+
+    def test_restart_on_crash(self, pool):
+        assert pool.process('one') == ['ONE']
+        # Crashed process is restarted and the request is retried once - and crashes again
+        with pytest.raises(TMCoProcessError):
+            pool.process('crash')
+        assert pool.failures == 2
+        assert pool.process('two') == ['TWO']
+        assert pool.failures == 0
+
+    def test_timeout_and_disable(self):
+        p = TMCoProcessPool(ARGS, size=1, timeout=0.5, max_failures=2)
+        try:
+            with pytest.raises(TMCoProcessError):
+                p.process('sleep')
+            assert p.disabled()
+            with pytest.raises(TMCoProcessError):
+                p.process('hello')
+        finally:
+            p.close()
+
+    def test_failed_probe_disables_pool(self):
+        # Never answers: disabled after a single probe instead of max_failures timeouts
+        p = TMCoProcessPool([sys.executable, '-c', 'import time; time.sleep(10)'], size=2, timeout=5,
+                            max_failures=3, probe_timeout=0.5)
+        try:
+            start = time.monotonic()
+            for i in range(3):
+                with pytest.raises(TMCoProcessError):
+                    p.process('hello')
+            assert time.monotonic() - start < 2
+            assert p.disabled()
+        finally:
+            p.close()
+
+    def test_probe_once(self, pool, monkeypatch):
+        requests = []
+        worker = pool._idle.queue[0]
+        request = worker.request
+        monkeypatch.setattr(worker, 'request', lambda text, timeout: requests.append(text) or request(text, timeout))
+        assert pool.process('a') == ['A']
+        assert pool.process('b') == ['B']
+        assert requests == [TMCoProcessPool.PROBE, 'a', 'b']
+
+    def test_forked_process_starts_own_processes(self, pool, monkeypatch):
+        assert pool.process('hello') == ['HELLO']
+        parent = pool._idle.queue[0]
+        # As seen by a forked child
+        monkeypatch.setattr(pool, '_pid', -1)
+        assert pool.process('child') == ['CHILD']
+        child = pool._idle.queue[0]
+        assert child is not parent and child.proc.pid != parent.proc.pid
+        # Process of the parent is left running
+        assert parent.alive()
+        parent.stop()
+
+    def test_get_shards_by_tool_and_language(self, monkeypatch):
+        monkeypatch.setattr(TMCoProcessPool, '_pools', dict())
+        en = TMCoProcessPool.get('test', 'EN', ARGS)
+        assert TMCoProcessPool.get('test', 'en', ARGS) is en
+        assert TMCoProcessPool.get('test', 'es', ARGS) is not en
+        TMCoProcessPool.shutdown()
+        assert not TMCoProcessPool._pools
+
+    @pytest.mark.skipif(not shutil.which('perl') or not os.path.exists(moses_tokenizer_home),
+                        reason="Moses tokenizer is not installed")
+    def test_moses_tokenizer_parity(self, monkeypatch):
+        monkeypatch.setattr(TMCoProcessPool, '_pools', dict())
+        tokenizer = TMMosesTokenizer('en')
+        for text in ["Hello world. This is a test, isn't it?", 'Connect the <T1>pipe</T1> (3.5 mm)!']:
+            expected = subprocess.run(tokenizer.args, input=text.encode('utf8'), stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL).stdout.decode('utf-8').strip('\n')
+            assert tokenizer.pool.process(text) == [expected]
+            assert tokenizer.process(text)
+        TMCoProcessPool.shutdown()
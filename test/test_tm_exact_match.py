@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the exact match fast path of TMDbApi queries.
+"""
+import os
+import sys
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from TMDbApi.TMDbApi import TMDbApi
+from TMDbApi.TMQueryParams import TMQueryParams
+from TMDbApi.TMUtils import TMUtils, TMTimer
+
+
+class FakeMap:
+    """Returns map docs of the stored segments having the same normalized source text."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = []
+
+    def mget_exact(self, source_lang, target_lang, texts, source_metadata=None, target_metadata=None, domains=None):
+        self.calls.append(texts)
+        return [[dict(d) for d in self.docs if TMUtils.text_hash(d['source_text']) == TMUtils.text_hash(t)] for t in texts]
+
+    @staticmethod
+    def context_hash(text, metadata):
+        return TMUtils.context_hash(text, metadata)
+
+
+def map_doc(source_text, target_text, **kwargs):
+    return dict({'source_text': source_text, 'target_text': target_text,
+                 'source_language': 'en-GB', 'target_language': 'es-ES',
+                 'tm_change_date': '20200101T000000Z'}, **kwargs)
+
+
+def create_db(docs):
+    db = TMDbApi.__new__(TMDbApi)
+    db.seg_map = FakeMap(docs)
+    db.timer = TMTimer("test")
+    db.fuzzy_qlists = []
+
+    def fuzzy_mquery(qparams, in_context=False):
+        db.fuzzy_qlists.append(list(qparams.qlist))
+        return [(q, ([], False), [] if in_context else None) for q in qparams.qlist]
+    db._fuzzy_mquery = fuzzy_mquery
+    return db
+
+
+def create_qparams(qlist, **kwargs):
+    return TMQueryParams(qlist, [], 'en', 'es', ['regex', 'tags'], kwargs.pop('out', 'json'), 10, **kwargs)
+
+
+DOCS = [map_doc('Connect the pipe.', 'Conecte la tubería.'),
+        map_doc('Connect the pipe.', 'Conecte el tubo.', tm_change_date='20210101T000000Z',
+                source_metadata={'context_before': 'A', 'context_after': 'B'}),
+        map_doc('Connect  the pipe.', 'Conecte la tubería.'),
+        map_doc('Open the valve.', 'Abra la válvula.')]
+
+
+@pytest.mark.unit
+class TestTMExactMatch:
+
+    def test_text_hash_normalization(self):
+        assert TMUtils.text_hash('Hello  <b>world</b> ') == TMUtils.text_hash('Hello world')
+        assert TMUtils.text_hash('Hello world') != TMUtils.text_hash('hello world')
+        assert TMUtils.text_hash('Hello world', casefold=True) == TMUtils.text_hash('HELLO world', casefold=True)
+
+    def test_exact_queries_skip_fuzzy_retrieval(self):
+        db = create_db(DOCS)
+        out = db._mquery(create_qparams(['Connect the pipe.', 'Close the valve.', 'Open the valve.']))
+        assert db.fuzzy_qlists == [['Close the valve.']]
+        q, (segments, match), segments101 = out[0]
+        assert q == 'Connect the pipe.' and match
+        # Whitespace variant is not an exact match; the latest segment goes first
+        assert [(s.target_text, ter) for s, ter in segments] == [('Conecte el tubo.', 100), ('Conecte la tubería.', 100)]
+        assert out[1] == ('Close the valve.', ([], False), None)
+        assert out[2][1][0][0][0].target_text == 'Abra la válvula.'
+        assert db.timer.counts['exact matches'] == 2
+
+    def test_in_context(self):
+        db = create_db(DOCS)
+        qparams = create_qparams(['Connect the pipe.'], source_metadata={'context_before': 'A', 'context_after': 'B'})
+        (q, (segments, match), segments101), = db._mquery(qparams, in_context=True)
+        assert len(segments) == 2
+        assert [s.target_text for s, ter in segments101] == ['Conecte el tubo.']
+
+    def test_in_context_by_hashes(self):
+        contexts = {'context_before': 'A', 'context_after': 'B'}
+        docs = [map_doc('Connect the pipe.', 'Conecte la tubería.', source_context_hash=None),
+                map_doc('Connect the pipe.', 'Conecte el tubo.', source_context_hash=TMUtils.context_hash('Connect the pipe.', contexts)),
+                # Stored contexts don't match the hash: hash is used
+                map_doc('Connect the pipe.', 'Conecte el tubo!', source_metadata=contexts,
+                        source_context_hash=TMUtils.context_hash('Connect the pipe.', {'context_before': 'A'}))]
+        db = create_db(docs)
+        qparams = create_qparams(['Connect the pipe.'], source_metadata=contexts)
+        (q, (segments, match), segments101), = db._mquery(qparams, in_context=True)
+        assert len(segments) == 3
+        assert [s.target_text for s, ter in segments101] == ['Conecte el tubo.']
+
+    def test_context_hash(self):
+        contexts = {'context_before': 'A', 'context_after': 'B'}
+        assert TMUtils.context_hash('Hello  <b>world</b>', contexts) == TMUtils.context_hash('Hello world', contexts)
+        assert TMUtils.context_hash('Hello world', contexts) != TMUtils.context_hash('Hello world', {'context_before': 'A'})
+        assert TMUtils.context_hash('Hello world', {'context_before': 'B', 'context_after': 'A'}) != TMUtils.context_hash('Hello world', contexts)
+        assert TMUtils.context_hash('Hello world', None) is None
+        assert TMUtils.context_hash('Hello world', {'id': 1}) is None
+
+    def test_domain_penalty(self):
+        db = create_db([map_doc('Open the valve.', 'Abra la válvula.', domain=['other'])])
+        (q, (segments, match), segments101), = db._mquery(create_qparams(['Open the valve.'], domains=['tag1']))
+        assert segments[0][1] == 100 - TMDbApi.QUERY_PENALIZE[0]
+
+    @pytest.mark.parametrize("kwargs", [{'concordance': True}, {'out': 'moses'}])
+    def test_fast_path_not_used(self, kwargs):
+        db = create_db(DOCS)
+        db._mquery(create_qparams(['Connect the pipe.'], **kwargs))
+        assert not db.seg_map.calls
+        assert db.fuzzy_qlists == [['Connect the pipe.']]
+
+    def test_queries_with_tags_go_through_matching(self):
+        db = create_db(DOCS)
+        db._mquery(create_qparams(['Connect the <b>pipe</b>.', 'Open the valve.']))
+        assert db.seg_map.calls == [['Open the valve.']]
+        assert db.fuzzy_qlists == [['Connect the <b>pipe</b>.']]
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setitem(TMDbApi.EXACT_MATCH, 'enabled', False)
+        db = create_db(DOCS)
+        db._mquery(create_qparams(['Connect the pipe.']))
+        assert db.fuzzy_qlists == [['Connect the pipe.']]
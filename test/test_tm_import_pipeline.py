@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Unit tests of the pipelined import: same docs as the sequential import, backpressure and errors.
+"""
+import os
+import sys
+import threading
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from TMDbApi.TMImportPipeline import TMImportPipeline
+from JobApi.ImportCheckpoint import ImportCheckpoint
+from TMDbApi.TMMonoLing import TMMonoLing
+from TMDbApi.TMMap.TMMapES import TMMapES
+from TMDbApi.TMScriptFreeIngest import TMScriptFreeIngest
+from TMX.TMXParser import TMXParser
+from Config.Config import G_CONFIG
+from helpers.OpenSearchHelper import OpenSearchHelper
+
+DATES = ['insert_date', 'update_date', 'check_date']
+
+
+@pytest.fixture(autouse=True)
+def opensearch_config(monkeypatch):
+    config = dict(G_CONFIG.config['opensearch'], host='localhost', port='9200')
+    monkeypatch.setitem(G_CONFIG.config, 'opensearch', config)
+    OpenSearchHelper._client = None
+    yield
+    OpenSearchHelper._client = None
+
+
+class Recorder:
+    def __init__(self, fail=None):
+        self.lock = threading.Lock()
+        self.writes = {'source': [], 'target': [], 'map': []}
+        self.fail = fail
+        self.script_free = set()
+
+    def mono(self, ml_index, segments, ftype, docs=None):
+        with self.lock:
+            if self.fail == ftype: raise RuntimeError("Bulk failed")
+            if self.fail == 'later' and len(self.writes[ftype]) >= 20: raise RuntimeError("Bulk failed")
+            self.writes[ftype] += list(zip([s.source_id for s in segments], docs))
+            self.script_free.add(ml_index.ingest is not None)
+
+    def map(self, seg_map, segments, docs=None):
+        with self.lock:
+            self.writes['map'] += list(zip([s.source_id for s in segments], docs))
+            self.script_free.add(seg_map.ingest is not None)
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = Recorder()
+    # Patched before the pool forks, thus applied in the worker processes as well
+    monkeypatch.setattr(TMMonoLing, 'MATCHING_FEATURES', False)
+    monkeypatch.setattr(TMMonoLing, 'token_count', lambda self, text, lang: len(text.split(' ')))
+    monkeypatch.setattr(TMMonoLing, 'add_segments', lambda self, *args, **kwargs: recorder.mono(self, *args, **kwargs))
+    monkeypatch.setattr(TMMapES, 'add_segments', lambda self, *args, **kwargs: recorder.map(self, *args, **kwargs))
+    return recorder
+
+
+def tmx_files():
+    return [os.path.join(script_path, "..", "data", f) for f in ['un_short.tmx', 'test_tags.tmx']]
+
+
+def expected_writes():
+    ml_index = TMMonoLing()
+    seg_map = TMMapES()
+    writes = {'source': [], 'target': [], 'map': []}
+    for f in tmx_files():
+        for segment in TMXParser(f).parse():
+            writes['source'].append((segment.source_id, ml_index._segment2doc_upsert(segment, 'source')))
+            writes['target'].append((segment.source_id, ml_index._segment2doc_upsert(segment, 'target')))
+            writes['map'].append((segment.source_id, seg_map._segment2doc(segment)))
+    return writes
+
+
+def without_dates(writes):
+    return [(id, dict([(k, v) for k, v in doc.items() if k not in DATES])) for id, doc in writes]
+
+
+def parse_raw():
+    for f in tmx_files():
+        for segment in TMXParser(f, preprocess=False).parse():
+            yield segment
+
+
+def create_tmx(path, n):
+    tus = ''.join('<tu><tuv xml:lang="en"><seg>Text {0}</seg></tuv><tuv xml:lang="es"><seg>Texto {0}</seg></tuv>'
+                  '<tuv xml:lang="fr"><seg>Texte {0}</seg></tuv></tu>\n'.format(i) for i in range(n))
+    path.write_text('<?xml version="1.0" encoding="UTF-8"?>\n<tmx version="1.4"><header srclang="en"/><body>\n'
+                    + tus + '</body></tmx>', encoding='utf-8')
+    return str(path)
+
+
+class FakeJobApi:
+    def __init__(self):
+        self.fields = dict()
+
+    def get_field(self, job_id, field):
+        return self.fields.get(field)
+
+    def set_field(self, job_id, field, value):
+        self.fields[field] = value
+
+
+@pytest.mark.unit
+class TestTMImportPipeline:
+
+    @pytest.mark.parametrize("workers,batch_size,queue_size", [(2, 3, 1), (1, 100, 2)])
+    def test_same_docs_as_sequential(self, recorder, workers, batch_size, queue_size):
+        expected = expected_writes()
+        count = TMImportPipeline(workers, batch_size, queue_size).run(parse_raw())
+        assert count == len(expected['map'])
+        for writer in ['source', 'target']:
+            assert recorder.writes[writer] == expected[writer]
+        assert without_dates(recorder.writes['map']) == without_dates(expected['map'])
+
+    def test_skips_segments_empty_after_processing(self, recorder):
+        raw = list(parse_raw())
+        TMImportPipeline(1, 5, 1).run(iter(raw))
+        assert len(recorder.writes['map']) < len(raw)
+        assert all(doc['upsert']['text'] for id, doc in recorder.writes['source'])
+
+    @pytest.mark.parametrize("script_free", [False, True])
+    def test_script_free_writers(self, recorder, script_free, monkeypatch):
+        monkeypatch.setattr(TMScriptFreeIngest, 'ENABLED', not script_free)
+        TMImportPipeline(2, 2, 1, script_free=script_free).run(parse_raw())
+        assert recorder.script_free == {script_free}
+
+    def test_script_free_only_on_import(self, monkeypatch):
+        # Other writers (REST API, maintenance jobs) keep scripted upserts
+        monkeypatch.setattr(TMScriptFreeIngest, 'ENABLED', True)
+        assert TMMonoLing().ingest is None and TMMapES().ingest is None
+        assert TMMonoLing(script_free=True).ingest and TMMapES(script_free=True).ingest
+        assert TMImportPipeline().script_free
+
+    def test_writer_error(self, recorder):
+        recorder.fail = 'target'
+        with pytest.raises(RuntimeError):
+            TMImportPipeline(2, 2, 1).run(parse_raw())
+        assert not recorder.writes['target']
+
+    def test_backpressure(self, recorder):
+        # Segments are parsed lazily: no more than workers + queue_size batches ahead of the writers
+        consumed = []
+        max_ahead = []
+
+        def segments():
+            for i, segment in enumerate(parse_raw()):
+                consumed.append(i)
+                with recorder.lock:
+                    max_ahead.append(len(consumed) - len(recorder.writes['map']))
+                yield segment
+        TMImportPipeline(1, 2, 1).run(segments())
+        # Batches (of 2) in process (workers + queue_size), in the map writer queue, being written
+        # and being filled, plus 2 segments skipped as empty
+        assert max(max_ahead) <= 2 * (2 + 1 + 1 + 1) + 2
+
+    def test_commit_in_order(self, recorder):
+        committed = []
+        count = TMImportPipeline(2, 3, 1).run(parse_raw(), on_commit=lambda segments: committed.append(
+            (list(segments), len(recorder.writes['map']))))
+        assert sum(len(segments) for segments, written in committed) == count
+        # Committed only after written by all writers
+        assert all(written >= sum(len(s) for s, w in committed[:i + 1]) for i, (segments, written) in enumerate(committed))
+        assert [s.source_id for segments, written in committed for s in segments] == \
+               [id for id, doc in recorder.writes['map']]
+
+    def test_resume_from_checkpoint(self, recorder, tmp_path):
+        # Each tu gives 2 segments (en-es, en-fr)
+        f = create_tmx(tmp_path / 'test.tmx', 30)
+        lang_pairs = [('en', 'es'), ('en', 'fr')]
+        expected = [s.source_id for s in TMXParser(f, lang_pairs=lang_pairs).parse()]
+        job_api = FakeJobApi()
+        recorder.fail = 'later'
+        checkpoint = ImportCheckpoint(job_api, 'job', interval=0)
+        with pytest.raises(RuntimeError):
+            TMImportPipeline(1, 3, 1).run(TMXParser(f, lang_pairs=lang_pairs, preprocess=False).parse(),
+                                          on_commit=checkpoint.commit)
+        checkpoint.save()
+        saved = job_api.fields['checkpoint']
+        assert 0 < saved['segments'] < len(expected)
+        committed = [id for id, doc in recorder.writes['map']][:saved['segments']]
+
+        recorder.fail = None
+        recorder.writes['map'] = []
+        checkpoint = ImportCheckpoint(job_api, 'job', interval=0)
+        assert checkpoint.position() == (f, saved['tu'])
+        TMImportPipeline(1, 3, 1).run(TMXParser(f, lang_pairs=lang_pairs, preprocess=False, start=checkpoint.position()).parse(),
+                                      on_commit=checkpoint.commit)
+        resumed = [id for id, doc in recorder.writes['map']]
+        # Continues from the first segment of the tu of the last committed segment
+        assert resumed == expected[expected.index(committed[-1]) // 2 * 2:]
+        assert set(committed + resumed) == set(expected)
+        assert job_api.fields['checkpoint']['segments'] == len(committed) + len(resumed)
+
+
+@pytest.mark.unit
+class TestImportCheckpoint:
+
+    def test_commit_and_save(self):
+        job_api = FakeJobApi()
+        checkpoint = ImportCheckpoint(job_api, 'job', interval=3600)
+        assert checkpoint.position() is None
+        segments = list(TMXParser(tmx_files()[0]).parse())[:3]
+        checkpoint.commit(segments[:2])
+        checkpoint.commit(segments[2:])
+        # Saved at most once per interval
+        assert not job_api.fields
+        checkpoint.save()
+        saved = job_api.fields['checkpoint']
+        assert (saved['file'], saved['tu']) == segments[-1].tmx_position
+        assert saved['segments'] == 3 and saved['batches'] == 2
+        assert ImportCheckpoint(job_api, 'job').position() == segments[-1].tmx_position
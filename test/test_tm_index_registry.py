@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the process-wide index registry used by TMMapES/TMMonoLing.
+"""
+import os
+import sys
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from TMDbApi.TMIndexRegistry import TMIndexRegistry
+
+
+@pytest.fixture(autouse=True)
+def reset_registry():
+    TMIndexRegistry.invalidate()
+    yield
+    TMIndexRegistry.invalidate()
+
+
+@pytest.mark.unit
+class TestTMIndexRegistry:
+
+    def test_index_exists_is_served_from_memory(self, fake_es):
+        es = fake_es(['tm_en', 'tm_es', 'map_en_es'])
+        assert TMIndexRegistry.index_exists(es, 'tm_en')
+        assert TMIndexRegistry.index_exists(es, 'map_en_es')
+        assert not TMIndexRegistry.index_exists(es, 'tm_fr')
+        assert len(es.calls) == 1
+
+    def test_map_index_direct_and_reverse(self, fake_es):
+        es = fake_es(['tm_en', 'tm_es', 'map_en_es'])
+        assert TMIndexRegistry.map_index(es, 'en', 'es') == ('map_en_es', False)
+        assert TMIndexRegistry.map_index(es, 'es-ES', 'en-GB') == ('map_en_es', True)
+        assert TMIndexRegistry.map_index(es, 'en', 'fr') == (None, None)
+        assert len(es.calls) == 1
+
+    def test_lang_graph(self, fake_es):
+        es = fake_es(['map_en_es', 'map_en_fr', 'jobs'])
+        graph = TMIndexRegistry.lang_graph(es)
+        assert graph.has_edge('en', 'es')
+        assert graph.has_edge('fr', 'en')
+        assert not graph.has_edge('es', 'fr')
+
+    def test_mono_langs(self, fake_es):
+        es = fake_es(['tm_en', 'tm_es', 'map_en_es', 'tm_template_x'])
+        assert sorted(TMIndexRegistry.mono_langs(es)) == ['en', 'es']
+
+    def test_invalidate_forces_reload(self, fake_es):
+        es = fake_es(['tm_en'])
+        assert not TMIndexRegistry.index_exists(es, 'tm_es')
+        es.indexes.append('tm_es')
+        # Still served from memory until invalidated
+        assert not TMIndexRegistry.index_exists(es, 'tm_es')
+        TMIndexRegistry.invalidate()
+        assert TMIndexRegistry.index_exists(es, 'tm_es')
+        assert len(es.calls) == 2
+
+    def test_ttl_expiry_forces_reload(self, fake_es, monkeypatch):
+        es = fake_es(['tm_en'])
+        monkeypatch.setattr(TMIndexRegistry, 'TTL', 0)
+        TMIndexRegistry.indexes(es)
+        TMIndexRegistry.indexes(es)
+        assert len(es.calls) == 2
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Unit tests for TMMapES: batched map lookup (mget) and denormalized map layout
+(map docs carrying POS & token counts).
+"""
+import os
+import sys
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from TMDbApi.TMIndexRegistry import TMIndexRegistry
+from TMDbApi.TMTranslationUnit import TMTranslationUnit
+from TMDbApi.TMMap.TMMapES import TMMapES
+from helpers.OpenSearchHelper import OpenSearchHelper
+
+
+def create_map(es):
+    # Bypass constructor, which puts templates & scripts to OpenSearch
+    m = TMMapES.__new__(TMMapES)
+    m.es = es
+    return m
+
+
+def map_hit(source_text, target_text, source_pos, target_pos):
+    return {'_index': 'map_en_es', '_id': '1', '_score': 1.0,
+            '_source': {'source_text': source_text, 'target_text': target_text,
+                        'source_id': 's', 'target_id': 't',
+                        'source_language': 'en-GB', 'target_language': 'es-ES',
+                        'source_pos': source_pos, 'target_pos': target_pos,
+                        'source_token_cnt': 2, 'target_token_cnt': 3}}
+
+
+@pytest.fixture(autouse=True)
+def reset_registry():
+    TMIndexRegistry.invalidate()
+    yield
+    TMIndexRegistry.invalidate()
+
+
+def mget_hit(source_id, target_ids, swap=False):
+    s, t = ('source', 'target') if not swap else ('target', 'source')
+    docs = [{'_index': 'map_en_es', '_id': tid, '_score': 0.0,
+             '_source': {s + '_id': source_id, t + '_id': tid, 'source_language': 'en', 'target_language': 'es',
+                         s + '_text': 'a', t + '_text': 'b'}} for tid in target_ids]
+    hit = dict(docs[0])
+    hit['inner_hits'] = {'docs': {'hits': {'total': {'value': len(docs)}, 'hits': docs}}}
+    return hit
+
+
+@pytest.mark.unit
+class TestTMMapMget:
+
+    def test_single_terms_search_per_group(self, fake_es):
+        es = fake_es(['map_en_es'], hits=[[mget_hit('s1', ['t1', 't2']), mget_hit('s3', ['t3'])]])
+        m = create_map(es)
+        docs = m.mget([(sid, 'en', 'es', None, None, ['d']) for sid in ['s1', 's2', 's3']], return_multiple=True)
+        assert len(es.searches) == 1
+        query = es.searches[0].to_dict()
+        assert {'terms': {'source_id.keyword': ['s1', 's2', 's3']}} in query['query']['bool']['filter']
+        assert query['collapse']['inner_hits']['size'] == TMMapES.MGET_MULTIPLE_SIZE
+        assert [d['target_id'] if d else None for d in docs] == ['t1', 't2', None, 't3']
+
+    def test_single_doc_per_id(self, fake_es):
+        es = fake_es(['map_en_es'], hits=[[mget_hit('s2', ['t2']), mget_hit('s1', ['t1'])]])
+        docs = create_map(es).mget([('s1', 'en', 'es', None, None, None), ('s2', 'en', 'es', None, None, None),
+                                    ('s4', 'en', 'es', None, None, None)])
+        assert 'inner_hits' not in es.searches[0].to_dict()['collapse']
+        assert [d['target_id'] if d else None for d in docs] == ['t1', 't2', None]
+
+    def test_groups_by_filters_and_swap(self, fake_es):
+        es = fake_es(['map_en_es'], hits=[[mget_hit('s1', ['t1'])], [mget_hit('s2', ['t2'], swap=True)]])
+        smeta = {'context_before': 'x'}
+        docs = create_map(es).mget([('s1', 'en', 'es', smeta, None, None), ('s2', 'es', 'en', None, None, None),
+                                    ('s1', 'en', 'fr', None, None, None)])
+        assert len(es.searches) == 2
+        assert {'terms': {'target_id.keyword': ['s2']}} in es.searches[1].to_dict()['query']['bool']['filter']
+        # Missing index (en-fr) is skipped, reverse index result is swapped
+        assert [(d['source_id'], d['target_id']) for d in docs] == [('s1', 't1'), ('s2', 't2')]
+        assert docs[1]['source_language'] == 'es'
+
+    def test_per_id_fallback(self, fake_es, monkeypatch):
+        monkeypatch.setattr(TMMapES, 'MGET_TERMS', False)
+        es = fake_es(['map_en_es'], hits=[[mget_hit('s1', ['t1'])], [mget_hit('s2', ['t2'])]])
+        docs = create_map(es).mget([('s1', 'en', 'es', None, None, None), ('s2', 'en', 'es', None, None, None)])
+        assert len(es.searches) == 2
+        assert [d['target_id'] for d in docs] == ['t1', 't2']
+
+
+def exact_hit(source_text, target_ids, swap=False):
+    s, t = ('source', 'target') if not swap else ('target', 'source')
+    docs = [{'_index': 'map_en_es', '_id': tid, '_score': 0.0,
+             '_source': {s + '_id': 's', t + '_id': tid, s + '_text': source_text, t + '_text': 'b',
+                         s + '_hash': TMMapES.text_hash(source_text), t + '_hash': TMMapES.text_hash('b')}}
+            for tid in target_ids]
+    hit = dict(docs[0])
+    hit['inner_hits'] = {'docs': {'hits': {'total': {'value': len(docs)}, 'hits': docs}}}
+    return hit
+
+
+@pytest.mark.unit
+class TestTMMapExact:
+
+    def test_single_terms_search(self, fake_es):
+        es = fake_es(['map_en_es'], hits=[[exact_hit('Hello world', ['t1', 't2'])]])
+        docs = create_map(es).mget_exact('en', 'es', ['Hello  world', 'Other', 'Hello world'], domains=['d'])
+        assert len(es.searches) == 1
+        query = es.searches[0].to_dict()
+        hashes = [TMMapES.text_hash('Hello world'), TMMapES.text_hash('Other')]
+        assert {'terms': {'source_hash': hashes}} in query['query']['bool']['filter']
+        assert {'terms': {'domain.keyword': ['d']}} in query['query']['bool']['filter']
+        assert query['collapse']['field'] == 'source_hash'
+        assert [[d['target_id'] for d in d_list] for d_list in docs] == [['t1', 't2'], [], ['t1', 't2']]
+
+    def test_reverse_index_swaps_fields(self, fake_es):
+        es = fake_es(['map_en_es'], hits=[[exact_hit('Hola', ['t1'], swap=True)]])
+        docs = create_map(es).mget_exact('es', 'en', ['Hola'])
+        assert es.searches[0].to_dict()['query']['bool']['filter'] == [{'terms': {'target_hash': [TMMapES.text_hash('Hola')]}}]
+        assert docs[0][0]['source_text'] == 'Hola'
+        assert docs[0][0]['source_hash'] == TMMapES.text_hash('Hola')
+
+    def test_missing_index(self, fake_es):
+        es = fake_es(['map_en_es'])
+        assert create_map(es).mget_exact('en', 'fr', ['a', 'b']) == [[], []]
+        assert not es.searches
+
+    def test_segment2doc_hashes(self, fake_es):
+        segment = TMTranslationUnit({'source_text': 'Hello <T1>world</T1>', 'target_text': 'Hola mundo'})
+        doc = create_map(fake_es([]))._segment2doc(segment)
+        assert doc['source_hash'] == TMMapES.text_hash('Hello world')
+        assert doc['target_hash'] == TMMapES.text_hash('Hola mundo')
+        assert doc['source_context_hash'] is None
+
+    def test_segment2doc_context_hashes(self, fake_es):
+        metadata = {'context_before': 'Before', 'context_after': 'After'}
+        segment = TMTranslationUnit({'source_text': 'Hello world', 'target_text': 'Hola mundo', 'source_metadata': metadata})
+        doc = create_map(fake_es([]))._segment2doc(segment)
+        assert doc['source_context_hash'] == TMMapES.context_hash('Hello  world', metadata)
+        assert doc['source_context_hash'] != TMMapES.context_hash('Hello world', {'context_before': 'Before'})
+        assert doc['target_context_hash'] is None
+
+    def test_context_hash_filter(self, fake_es):
+        es = fake_es(['map_en_es'])
+        metadata = {'context_before': 'Before', 'context_after': 'After'}
+        create_map(es).mget_exact('en', 'es', ['Hello world'], source_metadata=metadata)
+        filters = es.searches[0].to_dict()['query']['bool']['filter']
+        assert filters[1] == {'terms': {'source_context_hash': [TMMapES.context_hash('Hello world', metadata)]}}
+        # Partial contexts are filtered by phrase
+        create_map(es).mget_exact('en', 'es', ['Hello world'], source_metadata={'context_before': 'Before'})
+        assert {'match_phrase': {'source_metadata.context_before': 'Before'}} in es.searches[1].to_dict()['query']['bool']['filter']
+
+    def test_update_hashes(self, fake_es):
+        es = fake_es(['map_en_es'])
+        metadata = {'context_before': 'Antes', 'context_after': 'Después'}
+        segment = TMTranslationUnit({'source_text': 'Hola', 'target_text': 'Hello',
+                                     'source_language': 'es-ES', 'target_language': 'en-GB',
+                                     'source_metadata': metadata})
+        m = create_map(es)
+        m.update_hashes([segment])
+        action, = es.bulk_actions
+        assert action['_id'] == m._allocate_id(segment, swap=True)
+        # Chunks are sent concurrently, the same doc may be updated by two of them at once
+        assert action['retry_on_conflict'] == OpenSearchHelper.RETRY_ON_CONFLICT
+        assert action['doc'] == {'source_hash': TMMapES.text_hash('Hello'), 'target_hash': TMMapES.text_hash('Hola'),
+                                 'source_context_hash': None,
+                                 'target_context_hash': TMMapES.context_hash('Hola', metadata)}
+
+
+@pytest.mark.unit
+class TestTMMapDenormalized:
+
+    def test_mquery_direct_index(self, fake_es):
+        es = fake_es(['map_en_es'], hits=[[map_hit('Hello world', 'Hola a todos', 'UH NN', 'UH P NN')]])
+        docs = create_map(es).mquery('en', 'es', 10, ['hello world'], [{'token_cnt': {'gte': 1, 'lte': 3}}])
+        assert docs[0][0]['source_pos'] == 'UH NN'
+        query = es.searches[0].to_dict()
+        assert query['query']['bool']['must'] == [{'match': {'source_text.search': 'hello world'}}]
+        assert {'range': {'source_token_cnt': {'gte': 1, 'lte': 3}}} in query['query']['bool']['filter']
+        assert query['size'] == 10
+
+    def test_mquery_reverse_index_swaps_fields(self, fake_es):
+        es = fake_es(['map_en_es'], hits=[[map_hit('Hello world', 'Hola a todos', 'UH NN', 'UH P NN')]])
+        docs = create_map(es).mquery('es', 'en', 10, ['hola a todos'], [{}])
+        assert docs[0][0]['source_text'] == 'Hola a todos'
+        assert docs[0][0]['source_pos'] == 'UH P NN'
+        assert docs[0][0]['target_token_cnt'] == 2
+        assert es.searches[0].to_dict()['query'] == {'match': {'target_text.search': 'hola a todos'}}
+
+    def test_mquery_missing_index(self, fake_es):
+        es = fake_es(['map_en_es'])
+        assert create_map(es).mquery('en', 'fr', 10, ['a', 'b'], [{}, {}]) == [[], []]
+
+    def test_swap_without_denormalized_fields(self, fake_es):
+        doc = {'source_id': 's', 'target_id': 't', 'source_language': 'en', 'target_language': 'es',
+               'source_text': 'a', 'target_text': 'b'}
+        create_map(fake_es([]))._swap(doc)
+        assert doc['source_text'] == 'b'
+        assert 'source_pos' not in doc
+
+    def test_update_denormalized(self, fake_es):
+        es = fake_es(['map_en_es'])
+        segment = TMTranslationUnit({'source_text': 'Hola', 'target_text': 'Hello',
+                                     'source_language': 'es-ES', 'target_language': 'en-GB',
+                                     'source_pos': 'UH', 'target_pos': 'INTJ',
+                                     'source_token_cnt': 1, 'target_token_cnt': 1})
+        m = create_map(es)
+        m.update_denormalized([segment])
+        action = es.bulk_actions[0]
+        assert action['_index'] == 'map_en_es'
+        assert action['_id'] == m._allocate_id(segment, swap=True)
+        assert action['doc']['source_pos'] == 'INTJ'
+        assert action['doc']['target_pos'] == 'UH'
+
+    def test_segment2doc_layouts(self, fake_es, monkeypatch):
+        segment = TMTranslationUnit({'source_text': 'Hola', 'target_text': 'Hello',
+                                     'source_pos': 'UH', 'source_token_cnt': 1})
+        m = create_map(fake_es([]))
+        monkeypatch.setattr(TMMapES, 'DENORMALIZED', False)
+        assert 'source_pos' not in m._segment2doc(segment)
+        monkeypatch.setattr(TMMapES, 'DENORMALIZED', True)
+        doc = m._segment2doc(segment)
+        assert doc['source_pos'] == 'UH'
+        assert doc['source_token_cnt'] == 1
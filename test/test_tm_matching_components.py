@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the per-language-pair registry of matching components.
+"""
+import os
+import sys
+import threading
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+import TMMatching.TMMatchingComponents as components_module
+from TMMatching.TMMatchingComponents import TMMatchingComponents
+
+
+class FakeComponent:
+    created = 0
+
+    def __init__(self, *args):
+        FakeComponent.created += 1
+        self.args = args
+
+
+class UnsupportedRegex:
+    def __init__(self, *args):
+        raise ValueError("Unsupported language")
+
+
+@pytest.fixture(autouse=True)
+def fake_components(monkeypatch):
+    FakeComponent.created = 0
+    monkeypatch.setattr(components_module, 'TMRegexMatch', FakeComponent)
+    monkeypatch.setattr(components_module, 'TMPosMatch', FakeComponent)
+    monkeypatch.setattr(components_module, 'TMSplit', FakeComponent)
+    TMMatchingComponents.clear()
+    yield
+    TMMatchingComponents.clear()
+
+
+@pytest.mark.unit
+class TestTMMatchingComponents:
+
+    def test_components_are_shared_per_language_pair(self):
+        components = TMMatchingComponents.get('EN', 'es')
+        assert TMMatchingComponents.get('en', 'ES') is components
+        assert components.regex is components.regex
+        assert components.pos_match.args == ('en', 'es')
+        assert components.split('en_generic').args == ('en_generic', 'en')
+        assert FakeComponent.created == 3
+
+    def test_lazy_construction(self):
+        TMMatchingComponents.get('en', 'es')
+        assert FakeComponent.created == 0
+
+    def test_unsupported_regex(self, monkeypatch):
+        monkeypatch.setattr(components_module, 'TMRegexMatch', UnsupportedRegex)
+        assert TMMatchingComponents.get('xx', 'yy').regex is None
+
+    def test_bounded_size(self, monkeypatch):
+        monkeypatch.setattr(TMMatchingComponents, 'MAX_SIZE', 2)
+        en_es = TMMatchingComponents.get('en', 'es')
+        TMMatchingComponents.get('en', 'fr')
+        TMMatchingComponents.get('en', 'es') # recently used
+        TMMatchingComponents.get('en', 'de')
+        assert TMMatchingComponents.get('en', 'es') is en_es
+        assert list(TMMatchingComponents._registry.keys()) == [('en', 'de'), ('en', 'es')]
+
+    def test_thread_safety(self):
+        components = []
+        def get():
+            c = TMMatchingComponents.get('en', 'es')
+            c.regex
+            components.append(c)
+        threads = [threading.Thread(target=get) for i in range(8)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        assert len(set(id(c) for c in components)) == 1
+        assert FakeComponent.created == 1
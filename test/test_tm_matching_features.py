@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Unit tests for matching features precomputed at ingestion time and their use by TMMatching.
+"""
+import os
+import sys
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from Config.Config import G_CONFIG
+from helpers.OpenSearchHelper import OpenSearchHelper
+from TMDbApi.TMMonoLing import TMMonoLing
+from TMDbApi.TMTranslationUnit import TMTranslationUnit
+from TMMatching.TMMatching import TMMatching
+from TMMatching.TMMatchingFeatures import TMMatchingFeatures
+from TMMatching.TMRegxMatch import TMRegexMatch
+from TMMatching.TMUtilsMatching import TMUtilsMatching
+from TMDbApi.TMUtils import TMTimer
+
+SOURCES = ['Connect the pipe to the female end of the T.',
+           'Connect the <T1>pipe</T1> to the male end of the T on 12/05/2020.',
+           'The house has 3 rooms and 5.5 kg of cats',
+           'Send it to info@example.com before the end of the day',
+           '']
+
+
+@pytest.fixture(autouse=True)
+def opensearch_config(monkeypatch):
+    config = dict(G_CONFIG.config['opensearch'], host='localhost', port='9200')
+    monkeypatch.setitem(G_CONFIG.config, 'opensearch', config)
+    OpenSearchHelper._client = None
+    yield
+    OpenSearchHelper._client = None
+
+
+def create_matching(query, pipe=None):
+    matching = TMMatching.__new__(TMMatching)
+    matching.src_lang = 'en'
+    matching.tgt_lang = 'es'
+    matching.min_match = 50
+    matching.pipe = pipe if pipe is not None else ['regex', 'tags']
+    matching.timer = TMTimer("test")
+    matching.match = {'regex': TMRegexMatch('en', 'es')}
+    query_re = matching.match['regex'].re_pp['en'].process(query)
+    matching.query_dic = {'query': query, 'query_re': query_re, 'query_re_reduce': TMRegexMatch.simplified_name(query_re)}
+    return matching
+
+
+def create_segments(with_features):
+    segments = []
+    for source in SOURCES:
+        segment = TMTranslationUnit({'source_text': source, 'target_text': source,
+                                     'source_language': 'en-GB', 'target_language': 'es-ES'})
+        if with_features: segment.source_features = TMMatchingFeatures.compute(source, 'en-GB')
+        segments.append((segment, None))
+    return segments
+
+
+@pytest.mark.unit
+class TestTMMatchingFeatures:
+
+    def test_compute(self):
+        features = TMMatchingFeatures.compute('I have 5 <T1>cats</T1>', 'en-GB')
+        assert features['version'] == TMMatchingFeatures.VERSION
+        assert features['lang'] == 'en'
+        assert features['text_re'] == TMRegexMatch('en', 'es').re_pp['en'].process('I have 5 T cats T ')
+        assert '|NUMBER|' in features['text_re']
+        assert features['text_re_reduce'] == TMRegexMatch.simplified_name(features['text_re'])
+        assert features['words'] == ['I', '5', 'T', 'cats', 'T']
+        assert 'have' in features['stop_words']
+
+    def test_get_checks_version_and_language(self, monkeypatch):
+        segment = TMTranslationUnit({'source_text': 'Hello'})
+        assert TMMatchingFeatures.get(segment, 'source', 'en') is None
+        segment.source_features = TMMatchingFeatures.compute('Hello', 'en-US')
+        assert TMMatchingFeatures.get(segment, 'source', 'EN') == segment.source_features
+        assert TMMatchingFeatures.get(segment, 'source', 'en-us') is None
+        assert TMMatchingFeatures.get(segment, 'target', 'en') is None
+        monkeypatch.setattr(TMMatchingFeatures, 'VERSION', TMMatchingFeatures.VERSION + 1)
+        assert TMMatchingFeatures.get(segment, 'source', 'en') is None
+
+    @pytest.mark.parametrize("pipe", [['regex', 'tags'], ['tags']])
+    def test_match_rank_same_with_features(self, pipe):
+        for query in SOURCES[:4]:
+            expected = create_matching(query, pipe)._match_rank(create_segments(False), concordance=True)
+            matching = create_matching(query, pipe)
+            rank = matching._match_rank(create_segments(True), concordance=True)
+            assert [(s[0][0].source_text, s[0][2], s[0][3], s[1]) for s in rank] == \
+                   [(s[0][0].source_text, s[0][2], s[0][3], s[1]) for s in expected]
+            assert matching.timer.counts['rank segments: features'] == len(SOURCES)
+
+    def test_tokenize_uses_features_of_unchanged_text(self, monkeypatch):
+        monkeypatch.setattr(TMUtilsMatching, 'pre_process', lambda text, lang, preprocess, dic_re: 'computed')
+        matching = create_matching('query')
+        segment = TMTranslationUnit({'source_text': 'Hello, world'})
+        segment.source_features = {'version': TMMatchingFeatures.VERSION, 'lang': 'en', 'text_tok': 'precomputed'}
+        assert matching._tokenize(segment, 'source', 'Hello, world', 'en') == 'precomputed'
+        assert matching._tokenize(segment, 'source', 'Hello, world!', 'en') == 'computed'
+        assert matching._tokenize(segment, 'source', 'Hello, world', 'es') == 'computed'
+
+    def test_segment2doc_stores_features(self, monkeypatch):
+        monkeypatch.setattr(TMMonoLing, 'MATCHING_FEATURES', True)
+        segment = TMTranslationUnit({'source_text': 'Connect the pipe', 'target_text': 'Conecte la tubería',
+                                     'source_language': 'en-GB', 'target_language': 'es-ES'})
+        ml_index = TMMonoLing()
+        monkeypatch.setattr(ml_index, 'token_count', lambda text, lang: len(text.split(' ')))
+        doc = ml_index._segment2doc_upsert(segment, 'source')
+        assert doc['upsert']['features'] == TMMatchingFeatures.compute('Connect the pipe', 'en-GB')
+        assert doc['script']['params']['features'] == doc['upsert']['features']
+        monkeypatch.setattr(TMMonoLing, 'MATCHING_FEATURES', False)
+        assert 'features' not in ml_index._segment2doc(segment, 'target')
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Parity tests for the batch candidate scorer of TMMatching against the per-candidate _tm_edit_distance
+and tests of candidates pruning by score upper bound.
+"""
+import os
+import sys
+import random
+import re
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from TMMatching.TMMatching import TMMatching
+from TMMatching.TMRegxMatch import TMRegexMatch
+from TMMatching.TMUtilsMatching import TMUtilsMatching
+from TMDbApi.TMTranslationUnit import TMTranslationUnit
+from TMDbApi.TMUtils import TMTimer
+from TMPreprocessor.Xml.XmlUtils import XmlUtils
+
+WORDS = ['the', 'a', 'of', 'and', 'to', 'in', 'is', 'it', 'el', 'la', 'de', 'que', 'y', 'en',
+         'cat', 'house', 'pipe', 'female', 'end', 'connect', 'units', 'housing', 'casa', 'gato',
+         'tubería', 'extremo', '3', '67', '2020', 'T1', 'ABC', 'Hanano', '東京', 'カタカナ', 'ひらがな']
+SYMBOLS = ['.', ',', ';', ':', '!', '?', '$', '%', '#', '-', '(', ')', '/', '"', '<T1>', '</T1>']
+
+
+def random_text(rnd, max_len=12):
+    tokens = []
+    for i in range(rnd.randint(0, max_len)):
+        tokens.append(rnd.choice(WORDS) if rnd.random() < 0.8 else rnd.choice(SYMBOLS))
+    return ' '.join(tokens)
+
+
+def mutate(rnd, text):
+    tokens = text.split(' ') if text else []
+    for i in range(rnd.randint(0, 4)):
+        op = rnd.random()
+        if op < 0.3 and tokens:
+            tokens.pop(rnd.randrange(len(tokens)))
+        elif op < 0.6:
+            tokens.insert(rnd.randint(0, len(tokens)), rnd.choice(WORDS + SYMBOLS))
+        elif tokens:
+            tokens[rnd.randrange(len(tokens))] = rnd.choice(WORDS + SYMBOLS)
+    return ' '.join(tokens)
+
+
+def create_matching(src_lang, query=None, pipe=None, min_match=75):
+    matching = TMMatching.__new__(TMMatching)
+    matching.src_lang = src_lang
+    matching.min_match = min_match
+    matching.pipe = pipe if pipe is not None else ['tags']
+    matching.timer = TMTimer("test")
+    if query is not None:
+        matching.query_dic = {'query': query, 'query_re': query, 'query_re_reduce': TMRegexMatch.simplified_name(query)}
+    return matching
+
+
+@pytest.mark.unit
+class TestTMMatchingBatchScorer:
+
+    @pytest.mark.parametrize("src_lang", ['en', 'es', 'xx'])
+    def test_parity_with_tm_edit_distance(self, src_lang):
+        rnd = random.Random(src_lang)
+        matching = create_matching(src_lang)
+        for i in range(200):
+            query = random_text(rnd)
+            candidates = [mutate(rnd, query) for j in range(5)] + [random_text(rnd) for j in range(5)] + ['', '  ']
+            q_simplified = TMRegexMatch.simplified_name(query)
+            s_simplified = [TMRegexMatch.simplified_name(c) for c in candidates]
+            expected = [matching._tm_edit_distance(query, c, q_simplified, s) for c, s in zip(candidates, s_simplified)]
+            assert matching._tm_edit_distance_batch(query, candidates, q_simplified, s_simplified) == expected
+
+    def test_known_scores(self):
+        matching = create_matching('en')
+        query = 'Connect the pipe to the female end of the T.'
+        candidates = [query, 'Connect the pipe to the male end of the T.', '']
+        scores = matching._tm_edit_distance_batch(query, candidates, query, candidates)
+        assert scores[0] == 100
+        assert 0 < scores[1] < 100
+        assert scores[2] == 1
+
+    def test_empty_candidates(self):
+        assert create_matching('en')._tm_edit_distance_batch('query', [], 'query', []) == []
+
+
+@pytest.mark.unit
+class TestTMMatchingPruning:
+
+    @pytest.mark.parametrize("src_lang", ['en', 'es', 'xx'])
+    def test_upper_bound_is_admissible(self, src_lang):
+        rnd = random.Random('bound' + src_lang)
+        st_words = TMUtilsMatching.check_stopwords_set(src_lang)
+        matching = create_matching(src_lang)
+        for i in range(200):
+            query = random_text(rnd)
+            candidates = [mutate(rnd, query) for j in range(5)] + [random_text(rnd) for j in range(5)] + ['']
+            bounds = TMMatching._score_upper_bound(query, candidates, st_words)
+            for candidate, bound in zip(candidates, bounds):
+                score = matching._tm_edit_distance(query, candidate, TMRegexMatch.simplified_name(query),
+                                                   TMRegexMatch.simplified_name(candidate))
+                assert bound >= score
+
+    def test_match_rank_prunes_hopeless_segments(self):
+        rnd = random.Random('rank')
+        query = 'Connect the pipe to the female end of the T and the house'
+        sources = [query, 'Connect the pipe to the male end of the T and the house'] + \
+                  [random_text(rnd) for i in range(20)]
+        segments = [(TMTranslationUnit({'source_text': s, 'target_text': s}), None) for s in sources]
+
+        matching = create_matching('en', query)
+        full_rank = matching._match_rank(list(segments), concordance=True)
+        rank = matching._match_rank(list(segments))
+
+        pruned = [seg_info for seg_info in rank if TMMatching._is_pruned(seg_info)]
+        assert pruned
+        assert matching.timer.counts['pruned: rank'] == len(pruned)
+        # Not pruned segments are scored and ranked exactly as without pruning
+        pruned_ids = set(id(seg_info[0][0]) for seg_info in pruned)
+        assert [(id(seg_info[0][0]), seg_info[1]) for seg_info in rank if not TMMatching._is_pruned(seg_info)] == \
+               [(id(seg_info[0][0]), seg_info[1]) for seg_info in full_rank if id(seg_info[0][0]) not in pruned_ids]
+        full_scores = dict((seg_info[0][0].source_text, seg_info[1]) for seg_info in full_rank)
+        for seg_info in pruned:
+            assert full_scores[seg_info[0][0].source_text] <= seg_info[1] < matching.min_match
+        assert not TMMatching._is_pruned(rank[0])
+
+    def test_match_rank_of_tagged_sources(self):
+        query = 'Connect the <T1>pipe</T1> to the female end'
+        sources = ['Connect the <T1>pipe</T1> to the female end', 'Connect the <b>pipe</b> to the  female end',
+                   'Connect <T1/>the pipe<T2/> to the male end', 'Connect the pipe']
+        scans = [XmlUtils.scan_tags(s) for s in sources]
+        # Tags are simplified only in sources with T tags
+        assert [TMMatching._reduce_src_tags(s, scan) for s, scan in zip(sources, scans)] == \
+               [TMUtilsMatching.reduce_tags(s) if re.search("</?T[0-9]*/?>", s) else s for s in sources]
+        matching = create_matching('en', query)
+        src_texts = [TMMatching._reduce_src_tags(s, scan) for s, scan in zip(sources, scans)]
+        assert matching._score_upper_bounds(query, src_texts, [stripped for stripped, reduced, tags in scans]) == \
+               [max(b, sb) for b, sb in zip(TMMatching._score_upper_bound(query, src_texts, TMUtilsMatching.check_stopwords_set('en')),
+                                            TMMatching._score_upper_bound(TMUtilsMatching.strip_tags(query),
+                                                                          [TMUtilsMatching.strip_tags(s).strip() for s in sources],
+                                                                          TMUtilsMatching.check_stopwords_set('en')))]
+        segments = [(TMTranslationUnit({'source_text': s, 'target_text': s}), None) for s in sources]
+        rank = matching._match_rank(segments)
+        assert rank[0][0][0].source_text == sources[0]
+
+    def test_pruned_segments_ranked_after_scored(self):
+        # A is scored 90, P is pruned (bound 74 < min_match) and B is scored 60, but B may be lifted
+        # above min_match by later stages (e.g. tags), so it must be ranked before P
+        segments = [(TMTranslationUnit({'source_text': s, 'target_text': s}), None) for s in ['A', 'P', 'B']]
+        matching = create_matching('en', 'query')
+        matching._can_prune = lambda: True
+        matching._score_upper_bounds = lambda query, src_texts, stripped_texts: [95, 74, 80]
+
+        def score_segments(best_segments, query, src_texts, indices):
+            scores = [None] * len(best_segments)
+            for i in indices:
+                best_segments[i] = (best_segments[i][0], best_segments[i][1], src_texts[i], src_texts[i])
+                scores[i] = {'A': 90, 'P': 50, 'B': 60}[src_texts[i]]
+            return scores
+        matching._score_segments = score_segments
+
+        rank = matching._match_rank(list(segments))
+        assert [(seg_info[0][0].source_text, seg_info[1]) for seg_info in rank] == [('A', 90), ('B', 60), ('P', 74)]
+        assert [TMMatching._is_pruned(seg_info) for seg_info in rank] == [False, False, True]
+
+    def test_no_pruning_if_nothing_can_match(self):
+        segments = [(TMTranslationUnit({'source_text': s, 'target_text': s}), None) for s in ['a b c', 'd e f g h']]
+        matching = create_matching('en', 'Connect the pipe to the female end of the T')
+        rank = matching._match_rank(segments)
+        assert not any(TMMatching._is_pruned(seg_info) for seg_info in rank)
+
+    def test_can_prune(self):
+        assert create_matching('en', 'query', pipe=['regex', 'tags'])._can_prune()
+        assert not create_matching('en', 'query', pipe=['regex', 'tags', 'posTag'])._can_prune()
+        assert not create_matching('en', 'query', pipe=['split'])._can_prune()
+        matching = create_matching('en', 'I have 5 cats', pipe=['regex', 'tags'])
+        matching.query_dic['query_re'] = 'I have |NUMBER| cats'
+        assert not matching._can_prune()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the query result cache (LRU + TTL, per language pair invalidation).
+"""
+import os
+import sys
+from collections import OrderedDict
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from TMDbApi.TMQueryCache import TMQueryCache
+from TMDbApi.TMQueryParams import TMQueryParams
+from TMDbApi.TMTranslationUnit import TMTranslationUnit
+
+
+class FakeRedis:
+    """Keeps values in a dict, 'down' makes all calls fail."""
+
+    def __init__(self):
+        self.values = dict()
+        self.down = False
+
+    def _check(self):
+        if self.down: raise ConnectionError("Redis is down")
+
+    def get(self, key):
+        self._check()
+        return self.values.get(key)
+
+    def mget(self, keys):
+        self._check()
+        return [self.values.get(k) for k in keys]
+
+    def incr(self, key):
+        self._check()
+        self.values[key] = int(self.values.get(key) or 0) + 1
+        return self.values[key]
+
+    def pipeline(self):
+        return self
+
+    def setex(self, key, ttl, value):
+        self.values[key] = value
+
+    def execute(self):
+        self._check()
+
+    def scan_iter(self, match):
+        self._check()
+        return [k.encode() for k in self.values if k.startswith(match.rstrip('*'))]
+
+    def delete(self, *keys):
+        for k in keys: self.values.pop(k.decode(), None)
+
+
+@pytest.fixture(autouse=True)
+def redis(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(TMQueryCache, '_entries', OrderedDict())
+    monkeypatch.setattr(TMQueryCache, '_stats', {'hits': 0, 'misses': 0, 'redis_hits': 0, 'invalidations': 0})
+    monkeypatch.setattr(TMQueryCache, '_redis', redis)
+    monkeypatch.setattr(TMQueryCache, 'ENABLED', True)
+    monkeypatch.setattr(TMQueryCache, 'MAX_SIZE', 100)
+    monkeypatch.setattr(TMQueryCache, 'TTL', 600)
+    return redis
+
+
+def create_qparams(qlist, slang='en-GB', tlang='es-ES', **kwargs):
+    return TMQueryParams(qlist, [], slang, tlang, ['regex', 'tags'], 'json', 20, **kwargs)
+
+
+@pytest.mark.unit
+class TestTMQueryCache:
+
+    def test_put_and_get(self):
+        qparams = create_qparams(['Hello', 'World'])
+        keys = TMQueryCache.keys(qparams)
+        assert TMQueryCache.get_many(keys) == [None, None]
+        TMQueryCache.put_many(keys[:1], [([('segment', 100)], False)])
+        assert TMQueryCache.get_many(keys) == [([('segment', 100)], False), None]
+        stats = TMQueryCache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 3
+
+    def test_keys_depend_on_params(self):
+        keys = TMQueryCache.keys(create_qparams(['Hello']))
+        assert keys == TMQueryCache.keys(create_qparams(['Hello']))
+        assert keys != TMQueryCache.keys(create_qparams(['Hello'], min_match=90))
+        assert keys != TMQueryCache.keys(create_qparams(['Hello'], domains=['tag1']))
+        assert keys != TMQueryCache.keys(create_qparams(['Hello'], source_metadata={'context_before': 'x'}))
+        assert keys != TMQueryCache.keys(create_qparams(['Hello'], tlang='fr-FR'))
+        assert keys != TMQueryCache.keys(create_qparams(['Hello']), in_context=True)
+
+    def test_cached_values_are_copies(self):
+        keys = TMQueryCache.keys(create_qparams(['Hello']))
+        segment = TMTranslationUnit({'source_text': 'Hello', 'target_text': 'Hola'})
+        TMQueryCache.put_many(keys, [([(segment, 100)], False)])
+        cached = TMQueryCache.get_many(keys)[0]
+        cached[0][0][0].target_text = 'Changed'
+        assert TMQueryCache.get_many(keys)[0][0][0][0].target_text == 'Hola'
+
+    def test_invalidate_language_pair(self):
+        keys_en_es = TMQueryCache.keys(create_qparams(['Hello']))
+        keys_en_fr = TMQueryCache.keys(create_qparams(['Hello'], tlang='fr-FR'))
+        TMQueryCache.put_many(keys_en_es + keys_en_fr, ['es', 'fr'])
+        # Reverse direction shares the same map index
+        TMQueryCache.invalidate(('es', 'en'))
+        assert TMQueryCache.get_many(TMQueryCache.keys(create_qparams(['Hello']))) == [None]
+        assert TMQueryCache.get_many(TMQueryCache.keys(create_qparams(['Hello'], tlang='fr-FR'))) == ['fr']
+
+    def test_invalidate_by_other_process(self, redis):
+        keys = TMQueryCache.keys(create_qparams(['Hello']))
+        TMQueryCache.put_many(keys, ['value'])
+        # Generation bumped in Redis by a write of a job or another API worker
+        redis.incr(TMQueryCache.REDIS_PREFIX + 'gen:en_es')
+        assert TMQueryCache.get_many(TMQueryCache.keys(create_qparams(['Hello']))) == [None]
+
+    def test_shared_between_processes(self, redis, monkeypatch):
+        keys = TMQueryCache.keys(create_qparams(['Hello']))
+        TMQueryCache.put_many(keys, ['value'])
+        monkeypatch.setattr(TMQueryCache, '_entries', OrderedDict())
+        assert TMQueryCache.get_many(keys) == ['value']
+        assert TMQueryCache.stats()['redis_hits'] == 1
+
+    def test_redis_unavailable(self, redis):
+        keys = TMQueryCache.keys(create_qparams(['Hello']))
+        TMQueryCache.put_many(keys, ['value'])
+        redis.down = True
+        # Queries bypass the cache, failed invalidation drops local entries
+        assert TMQueryCache.keys(create_qparams(['Hello'])) is None
+        TMQueryCache.invalidate(('en', 'es'))
+        assert TMQueryCache.stats()['size'] == 0
+
+    def test_lru_eviction(self, monkeypatch):
+        monkeypatch.setattr(TMQueryCache, 'MAX_SIZE', 2)
+        keys = TMQueryCache.keys(create_qparams(['a', 'b', 'c']))
+        TMQueryCache.put_many(keys[:2], ['a', 'b'])
+        TMQueryCache.get_many(keys[:1]) # touch 'a'
+        TMQueryCache.put_many(keys[2:], ['c'])
+        assert list(TMQueryCache._entries) == [keys[0], keys[2]]
+
+    def test_ttl_expiry(self, redis, monkeypatch):
+        keys = TMQueryCache.keys(create_qparams(['Hello']))
+        TMQueryCache.put_many(keys, ['value'])
+        monkeypatch.setattr(TMQueryCache, 'TTL', 0)
+        # Expired by Redis as well (set with the same TTL)
+        redis.values = dict((k, v) for k, v in redis.values.items() if ':gen:' in k)
+        assert TMQueryCache.get_many(keys) == [None]
+        assert TMQueryCache.stats()['size'] == 0
+
+    def test_flush(self, redis):
+        keys = TMQueryCache.keys(create_qparams(['Hello']))
+        TMQueryCache.put_many(keys, ['value'])
+        TMQueryCache.invalidate(('en', 'fr'))
+        TMQueryCache.flush()
+        assert TMQueryCache.get_many(keys) == [None]
+        # Generations are kept
+        assert list(redis.values) == [TMQueryCache.REDIS_PREFIX + 'gen:en_fr']
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the in-context (101%) queries of TMDbApi.
+"""
+import os
+import sys
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from TMDbApi.TMDbApi import TMDbApi
+from TMDbApi.TMQueryParams import TMQueryParams
+from TMDbApi.TMTranslationUnit import TMTranslationUnit
+from TMDbApi.TMUtils import TMTimer
+from TMMatching.TMMatching import TMMatching
+
+QUERY = 'Connect the pipe.'
+CONTEXTS = {'context_before': 'A', 'context_after': 'B'}
+
+
+def segment(target_text, **kwargs):
+    return TMTranslationUnit(dict({'source_text': QUERY, 'target_text': target_text,
+                                   'source_language': 'en-GB', 'target_language': 'es-ES',
+                                   'tm_change_date': '20200101T000000Z'}, **kwargs))
+
+
+def create_db(candidates):
+    """Fuzzy retrieval returns the given candidates (in this order) for every query."""
+    db = TMDbApi.__new__(TMDbApi)
+    db.timer = TMTimer("test")
+    db._use_exact_match = lambda qparams: False
+
+    def fuzzy_mquery(qparams, in_context=False):
+        TMMatching.preprocess_queries(qparams.qlist, qparams.qinfo, qparams.source_lang)
+        return [(q, ) + db._query_candidates(q, qinfo, list(candidates), qparams, in_context)
+                for q, qinfo in zip(qparams.qlist, qparams.qinfo)]
+    db._fuzzy_mquery = fuzzy_mquery
+    return db
+
+
+def create_qparams(limit, **kwargs):
+    return TMQueryParams([QUERY], [], 'en', 'es', ['regex', 'tags'], 'json', limit, **kwargs)
+
+
+# Context match is the last one retrieved
+CANDIDATES = [segment('uno'), segment('dos'), segment('tres'), segment('cuatro', source_metadata=CONTEXTS)]
+
+
+@pytest.mark.unit
+class TestTMDbApiQueryInContext:
+
+    def test_match_contexts(self):
+        assert TMDbApi.match_contexts(segment('uno', source_metadata=CONTEXTS), CONTEXTS, None)
+        assert TMDbApi.match_contexts(segment('uno', source_metadata=CONTEXTS), CONTEXTS, CONTEXTS)
+        assert not TMDbApi.match_contexts(segment('uno', source_metadata=CONTEXTS), {'context_before': 'A'}, None)
+        # Nothing to compare
+        assert not TMDbApi.match_contexts(segment('uno', source_metadata=CONTEXTS), None, None)
+        assert not TMDbApi.match_contexts(segment('uno'), CONTEXTS, None)
+
+    def test_context_matches_precede_limit_cut(self):
+        db = create_db(CANDIDATES)
+        (q, (segments, match), segments101), = db._mquery(create_qparams(1, source_metadata=CONTEXTS), in_context=True)
+        # Only 2 * limit candidates are matched, context match is moved first
+        assert [s.target_text.lower() for s, ter in segments] == ['cuatro', 'uno']
+        assert [s.target_text.lower() for s, ter in segments101] == ['cuatro']
+
+    def test_no_101_without_metadata(self):
+        db = create_db(CANDIDATES)
+        (q, (segments, match), segments101), = db._mquery(create_qparams(1), in_context=True)
+        # Retrieval order is kept
+        assert [s.target_text.lower() for s, ter in segments] == ['uno', 'dos']
+        assert segments101 == []
+
+    def test_query_in_context(self):
+        db = create_db(CANDIDATES)
+        results101, results = db.query_in_context(create_qparams(1, source_metadata=CONTEXTS))
+        (segments101, _), = results101
+        (segments, _), = results
+        assert [s.target_text.lower() for s, ter in segments101] == ['cuatro']
+        assert [s.target_text.lower() for s, ter in segments] == ['cuatro', 'uno']
+        results101, results = db.query_in_context(create_qparams(1))
+        assert results101 == [([], False)]
+        assert [s.target_text.lower() for s, ter in results[0][0]] == ['uno', 'dos']
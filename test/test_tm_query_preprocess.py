@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Unit tests for batched tokenization and POS tagging of queries before matching.
+"""
+import os
+import sys
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from TMMatching.TMMatching import TMMatching
+from TMMatching.TMTextProcessors import TMTextProcessors
+from TMMatching.TMUtilsMatching import TMUtilsMatching
+
+
+class FakePosTagger:
+    """Tags every token as 'NN', records texts of each call."""
+
+    def __init__(self):
+        self.calls = []
+
+    def tag_segments(self, texts):
+        self.calls.append(list(texts))
+        return [[[w, 'NN'] for w in text.split(' ')] for text in texts]
+
+
+class FailingPosTagger:
+    def tag_segments(self, texts):
+        raise Exception("Unsupported language for POS tagging")
+
+
+@pytest.fixture
+def fake_processors(monkeypatch):
+    tagger = FakePosTagger()
+    tokenized = []
+
+    def pre_process(text, lang, preprocess, dic_re):
+        assert preprocess == 'tokenizer'
+        tokenized.append(text)
+        return text.replace('.', ' .')
+    monkeypatch.setattr(TMUtilsMatching, 'pre_process', pre_process)
+    monkeypatch.setattr(TMTextProcessors, 'pos_tagger', lambda lang: tagger)
+    return tagger, tokenized
+
+
+@pytest.mark.unit
+class TestTMQueryPreprocess:
+
+    def test_one_tagger_call_per_batch(self, fake_processors):
+        tagger, tokenized = fake_processors
+        qlist = ['Open the valve.', 'Connect the pipe.', 'Close it']
+        qinfo = [dict() for q in qlist]
+        TMMatching.preprocess_queries(qlist, qinfo, 'EN-GB')
+        assert tagger.calls == [['Open the valve .', 'Connect the pipe .', 'Close it']]
+        assert qinfo[0] == {'tokenizer': 'Open the valve .', 'pos': 'NN NN NN NN'}
+        assert qinfo[2]['pos'] == 'NN NN'
+        # Already processed queries are skipped
+        TMMatching.preprocess_queries(qlist, qinfo, 'en-gb')
+        assert len(tagger.calls) == 1
+        assert len(tokenized) == 3
+
+    def test_validate_pipe_uses_query_info(self, fake_processors):
+        tagger, tokenized = fake_processors
+        qinfo = {}
+        TMMatching.preprocess_queries(['Open the valve.'], [qinfo], 'en')
+        matching = TMMatching.__new__(TMMatching)
+        matching.query = 'Open the valve.'
+        matching.query_dic = qinfo
+        matching.src_lang = 'en'
+        matching.components = type('Components', (), {'regex': None, 'tags': None, 'pos_match': 'pos'})()
+        match, pipe = matching._validate_pipe(['tags', 'posTag'])
+        assert pipe == ['tags', 'posTag']
+        assert match['posTag'] == 'pos'
+        assert len(tagger.calls) == 1
+        assert len(tokenized) == 1
+
+    def test_unsupported_pos_tagger(self, fake_processors, monkeypatch):
+        monkeypatch.setattr(TMTextProcessors, 'pos_tagger', lambda lang: FailingPosTagger())
+        qinfo = [dict(), dict()]
+        TMMatching.preprocess_queries(['a b', 'c'], qinfo, 'xx')
+        assert qinfo == [{'tokenizer': 'a b'}, {'tokenizer': 'c'}]
+
+    def test_pre_process_batch_empty(self, fake_processors):
+        tagger, tokenized = fake_processors
+        assert TMUtilsMatching.pre_process_batch([], 'en', 'pos_tagger', {}) == []
+        assert not tagger.calls
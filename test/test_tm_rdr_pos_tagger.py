@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Parity tests of the compiled RDR POS tagger tree against RDRPOSTagger.tagRawSentence.
+"""
+import os
+import sys
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from TMPosTagger.TMRDRPOSTagger import TMRDRPOSTagger, TMCompiledRDRTree
+
+
+def read_sentences(limit=500):
+    with open(os.path.join(script_path, "..", "data", "test_sentences.txt")) as f:
+        sentences = [' '.join(l.strip().replace('.', ' .').replace(',', ' ,').split()) for l in f if l.strip()]
+    # Words containing '/' are split wrongly by the string based tagging
+    return [s for s in sentences if '/' not in s][:limit]
+
+
+def tag_raw(tagger, sentences):
+    return [[[element.split('/')[0], element.split('/')[1]] for element in
+             tagger.tagger.tagRawSentence(tagger.dict, s).split(' ')] for s in sentences]
+
+
+@pytest.mark.unit
+class TestTMCompiledRDRTree:
+
+    @pytest.mark.parametrize("lang", ['EN', 'DE', 'RU', 'FI'])
+    def test_same_as_tag_raw_sentence(self, lang):
+        tagger = TMRDRPOSTagger(lang)
+        sentences = read_sentences() + ['There is a “big” problem .', 'Números 12 y 3.5 mm', 'UNKNOWN Xyzzyqwerty']
+        expected = tag_raw(tagger, sentences)
+        assert tagger.only_tag_segments(sentences) == expected
+        # Memoized initial tags
+        assert tagger.compiled._initial_tags
+        assert tagger.tag_segments(sentences) == expected
+
+    def test_words_with_slash(self):
+        tagger = TMRDRPOSTagger('EN')
+        tagged = tagger.only_tag_segments(['Open the A/C unit'])[0]
+        assert [w for w, t in tagged] == ['Open', 'the', 'A/C', 'unit']
+        assert tagged[2][1] == tagger.tagger.tagRawSentence(tagger.dict, 'Open the A/C unit').split(' ')[2].rsplit('/', 1)[1]
+
+    def test_empty(self):
+        assert TMRDRPOSTagger('EN').only_tag_segments(['', '  ']) == [[], []]
+
+    def test_cache_is_bounded(self, monkeypatch):
+        tagger = TMRDRPOSTagger('EN')
+        monkeypatch.setattr(TMCompiledRDRTree, 'CACHE_SIZE', 3)
+        expected = tag_raw(tagger, ['a b c d e f g'])
+        assert tagger.only_tag_segments(['a b c d e f g']) == expected
+        assert len(tagger.compiled._initial_tags) <= 3
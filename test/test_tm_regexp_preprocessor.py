@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Unit tests of the regular expression preprocessor: skipping patterns by their trigger characters
+must give the same output as applying all patterns of the pipe.
+"""
+import os
+import sys
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from TMPreprocessor.TMRegExpPreprocessor import TMRegExpPreprocessor
+
+EXAMPLES = ["I have 2512 dollars",
+            "There are 3,200.35 euros",
+            "2nd degree",
+            "Send me an email to alex@blabla.com or to ale@bla.co",
+            "I was born on 18/08/1976 and graduated from school on 05-25-93, later moved to another country on October 1st, 1996",
+            "My meeting was at 18:00 or 6 pm and was moved to 7pm",
+            "Go to http://pangeanic.com",
+            "Going for 100 kilometers with speed of 25km/hr, drinking 5 liters of water. It took 4 hours",
+            "The calculation is 3+2= 5 and another one is 194.20 / 23*75 and another is V*(25-C) ",
+            "Company H&M acquired H.M.O in December 2015",
+            "a) Asia, b) Africa, c) Europe(Russia)",
+            "Instale el 6º casquillo del engranaje en el eje primario",
+            "Connect the <T1>pipe</T1> to the male end of the T",
+            "Nothing to replace here",
+            ""]
+
+
+def read_sentences():
+    with open(os.path.join(script_path, "..", "data", "test_sentences.txt")) as f:
+        return [l.rstrip('\n') for l in f]
+
+
+def process_all(pp, text):
+    for pattern in pp.pipe:
+        text = pp.regexp[pattern].process(text, pp._key2placeholder(pattern))
+    return text
+
+
+@pytest.mark.unit
+class TestTMRegExpPreprocessor:
+
+    @pytest.mark.parametrize("lc", ['en_US', 'es', 'fr', 'de', 'ru', 'ar', 'zh'])
+    def test_same_as_all_patterns(self, lc):
+        pp = TMRegExpPreprocessor(lc)
+        for text in EXAMPLES + read_sentences():
+            expected = process_all(pp, text)
+            assert pp.process(text) == expected
+            assert pp.get_pattern_value(text)[1] == expected
+
+    def test_get_pattern_value(self):
+        pp = TMRegExpPreprocessor('en_US')
+        values, text = pp.get_pattern_value("Send me an email to alex@blabla.com or to ale@bla.co on 18/08/1976, "
+                                            "not alex@blabla.com")
+        assert text == "Send me an email to |EMAIL| or to |EMAIL| on |DATETIME|, not |EMAIL|"
+        assert values == [('|DATETIME|', '18/08/1976'), ('|EMAIL|', 'alex@blabla.com'), ('|EMAIL|', 'ale@bla.co')]
+        # Matched values are not used as patterns (unbalanced parenthesis)
+        values, text = pp.get_pattern_value("V*(25-C)")
+        assert values[0] == ('|FORMULA|', 'V*(')
+        assert text == pp.process("V*(25-C)")
+
+    def test_skips_patterns_without_trigger(self, monkeypatch):
+        pp = TMRegExpPreprocessor('en_US')
+        applied = []
+        for pattern in pp.pipe:
+            monkeypatch.setattr(pp.regexp[pattern], 'process',
+                                lambda text, placeholder, pattern=pattern: applied.append(pattern) or text)
+        pp.process("Nothing to replace here")
+        assert applied == []
+        pp.process("Write to info@example.com")
+        assert applied == ['bullet', 'acronym', 'email', 'url']
+        applied.clear()
+        pp.process("Unicode digits ٣")
+        assert applied == ['datetime', 'munit', 'number']
+
+    def test_compiled_once_per_locale(self):
+        assert TMRegExpPreprocessor('en_US').regexp is TMRegExpPreprocessor('en_US', pipe=['number']).regexp
+        assert TMRegExpPreprocessor('en_US').regexp is not TMRegExpPreprocessor('es').regexp
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the one-time, versioned schema bootstrap (templates, mappings, scripts).
+"""
+import os
+import sys
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from Config.Config import G_CONFIG
+from helpers.OpenSearchHelper import OpenSearchHelper
+from TMDbApi.TMSchema import TMSchema
+
+
+@pytest.fixture(autouse=True)
+def reset_schema(monkeypatch):
+    config = dict(G_CONFIG.config['opensearch'], host='localhost', port='9200')
+    monkeypatch.setitem(G_CONFIG.config, 'opensearch', config)
+    OpenSearchHelper._client = None
+    monkeypatch.setattr(TMSchema, '_ensured', False)
+    yield
+    OpenSearchHelper._client = None
+
+
+@pytest.mark.unit
+class TestTMSchema:
+
+    def test_apply_puts_schema_and_records_version(self, fake_es):
+        es = fake_es()
+        assert TMSchema(es).apply()
+        assert ('create', 'jobs') in es.calls
+        assert {name for op, name in es.calls if op == 'template'} == \
+               {'tm_template', 'map_template', 'job_template', 'qlogger_template'}
+        assert ('mapping', 'map_*') in es.calls
+        assert ('script', 'upsert_segment') in es.calls
+        status = TMSchema(es).status()
+        assert status['version'] == TMSchema.VERSION
+        assert TMSchema(es).is_current()
+
+    def test_apply_is_noop_when_current(self, fake_es):
+        es = fake_es()
+        TMSchema(es).apply()
+        es.calls = []
+        assert not TMSchema(es).apply()
+        assert es.calls == []
+
+    def test_force_reapplies(self, fake_es):
+        es = fake_es()
+        TMSchema(es).apply()
+        es.calls = []
+        assert TMSchema(es).apply(force=True)
+        # Existing jobs index is not recreated
+        assert ('create', 'jobs') not in es.calls
+        assert ('script', 'upsert_segment') in es.calls
+
+    def test_version_change_reapplies(self, fake_es, monkeypatch):
+        es = fake_es()
+        TMSchema(es).apply()
+        monkeypatch.setattr(TMSchema, 'VERSION', TMSchema.VERSION + 1)
+        assert not TMSchema(es).is_current()
+        assert TMSchema(es).apply()
+
+    def test_ensure_runs_once_per_process(self, fake_es):
+        es = fake_es()
+        assert TMSchema.ensure(es)
+        es.docs.clear()
+        es.calls = []
+        assert not TMSchema.ensure(es)
+        assert es.calls == []
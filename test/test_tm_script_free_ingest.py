@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Unit tests of script-free writes: client-side merge of duplicates, 'create' of new docs
+and scripted upserts of existing ones.
+"""
+import os
+import sys
+import pytest
+
+script_path = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(script_path, "..", "src"))
+sys.path.insert(0, script_path)
+
+from TMDbApi.TMScriptFreeIngest import TMScriptFreeIngest
+from TMDbApi.TMMonoLing import TMMonoLing
+from TMDbApi.TMMap.TMMapES import TMMapES
+from TMDbApi.TMTranslationUnit import TMTranslationUnit
+from opensearchpy.helpers import BulkIndexError
+
+
+def merge(doc, new_doc):
+    return {'text': doc['text'], 'langs': doc['langs'] + [l for l in new_doc['langs'] if l not in doc['langs']]}
+
+
+def upsert(doc):
+    return {'upsert': doc, 'script': {'params': doc}}
+
+
+def doc(text, *langs):
+    return {'text': text, 'langs': list(langs)}
+
+
+@pytest.fixture
+def es(fake_es):
+    return fake_es(merge=merge)
+
+
+@pytest.mark.unit
+class TestTMScriptFreeIngest:
+
+    def test_merges_duplicates_of_batch(self, es):
+        ingest = TMScriptFreeIngest(es, merge, upsert, cache_size=10)
+        assert ingest.bulk([('tm_en', 1, doc('a', 'es')), ('tm_en', 2, doc('b', 'es')),
+                            ('tm_en', 1, doc('a', 'fr')), ('tm_es', 1, doc('a', 'en'))]) == (3, [])
+        assert es.requests == [[('create', '1'), ('create', '2'), ('create', '1')]]
+        assert es.docs[('tm_en', '1')] == doc('a', 'es', 'fr')
+
+    def test_conflict_falls_back_to_upsert(self, es):
+        es.docs[('tm_en', '1')] = doc('a', 'de')
+        ingest = TMScriptFreeIngest(es, merge, upsert, cache_size=10)
+        assert ingest.bulk([('tm_en', 1, doc('a', 'es')), ('tm_en', 2, doc('b', 'es'))]) == (2, [])
+        assert es.requests == [[('create', '1'), ('create', '2')], [('update', '1')]]
+        assert es.docs[('tm_en', '1')] == doc('a', 'de', 'es')
+        assert ingest.stats == {'create': 2, 'upsert': 0, 'conflict': 1}
+
+    def test_written_docs_are_upserted(self, es):
+        ingest = TMScriptFreeIngest(es, merge, upsert, cache_size=2)
+        ingest.bulk([('tm_en', i, doc(str(i), 'es')) for i in range(3)])
+        es.requests.clear()
+        ingest.bulk([('tm_en', i, doc(str(i), 'fr')) for i in range(3)])
+        # Id 0 is not cached anymore: created, conflicts and is upserted
+        assert es.requests == [[('create', '0'), ('update', '1'), ('update', '2')], [('update', '0')]]
+        assert all(d['langs'] == ['es', 'fr'] for d in es.docs.values())
+        assert len(ingest._written) == 2
+
+    def test_errors(self, fake_es):
+        es = fake_es(merge=merge, fail=('2',))
+        ingest = TMScriptFreeIngest(es, merge, upsert, cache_size=10)
+        with pytest.raises(BulkIndexError) as e:
+            ingest.bulk([('tm_en', 1, doc('a', 'es')), ('tm_en', 2, doc('b', 'es'))])
+        assert len(e.value.errors) == 1
+        assert list(ingest._written) == [('tm_en', '1')]
+
+    def test_mono_merge(self):
+        ml_index = TMMonoLing.__new__(TMMonoLing)
+        merged = ml_index._merge_docs({'text': 'a', 'target_language': ['es'], 'pos': None, 'token_cnt': 1},
+                                      {'text': 'a', 'target_language': ['fr'], 'pos': 'NN', 'token_cnt': 1})
+        assert merged == {'text': 'a', 'target_language': ['es', 'fr'], 'pos': 'NN', 'token_cnt': 1}
+
+    def test_map_merge(self):
+        m = TMMapES.__new__(TMMapES)
+        old = {'domain': ['A'], 'file_name': None, 'dirty_score': 1, 'update_date': '1', 'insert_date': '1',
+               'source_hash': 'h', 'source_pos': None}
+        new = {'domain': ['B', 'A', 'B'], 'file_name': ['f'], 'dirty_score': 0, 'update_date': '2', 'insert_date': '2',
+               'source_hash': None, 'source_pos': 'NN'}
+        assert m._merge_docs(old, new) == {'domain': ['A', 'B'], 'file_name': ['f'], 'dirty_score': 0,
+                                           'update_date': '2', 'insert_date': '1', 'source_hash': 'h',
+                                           'source_pos': 'NN'}
+        assert old['domain'] == ['A']
+
+    def test_upsert_script_is_not_repeated(self):
+        script = TMMapES.__new__(TMMapES)._upsert_script()['script']['source']
+        assert script.count('ctx._source.domain != null') == 1
+        assert script.count('ctx._source.update_date') == 1
+
+    def test_mono_add_segments(self, es, monkeypatch):
+        ml_index = TMMonoLing.__new__(TMMonoLing)
+        ml_index.ingest = TMScriptFreeIngest(es, ml_index._merge_docs, ml_index._doc_upsert, cache_size=10)
+        monkeypatch.setattr(TMMonoLing, 'index_exists', lambda self, index: True)
+        segments = [TMTranslationUnit({'source_text': 'Hello', 'target_text': t, 'source_language': 'en-GB',
+                                       'target_language': l, 'source_pos': 'UH'}) for t, l in [('Hola', 'es'), ('Salut', 'fr')]]
+        for s in segments: s._allocate_id('source')
+        docs = [{'upsert': {'text': 'Hello', 'target_language': [l], 'pos': 'UH', 'token_cnt': 1}} for l in ['es', 'fr']]
+        assert ml_index.add_segments(segments, 'source', docs) == (1, [])
+        assert es.requests == [[('create', str(segments[0].source_id))]]
+        assert list(es.docs.values())[0]['target_language'] == ['es', 'fr']
@@ -106,3 +106,28 @@ def test_tmtree_tagger_pos_tags_en(tmp_path, monkeypatch):
             assert token
             assert tag
 
+
+
+@pytest.mark.integration
+def test_tmtree_tagger_batch_same_as_per_segment(tmp_path, monkeypatch):
+    from TMPosTagger import TMTreeTagger as tmtreetagger_module
+    from TMPosTagger.TMTreeTagger import TMTreeTagger
+
+    treetagger_home = _prepare_treetagger_home(tmp_path)
+    monkeypatch.setattr(
+        tmtreetagger_module, "treetagger_posTagger_home", str(treetagger_home)
+    )
+
+    data_path = os.path.join(script_path, "..", "data", "test_sentences.txt")
+    with open(data_path) as f:
+        sentences = [l.strip() for l in f if l.strip()][:300]
+    # Short sentences without final punctuation are the most context sensitive
+    sentences += ["National circumstances 56", "Water tanks", "Set the time", "",
+                  "Close <T1> it </T1> now", "<T2/>"]
+    tagger = TMTreeTagger("EN")
+    monkeypatch.setattr(TMTreeTagger, "BATCH_SIZE", 100)
+
+    assert tagger.only_tag_segments(sentences) == tagger.only_tag_segments(sentences, batch=False)
+    # Sentinel in the text falls back to tagging sentence by sentence
+    sentences = ["Hello " + TMTreeTagger.START_SENTINEL + " world", "Bye"]
+    assert tagger.only_tag_segments(sentences) == tagger.only_tag_segments(sentences, batch=False)
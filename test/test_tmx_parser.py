@@ -443,3 +443,26 @@ class TestTMXParser:
         # And also in metadata
         assert segment.metadata is not None
 
+
+    def test_parse_positions(self):
+        """Each segment has position of its tu, parsing can start from a position."""
+        tmx_path = os.path.join(script_path, "..", "data", "un_short.tmx")
+        segments = list(TMXParser(tmx_path).parse())
+        positions = [s.tmx_position for s in segments]
+        assert positions == sorted(positions)
+        assert all(f == tmx_path for f, tu in positions)
+        start = positions[len(positions) // 2]
+        resumed = list(TMXParser(tmx_path, start=start).parse())
+        assert [s.source_id for s in resumed] == [s.source_id for s in segments if s.tmx_position >= start]
+
+    def test_parse_zip_from_position(self, tmp_path):
+        """Files of zip parsed before the start one are skipped."""
+        zip_path = tmp_path / "test.zip"
+        with zipfile.ZipFile(zip_path, 'w') as zf:
+            for name in ["file1.tmx", "file2.tmx", "file3.tmx"]:
+                zf.writestr(name, create_tmx_multiple_langs().encode('utf-8'))
+        segments = list(TMXParser(str(zip_path), lang_pairs=[('en', 'es'), ('en', 'fr')]).parse())
+        assert [s.tmx_position for s in segments] == [(f, 0) for f in ["file1.tmx", "file2.tmx", "file3.tmx"] for lp in range(2)]
+        resumed = list(TMXParser(str(zip_path), lang_pairs=[('en', 'es'), ('en', 'fr')], start=("file2.tmx", 0)).parse())
+        assert [s.tmx_position for s in resumed] == [s.tmx_position for s in segments[2:]]
+        assert [s.file_name for s in resumed] == ["file2.tmx"] * 2 + ["file3.tmx"] * 2
@@ -455,3 +455,45 @@ class TestXmlUtils:
             # If it raises, that's also acceptable behavior
             pass
 
+
+
+def read_tmx_texts():
+    tree = etree.parse(os.path.join(script_path, "..", "data", "test_tags.tmx"))
+    return [''.join(seg.itertext()) for seg in tree.iter('seg')]
+
+
+@pytest.mark.unit
+class TestXmlUtilsFastPaths:
+    """Precompiled patterns, short-circuits of texts without tags and single scan of tags."""
+
+    @pytest.mark.parametrize("text,expected", [
+        ("a > b", ("a T> b", "a  b")),
+        ("<br/>x", ("<T/>x", "x")),
+        ("</>", ("</T/>", "")),
+        ("<<b>x", ("<<T>x", "x")),
+        ("a/> b", ("a/T/> b", "a/ b")),
+        ("x <unfinished", ("x <", "x ")),
+        ("<>", ("<T>", "")),
+        ("Hello <b>world</b> </T1>", ("Hello <T>world</T> </T>", "Hello world ")),
+        ("No tags", ("No tags", "No tags")),
+    ])
+    def test_fix_tags_edge_cases(self, text, expected):
+        assert XmlUtils.fix_tags(text) == expected
+
+    def test_no_tags_short_circuit(self):
+        assert XmlUtils.strip_tags("no  tags   here") == "no tags here"
+        assert XmlUtils.reduce_tags("no  tags \t here") == "no tags here"
+        assert XmlUtils.extract_tags("no tags") == []
+        assert XmlUtils.replace_tags("no tags") == "no tags"
+        # Spaces adjacent to existing placeholders are still replaced
+        assert XmlUtils.replace_tags("a ELASTICTMTAG  b", adjacent_space_placeholder="SP") == "a ELASTICTMTAG SP b"
+        assert XmlUtils.simplify_tags("a > b") == "a > b"
+
+    def test_scan_tags(self):
+        texts = read_tmx_texts()
+        assert any('<' in text for text in texts)
+        for text in texts + ["<T1>A</T1>) with  detergent.", "Hello <b>world</b><br/> and <T2/>", "no  tags", "", "<"]:
+            assert XmlUtils.scan_tags(text) == (XmlUtils.strip_tags(text), XmlUtils.reduce_tags(text),
+                                                XmlUtils.extract_tags(text))
+        assert XmlUtils.scan_tags("I have <T1>a <b>dog</b></T1>") == \
+            ("I have a dog ", "I have T a <b>dog</b> T ", ["<T1>", "<b>", "</b>", "</T1>"])
@@ -0,0 +1,15 @@
+require "pragmatic_segmenter"
+
+# Long-lived segmenter: reads one text per line from STDIN and writes its
+# sentences one per line, followed by an empty line
+lang = ARGV[0]
+$stdout.sync = true
+
+STDIN.each_line do |text|
+  ps = PragmaticSegmenter::Segmenter.new(text: text.chomp, language: lang)
+  ps.segment.each do |sent|
+    sent = sent.gsub(/[\r\n]+/, ' ').strip
+    puts sent unless sent.empty?
+  end
+  puts
+end